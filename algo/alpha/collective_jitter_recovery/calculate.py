@@ -1,5 +1,7 @@
-import pandas as pd
-from algo.alpha.jitter_recovery.calculate import Status as BasicStatus
+import pandas as pd, numpy as np
+from numba import njit
+import algo.feature.util.jitter_common
+import algo.alpha.util.state_machine
 from algo.feature.collective_jitter.calculate import CollectiveJitterFeatureParam
 
 
@@ -19,6 +21,9 @@ default_collective_small_jump_threshold = +0.03
 default_collective_small_jump_lower_threshold = +0.15
 default_small_jump_threshold, default_drop_from_small_jump_threshold, default_exit_small_jump_threshold = +0.03, -0.005, +0.01
 
+consumed_feature_columns = ['value', 'ch_max', 'ch_min', 'ch_since_max', 'ch_since_min', 'distance_max_ch', 'distance_min_ch',
+    'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to', 'ch_window30_min_collective']
+
 
 class CollectiveDropRecoveryTradingParam:
     def __init__(self, collective_drop_threshold, collective_drop_lower_threshold, drop_threshold, jump_from_drop_threshold, exit_drop_threshold):
@@ -124,13 +129,20 @@ def _get_ch(v1: float, v2: float) -> float:
     return (v2 - v1) / v1
 
 
-class Status(BasicStatus):
+class Status:
     def __init__(self):
         self.reset()
 
     def reset(self):
-        super().reset()
+        self.in_position = 0
+        self.value_at_enter = 0
+        self.lowest_since_enter = 0
         self.highest_since_enter = 0
+        self.timedelta_since_position_enter = 0
+        self.v_ch_max_is_to_when_enter, self.v_ch_min_is_to_when_enter = 0, 0
+        self.v_ch_max_is_from_when_enter, self.v_ch_min_is_from_when_enter = 0, 0
+        self.ch_from_enter = 0
+        self.ch_from_lowest_since_enter = 0
         self.ch_from_highest_since_enter = 0
 
     def update(self, features, trading_param: CollectiveRecoveryTradingParam) -> None:
@@ -227,3 +239,131 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+# the columns of status_as_dict, the output columns of state_machine, being the whole status.
+status_columns = [
+    'in_position', 'value_at_enter', 'lowest_since_enter', 'highest_since_enter', 'ch_from_lowest_since_enter',
+    'ch_from_highest_since_enter', 'timedelta_since_position_enter', 'v_ch_max_is_to_when_enter', 'v_ch_min_is_to_when_enter',
+    'v_ch_max_is_from_when_enter', 'v_ch_min_is_from_when_enter', 'ch_from_enter',
+]
+_IN_POSITION, _VALUE_AT_ENTER, _LOWEST_SINCE_ENTER, _HIGHEST_SINCE_ENTER, _CH_FROM_LOWEST_SINCE_ENTER, \
+    _CH_FROM_HIGHEST_SINCE_ENTER, _TIMEDELTA_SINCE_POSITION_ENTER, _V_CH_MAX_IS_TO_WHEN_ENTER, _V_CH_MIN_IS_TO_WHEN_ENTER, \
+    _V_CH_MAX_IS_FROM_WHEN_ENTER, _V_CH_MIN_IS_FROM_WHEN_ENTER, _CH_FROM_ENTER = range(len(status_columns))
+# rows of the features of the transition, in the order of consumed_feature_columns.
+_VALUE, _CH_MAX, _CH_MIN, _CH_SINCE_MAX, _CH_SINCE_MIN, _DISTANCE_MAX_CH, _DISTANCE_MIN_CH, \
+    _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO, _CH_WINDOW30_MIN_COLLECTIVE = range(len(consumed_feature_columns))
+# the params of the drop recovery followed by those of the jump recovery, each led by whether the sub param is given.
+_HAS_DROP, _COLLECTIVE_DROP_THRESHOLD, _COLLECTIVE_DROP_LOWER_THRESHOLD, _DROP_THRESHOLD, _JUMP_FROM_DROP_THRESHOLD, _EXIT_DROP_THRESHOLD, \
+    _HAS_JUMP, _COLLECTIVE_JUMP_THRESHOLD, _COLLECTIVE_JUMP_LOWER_THRESHOLD, _JUMP_THRESHOLD, _DROP_FROM_JUMP_THRESHOLD, _EXIT_JUMP_THRESHOLD = range(12)
+
+
+@njit
+def transition(status, int_status, features, timestamps, i, params):
+    '''
+    Status.update of the row i, where status is of status_columns and params are of get_params.
+    '''
+    value = features[_VALUE, i]
+    if status[_IN_POSITION] != 0:
+        if value < status[_LOWEST_SINCE_ENTER]:
+            status[_LOWEST_SINCE_ENTER] = value
+        if value > status[_HIGHEST_SINCE_ENTER]:
+            status[_HIGHEST_SINCE_ENTER] = value
+
+        status[_TIMEDELTA_SINCE_POSITION_ENTER] += 1
+        status[_CH_FROM_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_VALUE_AT_ENTER], value)
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_LOWEST_SINCE_ENTER], value)
+        status[_CH_FROM_HIGHEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_HIGHEST_SINCE_ENTER], value)
+
+        if status[_IN_POSITION] == 1:
+            if status[_CH_FROM_HIGHEST_SINCE_ENTER] < params[_EXIT_DROP_THRESHOLD] and status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+                status[_IN_POSITION] = 0
+            if status[_CH_FROM_ENTER] < params[_EXIT_DROP_THRESHOLD]:
+                status[_IN_POSITION] = 0
+            if value > status[_V_CH_MIN_IS_FROM_WHEN_ENTER] - (status[_V_CH_MIN_IS_FROM_WHEN_ENTER] - status[_V_CH_MIN_IS_TO_WHEN_ENTER]) / 3.0:
+                status[_IN_POSITION] = 0
+        elif status[_IN_POSITION] == -1:
+            if status[_CH_FROM_LOWEST_SINCE_ENTER] > params[_EXIT_JUMP_THRESHOLD] and status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+                status[_IN_POSITION] = 0
+            if status[_CH_FROM_ENTER] > params[_EXIT_JUMP_THRESHOLD]:
+                status[_IN_POSITION] = 0
+            if value < status[_V_CH_MAX_IS_FROM_WHEN_ENTER] + (status[_V_CH_MAX_IS_TO_WHEN_ENTER] - status[_V_CH_MAX_IS_FROM_WHEN_ENTER]) / 3.0:
+                status[_IN_POSITION] = 0
+        return
+
+    collective = features[_CH_WINDOW30_MIN_COLLECTIVE, i]
+    should_enter_long_position = params[_HAS_DROP] != 0 \
+        and collective < params[_COLLECTIVE_DROP_THRESHOLD] \
+        and collective > params[_COLLECTIVE_DROP_LOWER_THRESHOLD] \
+        and features[_CH_MIN, i] < params[_DROP_THRESHOLD] \
+        and features[_CH_SINCE_MIN, i] > params[_JUMP_FROM_DROP_THRESHOLD] \
+        and features[_DISTANCE_MIN_CH, i] < 20 \
+        and features[_DISTANCE_MIN_CH, i] > 2
+    should_enter_short_position = params[_HAS_JUMP] != 0 \
+        and collective > params[_COLLECTIVE_JUMP_THRESHOLD] \
+        and collective < params[_COLLECTIVE_JUMP_LOWER_THRESHOLD] \
+        and features[_CH_MAX, i] > params[_JUMP_THRESHOLD] \
+        and features[_CH_SINCE_MAX, i] < params[_DROP_FROM_JUMP_THRESHOLD] \
+        and features[_DISTANCE_MAX_CH, i] < 20 \
+        and features[_DISTANCE_MAX_CH, i] > 2
+
+    if should_enter_long_position or should_enter_short_position:
+        status[_IN_POSITION] = 1 if should_enter_long_position else -1
+        status[_VALUE_AT_ENTER] = value
+        status[_LOWEST_SINCE_ENTER] = value
+        status[_HIGHEST_SINCE_ENTER] = value
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = 0
+        status[_CH_FROM_HIGHEST_SINCE_ENTER] = 0
+        status[_TIMEDELTA_SINCE_POSITION_ENTER] = 0
+        status[_V_CH_MAX_IS_TO_WHEN_ENTER] = features[_V_CH_MAX_IS_TO, i]
+        status[_V_CH_MIN_IS_TO_WHEN_ENTER] = features[_V_CH_MIN_IS_TO, i]
+        status[_V_CH_MAX_IS_FROM_WHEN_ENTER] = features[_V_CH_MAX_IS_FROM, i]
+        status[_V_CH_MIN_IS_FROM_WHEN_ENTER] = features[_V_CH_MIN_IS_FROM, i]
+        status[_CH_FROM_ENTER] = 0
+    else:
+        status[:] = 0
+
+
+def get_candidates(features, params):
+    '''
+    the rows where the transition could enter a position, i.e. the entry conditions of the transition over all the rows.
+    '''
+    collective = features[_CH_WINDOW30_MIN_COLLECTIVE]
+    candidates = np.zeros(features.shape[1], dtype=np.bool_)
+    if params[_HAS_DROP] != 0:
+        candidates |= (collective < params[_COLLECTIVE_DROP_THRESHOLD]) & (collective > params[_COLLECTIVE_DROP_LOWER_THRESHOLD]) \
+            & (features[_CH_MIN] < params[_DROP_THRESHOLD]) & (features[_CH_SINCE_MIN] > params[_JUMP_FROM_DROP_THRESHOLD]) \
+            & (features[_DISTANCE_MIN_CH] < 20) & (features[_DISTANCE_MIN_CH] > 2)
+    if params[_HAS_JUMP] != 0:
+        candidates |= (collective > params[_COLLECTIVE_JUMP_THRESHOLD]) & (collective < params[_COLLECTIVE_JUMP_LOWER_THRESHOLD]) \
+            & (features[_CH_MAX] > params[_JUMP_THRESHOLD]) & (features[_CH_SINCE_MAX] < params[_DROP_FROM_JUMP_THRESHOLD]) \
+            & (features[_DISTANCE_MAX_CH] < 20) & (features[_DISTANCE_MAX_CH] > 2)
+    return candidates
+
+
+def get_params(trading_param: CollectiveRecoveryTradingParam):
+    drop_param = trading_param.collective_drop_recovery_trading_param
+    jump_param = trading_param.collective_jump_recovery_trading_param
+    params = [np.nan] * 12
+    params[_HAS_DROP] = 0.0 if drop_param is None else 1.0
+    if drop_param is not None:
+        params[_COLLECTIVE_DROP_THRESHOLD:_EXIT_DROP_THRESHOLD + 1] = [
+            drop_param.collective_drop_threshold, drop_param.collective_drop_lower_threshold, drop_param.drop_threshold,
+            drop_param.jump_from_drop_threshold, drop_param.exit_drop_threshold]
+    params[_HAS_JUMP] = 0.0 if jump_param is None else 1.0
+    if jump_param is not None:
+        params[_COLLECTIVE_JUMP_THRESHOLD:_EXIT_JUMP_THRESHOLD + 1] = [
+            jump_param.collective_jump_threshold, jump_param.collective_jump_lower_threshold, jump_param.jump_threshold,
+            jump_param.drop_from_jump_threshold, jump_param.exit_jump_threshold]
+    return params
+
+
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=status_columns,
+    output_columns=status_columns,
+    transition=transition,
+    get_params=get_params,
+    dtypes={'in_position': 'int64', 'timedelta_since_position_enter': 'int64'},
+    get_candidates=get_candidates,
+)
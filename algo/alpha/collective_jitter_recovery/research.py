@@ -1,8 +1,8 @@
-import pandas as pd
-from collections import defaultdict
 import matplotlib.pyplot as plt
 import algo.feature.jitter.calculate
+import algo.feature.util.research
 import algo.alpha.collective_jitter_recovery.calculate
+import algo.alpha.util.sparse
 from algo.alpha.collective_jitter_recovery.calculate import CollectiveDropRecoveryTradingParam
 
 collective_feature_columns_no_rolling = ['ch', 'ch_max', 'ch_min', 'ch_since_max', 'ch_since_min']
@@ -10,40 +10,9 @@ collective_feature_columns = collective_feature_columns_no_rolling + ['ch_window
 
 _trading_label_prefix = '(collectivechanges_trading)'
 
-_primitives = (bool, str, int, float, type(None))
-
-def _is_primitive(obj):
-    return isinstance(obj, _primitives)
-
-def _param_as_label(param):
-    if _is_primitive(param):
-        return str(param)
-    # new directory is used to avoid the file name limit (256) violation.
-    return '/'.join([f'{k}({_param_as_label(v)})' for k, v in vars(param).items()])
-
-def _get_param_label_for_caching(param, label_prefix, label_suffix=None) -> str:
-    raw_label = _param_as_label(param)
-    label_tokens = raw_label.split('/')
-    label_dirs = []
-    label_dir = ''
-    for label_token in label_tokens:
-        label_dir += f'_{label_token}'
-        if len(label_dir) > 200:
-            label_dirs.append(label_dir[1:])
-            label_dir = ''
-
-    if len(label_dir) > 1:
-        label_dirs.append(label_dir[1:])
-
-    label = '/'.join(label_dirs)
-    ret = f"{label_prefix}_{label}"
-    if label_suffix is not None:
-        ret = f"{ret}_{label_suffix}"
-    return ret
-
 
 def get_trading_label_for_caching(trading_param: CollectiveDropRecoveryTradingParam, label_suffix=None) -> str:
-    r = _get_param_label_for_caching(trading_param, _trading_label_prefix, label_suffix=label_suffix)
+    r = algo.feature.util.research.get_param_label_for_caching(trading_param, _trading_label_prefix, label_suffix=label_suffix)
     return f'trading/{r}'
 
 
@@ -75,23 +44,17 @@ def get_dfst_trading(dfst_feature, trading_param):
     return dfst_trading
 
 
-def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.collective_jitter_recovery.calculate.Status()
-    trading_dict = defaultdict(list)
-
-    for i in df_feature.index:
-        features = df_feature.loc[i].to_dict()
-        status.update(features, trading_param)
+def get_dfst_trading_sparse(dfst_feature, trading_param):
+    '''
+    the trading columns of get_dfst_trading only at the rows that are not flat, without copying dfst_feature
+    (see algo.alpha.util.sparse for the trades and the dense expansion).
+    '''
+    return algo.alpha.util.sparse.get_dfst_trading_sparse(
+        dfst_feature, trading_param, add_trading_columns)
 
-        for k, v in {**features, **algo.alpha.collective_jitter_recovery.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
 
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * df_feature_trading.in_position.shift()
-    df_feature_trading['profit'] = df_feature_trading.value.pct_change() * df_feature_trading.in_position.shift()
-
-    return df_feature_trading
+def add_trading_columns(df_feature, trading_param):
+    return algo.alpha.collective_jitter_recovery.calculate.state_machine.add_trading_columns(df_feature, trading_param)
 
 
 def investigate_symbol(df, df_collective_feature, symbol_investigate, trading_param, figsize=None):
@@ -1,11 +1,15 @@
 import pandas as pd
+from numba import njit
 
 import algo.feature.jitter.calculate
 import algo.feature.util.jitter_common
+import algo.alpha.util.state_machine
 from algo.feature.jitter.calculate import JitterFeatureParam
 
 default_jump_threshold, default_exit_drop_threshold = 0.10, -0.03
 
+consumed_feature_columns = ['value', 'ch_max', 'ch_min', 'distance_max_ch', 'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to']
+
 
 class JitterFollowingTradingParam:
     def __init__(self, feature_param, jump_threshold, exit_drop_threshold):
@@ -112,3 +116,77 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+# the columns of status_as_dict, the output columns of state_machine.
+status_columns = list(status_as_dict(Status()).keys())
+_IN_POSITION, _VALUE_AT_ENTER, _LOWEST_SINCE_ENTER, _TIMEDELTA_SINCE_POSITION_ENTER, \
+    _V_CH_MAX_IS_TO_WHEN_ENTER, _V_CH_MIN_IS_TO_WHEN_ENTER, _V_CH_MAX_IS_FROM_WHEN_ENTER, _V_CH_MIN_IS_FROM_WHEN_ENTER, \
+    _CH_FROM_ENTER, _CH_FROM_LOWEST_SINCE_ENTER = range(len(status_columns))
+# not in status_as_dict but a part of the status.
+_HIGHEST_SINCE_ENTER = len(status_columns)
+state_columns = status_columns + ['highest_since_enter']
+# rows of the features of the transition, in the order of consumed_feature_columns.
+_VALUE, _CH_MAX, _CH_MIN, _DISTANCE_MAX_CH, _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO = range(len(consumed_feature_columns))
+_JUMP_THRESHOLD, _EXIT_DROP_THRESHOLD = range(2)
+
+
+@njit
+def transition(status, int_status, features, timestamps, i, params):
+    '''
+    Status.update of the row i, where status is of state_columns and params are of get_params.
+    '''
+    value = features[_VALUE, i]
+    jump_threshold, exit_drop_threshold = params[_JUMP_THRESHOLD], abs(params[_EXIT_DROP_THRESHOLD])
+    if status[_IN_POSITION] != 0:
+        if value < status[_LOWEST_SINCE_ENTER]:
+            status[_LOWEST_SINCE_ENTER] = value
+        if value > status[_HIGHEST_SINCE_ENTER]:
+            status[_HIGHEST_SINCE_ENTER] = value
+
+        status[_TIMEDELTA_SINCE_POSITION_ENTER] += 1
+        status[_CH_FROM_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_VALUE_AT_ENTER], value)
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_LOWEST_SINCE_ENTER], value)
+        ch_from_highest_since_enter = algo.feature.util.jitter_common.get_ch_scalar(status[_HIGHEST_SINCE_ENTER], value)
+
+        if status[_IN_POSITION] == -1:
+            if ch_from_highest_since_enter < -exit_drop_threshold or abs(status[_CH_FROM_ENTER]) > exit_drop_threshold:
+                status[_IN_POSITION] = 0
+        elif status[_IN_POSITION] == 1:
+            if status[_CH_FROM_LOWEST_SINCE_ENTER] > exit_drop_threshold or abs(status[_CH_FROM_ENTER]) > exit_drop_threshold:
+                status[_IN_POSITION] = 0
+        return
+
+    new_position = 0
+    if features[_CH_MAX, i] > jump_threshold and features[_DISTANCE_MAX_CH, i] < 1:
+        new_position = 1
+    elif features[_CH_MIN, i] < -jump_threshold and features[_DISTANCE_MAX_CH, i] < 1:
+        new_position = -1
+
+    if new_position != 0:
+        status[_IN_POSITION] = new_position
+        status[_VALUE_AT_ENTER] = value
+        status[_LOWEST_SINCE_ENTER] = value
+        status[_TIMEDELTA_SINCE_POSITION_ENTER] = 0
+        status[_V_CH_MAX_IS_TO_WHEN_ENTER] = features[_V_CH_MAX_IS_TO, i]
+        status[_V_CH_MIN_IS_TO_WHEN_ENTER] = features[_V_CH_MIN_IS_TO, i]
+        status[_V_CH_MAX_IS_FROM_WHEN_ENTER] = features[_V_CH_MAX_IS_FROM, i]
+        status[_V_CH_MIN_IS_FROM_WHEN_ENTER] = features[_V_CH_MIN_IS_FROM, i]
+        status[_CH_FROM_ENTER] = 0
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = 0
+    else:
+        status[:] = 0
+
+
+def get_params(trading_param: JitterFollowingTradingParam):
+    return [trading_param.jump_threshold, trading_param.exit_drop_threshold]
+
+
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=state_columns,
+    output_columns=status_columns,
+    transition=transition,
+    get_params=get_params,
+    dtypes={'in_position': 'int64', 'timedelta_since_position_enter': 'int64'},
+)
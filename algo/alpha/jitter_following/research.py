@@ -1,9 +1,8 @@
-import pandas as pd
-from collections import defaultdict
 import algo.feature.jitter.calculate
 import algo.alpha.jitter_following.calculate
 import algo.feature.util.research
 import algo.feature.jitter.research
+import algo.alpha.util.fused
 from algo.alpha.jitter_following.calculate import JitterFollowingTradingParam
 
 _trading_label_prefix = '(changes_following_trading)'
@@ -43,22 +42,14 @@ def get_dfst_trading(dfst_feature, trading_param: JitterFollowingTradingParam):
     return dfst_trading
 
 
-def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.jitter_following.calculate.Status()
-    trading_dict = defaultdict(list)
-
-    for i in df_feature.index:
-        features = df_feature.loc[i].to_dict()
-        all_features = features
-        status.update(all_features, trading_param)
-        for k, v in {**all_features, **algo.alpha.jitter_following.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
+def get_dfst_feature_trading(df, trading_param: JitterFollowingTradingParam, symbol_filter=None, value_column='close', n_workers=1):
+    '''
+    (the feature columns, dfst_trading) computing the features and the trading symbol by symbol from the market data df,
+    the same dfst_trading as get_dfst_trading of the dfst_feature (see algo.alpha.util.fused).
+    '''
+    return algo.alpha.util.fused.get_dfst_feature_trading(
+        df, trading_param, add_trading_columns, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
 
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * df_feature_trading.in_position.shift()
-    df_feature_trading['profit'] = df_feature_trading.value.pct_change() * df_feature_trading.in_position.shift()
-
-    del trading_dict
-    return df_feature_trading
 
+def add_trading_columns(df_feature, trading_param):
+    return algo.alpha.jitter_following.calculate.state_machine.add_trading_columns(df_feature, trading_param)
@@ -1,13 +1,21 @@
 import numpy as np
 import pandas as pd
+from numba import njit
 
 import algo.feature.jitter.calculate
 import algo.feature.util.jitter_common
+import algo.alpha.util.state_machine
 from algo.feature.jitter.calculate import JitterFeatureParam
 
 default_jump_threshold, default_drop_from_jump_threshold, default_exit_jumpt_threshold = 0.20, -0.04, 0.02
 default_jump_threshold_longterm, default_drop_from_jump_threshold_longterm, default_exit_jumpt_threshold_longterm = 0.40, -0.10, 0.05
 
+consumed_feature_columns = ['value', 'ch_max', 'ch_min', 'ch_since_max', 'ch_since_min', 'distance_max_ch', 'distance_min_ch',
+    'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to']
+# rows of the features of the transition, in the order of consumed_feature_columns.
+_VALUE, _CH_MAX, _CH_MIN, _CH_SINCE_MAX, _CH_SINCE_MIN, _DISTANCE_MAX_CH, _DISTANCE_MIN_CH, \
+    _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO = range(len(consumed_feature_columns))
+
 
 class JitterRecoveryTradingParam:
     def __init__(self, feature_param, jump_threshold, drop_from_jump_threshold, exit_jumpt_threshold, is_long_term):
@@ -31,122 +39,46 @@ class JitterRecoveryTradingParam:
         return ', '.join([f'{k}: {v}' for k, v in vars(self).items()])
 
 class Status:
-    def __init__(self, cols):
-        self.cols = cols
-        self.reset(self.cols)
+    '''
+    the status of cols symbols, of which state_columns are the arrays of cols, e.g. status.in_position.
+    update advances all of them by a minute in a single call of the compiled transition (see state_machine).
+    '''
+    def __init__(self, cols=1):
+        self.reset(cols)
 
     def reset(self, cols):
-        self.in_position = np.zeros(cols)
-        self.value_at_enter = np.zeros(cols)
-        self.lowest_since_enter = np.zeros(cols)
-        self.highest_since_enter = np.zeros(cols)
-        self.timedelta_since_position_enter = np.zeros(cols)
-        self.v_ch_max_is_to_when_enter, self.v_ch_min_is_to_when_enter = np.zeros(cols), np.zeros(cols)
-        self.v_ch_max_is_from_when_enter, self.v_ch_min_is_from_when_enter = np.zeros(cols), np.zeros(cols)
-        self.ch_from_enter = np.zeros(cols)
-        self.ch_from_lowest_since_enter = np.zeros(cols)
-        self.ch_from_highest_since_enter = np.zeros(cols)
-
-    def __str__(self):    
-        return ', '.join([f'{k}: {v}' for k, v in vars(self).items()])
-
-    def update(self, features, trading_param: JitterRecoveryTradingParam) -> None:
-        value = features['value']
-        is_in_position = self.in_position != 0
-        self.lowest_since_enter = np.where((is_in_position) & (value < self.lowest_since_enter), value, self.lowest_since_enter)
-        self.highest_since_enter = np.where((is_in_position) & (value > self.highest_since_enter), value, self.highest_since_enter)
-        self.timedelta_since_position_enter = np.where(is_in_position, self.timedelta_since_position_enter + 1, self.timedelta_since_position_enter)
-        self.ch_from_enter = np.where(is_in_position, algo.feature.util.jitter_common.get_ch(self.value_at_enter, value), self.ch_from_enter)
-        self.ch_from_lowest_since_enter = np.where(is_in_position, algo.feature.util.jitter_common.get_ch(self.lowest_since_enter, value), self.ch_from_lowest_since_enter)
-        self.ch_from_highest_since_enter = np.where(is_in_position, algo.feature.util.jitter_common.get_ch(self.highest_since_enter, value), self.ch_from_highest_since_enter)
-
-        is_pos_1_position = self.in_position == 1
-        self.in_position = np.where((is_pos_1_position) & ~trading_param.is_long_term & \
-                                    (self.ch_from_highest_since_enter < -abs(trading_param.exit_jumpt_threshold)), 0, self.in_position)
-        self.in_position = np.where((is_pos_1_position) & trading_param.is_long_term & \
-                                    (self.ch_from_highest_since_enter < -abs(trading_param.exit_jumpt_threshold)) & \
-                                    (self.timedelta_since_position_enter >= 5), 0, self.in_position)
-
-        is_neg_1_position = self.in_position == -1
-        self.in_position = np.where((is_neg_1_position) & ~trading_param.is_long_term & \
-                                    (self.ch_from_lowest_since_enter > abs(trading_param.exit_jumpt_threshold)), 0, self.in_position)
-        self.in_position = np.where((is_neg_1_position) & trading_param.is_long_term & \
-                                    (self.ch_from_lowest_since_enter > abs(trading_param.exit_jumpt_threshold)) & \
-                                    (self.timedelta_since_position_enter >= 5), 0, self.in_position)
-
-
-        if self.in_position != 0:
-            if value < self.lowest_since_enter:
-                self.lowest_since_enter = value
-            if value > self.highest_since_enter:
-                self.highest_since_enter = value
-
-            self.timedelta_since_position_enter += 1
-            self.ch_from_enter = algo.feature.util.jitter_common.get_ch(self.value_at_enter, value)
-            self.ch_from_lowest_since_enter = algo.feature.util.jitter_common.get_ch(self.lowest_since_enter, value)
-            self.ch_from_highest_since_enter = algo.feature.util.jitter_common.get_ch(self.highest_since_enter, value)
-
-            if self.in_position == 1:
-                if not trading_param.is_long_term:
-                    if self.ch_from_highest_since_enter > trading_param.exit_jumpt_threshold:
-                        self.in_position = 0
-                else:
-                    if self.ch_from_highest_since_enter < -abs(trading_param.exit_jumpt_threshold) \
-                        and self.timedelta_since_position_enter >= 5:
-                        self.in_position = 0
-
-                    #if value < (self.v_ch_max_is_to_when_enter - self.v_ch_max_is_from_when_enter) / 3.0 + self.v_ch_max_is_from_when_enter:
-                    #    self.in_position = 0
-
-            elif self.in_position == -1:
-                if not trading_param.is_long_term:
-                    if self.ch_from_lowest_since_enter < trading_param.exit_jumpt_threshold:
-                        self.in_position = 0
-                else:
-                    if self.ch_from_lowest_since_enter > abs(trading_param.exit_jumpt_threshold) \
-                        and self.timedelta_since_position_enter >= 5:
-                        self.in_position = 0
-
-        else:
-            new_position = 0
-
-            if trading_param.is_long_term:
-                if features['ch_max'] > trading_param.jump_threshold \
-                and features['ch_since_max'] < trading_param.drop_from_jump_threshold \
-                and features['distance_max_ch'] < 10 \
-                and features['distance_max_ch'] > 2:
-                    new_position = 1
-
-                #should_enter_position = should_enter_position and features['ch_max_collective'] > 0.05
-
-            else:
-                if features['ch_max'] > abs(trading_param.jump_threshold) \
-                and features['ch_since_max'] < -abs(trading_param.drop_from_jump_threshold) \
-                and features['distance_max_ch'] < 60 \
-                and features['distance_max_ch'] > 2:
-                    new_position = -1
-
-                if features['ch_min'] < -abs(trading_param.jump_threshold) \
-                and features['ch_since_min'] > abs(trading_param.drop_from_jump_threshold) \
-                and features['distance_min_ch'] < 60 \
-                and features['distance_min_ch'] > 2:
-                    new_position = 1
-
-            if new_position != 0:
-                self.in_position = new_position
-                self.value_at_enter = value
-                self.lowest_since_enter = value
-                self.highest_since_enter = value
-                self.timedelta_since_position_enter = 0
-                self.v_ch_max_is_to_when_enter = features['v_ch_max_is_to']
-                self.v_ch_min_is_to_when_enter = features['v_ch_min_is_to']
-                self.v_ch_max_is_from_when_enter = features['v_ch_max_is_from']
-                self.v_ch_min_is_from_when_enter = features['v_ch_min_is_from']
-                self.ch_from_enter = 0
-                self.ch_from_lowest_since_enter = 0
-            else:
-                self.reset(self.cols)
+        self.cols = cols
+        self.states = np.zeros((cols, len(state_columns)))
+
+    def add_cols(self, cols) -> int:
+        '''
+        appends cols reset cols, returning the index of the first of them.
+        '''
+        head = self.cols
+        self.states = np.concatenate([self.states, np.zeros((cols, len(state_columns)))])
+        self.cols += cols
+        return head
+
+    def __getattr__(self, name):
+        if name in state_columns:
+            return self.states[:, state_columns.index(name)]
+        raise AttributeError(name)
 
+    def __str__(self):
+        return ', '.join([f'{k}: {getattr(self, k)}' for k in state_columns])
+
+    def update(self, features, trading_param: JitterRecoveryTradingParam, cols=None) -> None:
+        '''
+        features maps consumed_feature_columns to the arrays of the cols (or the scalars for a single col).
+        cols, if given, are the indices of the cols to update, of which features are.
+        '''
+        states = self.states if cols is None else self.states[cols]
+        feature_matrix = np.empty((len(consumed_feature_columns), states.shape[0]))
+        for k, column in enumerate(consumed_feature_columns):
+            feature_matrix[k] = features[column]
+        state_machine.step(states, feature_matrix, trading_param)
+        if cols is not None:
+            self.states[cols] = states
 
 
 def status_as_dict(status):
@@ -167,3 +99,136 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+# the columns of status_as_dict, the output columns of state_machine.
+status_columns = [
+    'in_position', 'value_at_enter', 'lowest_since_enter', 'highest_since_enter', 'timedelta_since_position_enter',
+    'v_ch_max_is_to_when_enter', 'v_ch_min_is_to_when_enter', 'v_ch_max_is_from_when_enter', 'v_ch_min_is_from_when_enter',
+    'ch_from_enter', 'ch_from_lowest_since_enter',
+]
+_IN_POSITION, _VALUE_AT_ENTER, _LOWEST_SINCE_ENTER, _HIGHEST_SINCE_ENTER, _TIMEDELTA_SINCE_POSITION_ENTER, \
+    _V_CH_MAX_IS_TO_WHEN_ENTER, _V_CH_MIN_IS_TO_WHEN_ENTER, _V_CH_MAX_IS_FROM_WHEN_ENTER, _V_CH_MIN_IS_FROM_WHEN_ENTER, \
+    _CH_FROM_ENTER, _CH_FROM_LOWEST_SINCE_ENTER = range(len(status_columns))
+# not in status_as_dict but a part of the status.
+_CH_FROM_HIGHEST_SINCE_ENTER = len(status_columns)
+state_columns = status_columns + ['ch_from_highest_since_enter']
+_JUMP_THRESHOLD, _DROP_FROM_JUMP_THRESHOLD, _EXIT_JUMPT_THRESHOLD, _IS_LONG_TERM = range(4)
+
+
+@njit
+def _update_since_enter(status, value):
+    if value < status[_LOWEST_SINCE_ENTER]:
+        status[_LOWEST_SINCE_ENTER] = value
+    if value > status[_HIGHEST_SINCE_ENTER]:
+        status[_HIGHEST_SINCE_ENTER] = value
+    status[_TIMEDELTA_SINCE_POSITION_ENTER] += 1
+    status[_CH_FROM_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_VALUE_AT_ENTER], value)
+    status[_CH_FROM_LOWEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_LOWEST_SINCE_ENTER], value)
+    status[_CH_FROM_HIGHEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_HIGHEST_SINCE_ENTER], value)
+
+
+@njit
+def transition(status, int_status, features, timestamps, i, params):
+    '''
+    the update of the status of a single column, where status is of state_columns, features[:, i] are the consumed_feature_columns
+    and params are of get_params.
+    the exit is checked both before and in the per-position branch, each updating the since-enter fields first,
+    thus a bar in position is counted twice in timedelta_since_position_enter, the same as the former numpy Status.update.
+    '''
+    value = features[_VALUE, i]
+    jump_threshold, drop_from_jump_threshold = params[_JUMP_THRESHOLD], params[_DROP_FROM_JUMP_THRESHOLD]
+    exit_jumpt_threshold, is_long_term = params[_EXIT_JUMPT_THRESHOLD], params[_IS_LONG_TERM] != 0
+    exit_threshold = abs(exit_jumpt_threshold)
+
+    # the exit of the former vectorized part.
+    if status[_IN_POSITION] != 0:
+        _update_since_enter(status, value)
+    if status[_IN_POSITION] == 1 and status[_CH_FROM_HIGHEST_SINCE_ENTER] < -exit_threshold:
+        if not is_long_term or status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+            status[_IN_POSITION] = 0
+    if status[_IN_POSITION] == -1 and status[_CH_FROM_LOWEST_SINCE_ENTER] > exit_threshold:
+        if not is_long_term or status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+            status[_IN_POSITION] = 0
+
+    # the former scalar part.
+    if status[_IN_POSITION] != 0:
+        _update_since_enter(status, value)
+        if status[_IN_POSITION] == 1:
+            if not is_long_term:
+                if status[_CH_FROM_HIGHEST_SINCE_ENTER] > exit_jumpt_threshold:
+                    status[_IN_POSITION] = 0
+            else:
+                if status[_CH_FROM_HIGHEST_SINCE_ENTER] < -exit_threshold and status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+                    status[_IN_POSITION] = 0
+        elif status[_IN_POSITION] == -1:
+            if not is_long_term:
+                if status[_CH_FROM_LOWEST_SINCE_ENTER] < exit_jumpt_threshold:
+                    status[_IN_POSITION] = 0
+            else:
+                if status[_CH_FROM_LOWEST_SINCE_ENTER] > exit_threshold and status[_TIMEDELTA_SINCE_POSITION_ENTER] >= 5:
+                    status[_IN_POSITION] = 0
+        return
+
+    new_position = 0
+    if is_long_term:
+        if features[_CH_MAX, i] > jump_threshold \
+                and features[_CH_SINCE_MAX, i] < drop_from_jump_threshold \
+                and features[_DISTANCE_MAX_CH, i] < 10 \
+                and features[_DISTANCE_MAX_CH, i] > 2:
+            new_position = 1
+    else:
+        if features[_CH_MAX, i] > abs(jump_threshold) \
+                and features[_CH_SINCE_MAX, i] < -abs(drop_from_jump_threshold) \
+                and features[_DISTANCE_MAX_CH, i] < 60 \
+                and features[_DISTANCE_MAX_CH, i] > 2:
+            new_position = -1
+        if features[_CH_MIN, i] < -abs(jump_threshold) \
+                and features[_CH_SINCE_MIN, i] > abs(drop_from_jump_threshold) \
+                and features[_DISTANCE_MIN_CH, i] < 60 \
+                and features[_DISTANCE_MIN_CH, i] > 2:
+            new_position = 1
+
+    if new_position != 0:
+        status[_IN_POSITION] = new_position
+        status[_VALUE_AT_ENTER] = value
+        status[_LOWEST_SINCE_ENTER] = value
+        status[_HIGHEST_SINCE_ENTER] = value
+        status[_TIMEDELTA_SINCE_POSITION_ENTER] = 0
+        status[_V_CH_MAX_IS_TO_WHEN_ENTER] = features[_V_CH_MAX_IS_TO, i]
+        status[_V_CH_MIN_IS_TO_WHEN_ENTER] = features[_V_CH_MIN_IS_TO, i]
+        status[_V_CH_MAX_IS_FROM_WHEN_ENTER] = features[_V_CH_MAX_IS_FROM, i]
+        status[_V_CH_MIN_IS_FROM_WHEN_ENTER] = features[_V_CH_MIN_IS_FROM, i]
+        status[_CH_FROM_ENTER] = 0
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = 0
+    else:
+        status[:] = 0
+
+
+def get_candidates(features, params):
+    '''
+    the rows where the transition could enter a position, i.e. the entry conditions of the transition over all the rows.
+    '''
+    jump_threshold, drop_from_jump_threshold = params[_JUMP_THRESHOLD], params[_DROP_FROM_JUMP_THRESHOLD]
+    if params[_IS_LONG_TERM] != 0:
+        return (features[_CH_MAX] > jump_threshold) & (features[_CH_SINCE_MAX] < drop_from_jump_threshold) \
+            & (features[_DISTANCE_MAX_CH] < 10) & (features[_DISTANCE_MAX_CH] > 2)
+    return ((features[_CH_MAX] > abs(jump_threshold)) & (features[_CH_SINCE_MAX] < -abs(drop_from_jump_threshold))
+            & (features[_DISTANCE_MAX_CH] < 60) & (features[_DISTANCE_MAX_CH] > 2)) \
+        | ((features[_CH_MIN] < -abs(jump_threshold)) & (features[_CH_SINCE_MIN] > abs(drop_from_jump_threshold))
+           & (features[_DISTANCE_MIN_CH] < 60) & (features[_DISTANCE_MIN_CH] > 2))
+
+
+def get_params(trading_param: JitterRecoveryTradingParam):
+    return [trading_param.jump_threshold, trading_param.drop_from_jump_threshold, trading_param.exit_jumpt_threshold,
+            1.0 if trading_param.is_long_term else 0.0]
+
+
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=state_columns,
+    output_columns=status_columns,
+    transition=transition,
+    get_params=get_params,
+    get_candidates=get_candidates,
+)
@@ -1,9 +1,10 @@
-import pandas as pd
-from collections import defaultdict
 import algo.feature.jitter.calculate
 import algo.alpha.jitter_recovery.calculate
 import algo.feature.util.research
 import algo.feature.jitter.research
+import algo.alpha.util.fused
+import algo.alpha.util.sparse
+import algo.alpha.util.sweep
 from algo.alpha.jitter_recovery.calculate import JitterRecoveryTradingParam
 
 
@@ -44,21 +45,34 @@ def get_dfst_trading(dfst_feature, trading_param: JitterRecoveryTradingParam):
     return dfst_trading
 
 
+def get_dfst_feature_trading(df, trading_param: JitterRecoveryTradingParam, symbol_filter=None, value_column='close', n_workers=1):
+    '''
+    (the feature columns, dfst_trading) computing the features and the trading symbol by symbol from the market data df,
+    the same dfst_trading as get_dfst_trading of the dfst_feature (see algo.alpha.util.fused).
+    '''
+    return algo.alpha.util.fused.get_dfst_feature_trading(
+        df, trading_param, add_trading_columns, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
+
+
+def get_df_sweep(dfst_feature, trading_params):
+    '''
+    the (param, symbol) summary of pnl, trades and exposure of each of trading_params, sharing the feature param of dfst_feature,
+    e.g. of algo.alpha.util.sweep.get_trading_params_grid (see algo.alpha.util.sweep.get_df_sweep).
+    '''
+    return algo.alpha.util.sweep.get_df_sweep(
+        dfst_feature, trading_params, algo.alpha.jitter_recovery.calculate.state_machine,
+        profit_sign=-1, is_traded_func=algo.alpha.util.fused.has_jump)
+
+
+def get_dfst_trading_sparse(dfst_feature, trading_param):
+    '''
+    the trading columns of get_dfst_trading only at the rows that are not flat, without copying dfst_feature
+    (see algo.alpha.util.sparse for the trades and the dense expansion).
+    '''
+    return algo.alpha.util.sparse.get_dfst_trading_sparse(
+        dfst_feature, trading_param, add_trading_columns,
+        is_traded_func=algo.alpha.util.fused.has_jump)
+
+
 def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.jitter_recovery.calculate.Status()
-    trading_dict = defaultdict(list)
-
-    for i in df_feature.index:
-        features = df_feature.loc[i].to_dict()
-        all_features = features
-        status.update(all_features, trading_param)
-        for k, v in {**all_features, **algo.alpha.jitter_recovery.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
-
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = -df_feature_trading.value.diff() * df_feature_trading.in_position.shift()
-    df_feature_trading['profit'] = -df_feature_trading.value.pct_change() * df_feature_trading.in_position.shift()
-
-    del trading_dict
-    return df_feature_trading
+    return algo.alpha.jitter_recovery.calculate.state_machine.add_trading_columns(df_feature, trading_param, profit_sign=-1)
@@ -5,7 +5,6 @@ import logging
 import algo.feature.jitter.calculate
 import algo.alpha.jitter_recovery.calculate
 import trading.execution
-from collections import defaultdict
 
 
 def epoch_seconds_to_datetime(timestamp_seconds):
@@ -22,18 +21,46 @@ class TradeManager:
 
         self.trading_param = trading_param if trading_param is not None else default_trading_param
         self.trade_execution = trade_execution if trade_execution else trading.execution.TradeExecution()
-        self.status_per_symbol = defaultdict(algo.alpha.jitter_recovery.calculate.Status)
+        # the status of all the symbols, a col per symbol.
+        self.status = algo.alpha.jitter_recovery.calculate.Status(0)
+        self.col_per_symbol = {}
+
+    def _get_col(self, symbol):
+        if symbol not in self.col_per_symbol:
+            self.col_per_symbol[symbol] = self.status.add_cols(1)
+        return self.col_per_symbol[symbol]
 
     def on_new_minutes(self, symbol, timestamp_epoch_seconds, timestamp_epochs_values):
         '''
         timestamp_epochs_values is an arrya of (timestamp, value) tuples.
         '''
+        self.on_new_minutes_batch(timestamp_epoch_seconds, {symbol: timestamp_epochs_values})
+
+    def on_new_minutes_batch(self, timestamp_epoch_seconds, timestamp_epochs_values_per_symbol):
+        '''
+        timestamp_epochs_values_per_symbol maps a symbol to its array of (timestamp, value) tuples.
+        the status of all the symbols is updated at once.
+        '''
         w = self.trading_param.feature_param.window
-        changes = algo.feature.jitter.calculate.get_changes_1dim(np.array([tv[1] for tv in list(timestamp_epochs_values)[-w:]]))
-        in_position_before = self.status_per_symbol[symbol].in_position
-        self.status_per_symbol[symbol].update(changes, self.trading_param)
-        if self.status_per_symbol[symbol].in_position != in_position_before:
-            direction = 1 if self.status_per_symbol[symbol].in_position == 1 else -1
-            logging.info(f'in_position changes at {epoch_seconds_to_datetime(timestamp_epoch_seconds)} for {symbol} from {in_position_before} to {self.status_per_symbol[symbol].in_position} with changes: {changes}')
-            self.trade_execution.execute(symbol, timestamp_epoch_seconds, changes['value'], -1, direction)
+        symbols, changes_list = [], []
+        for symbol, timestamp_epochs_values in timestamp_epochs_values_per_symbol.items():
+            changes = algo.feature.jitter.calculate.get_changes_1dim(np.array([tv[1] for tv in list(timestamp_epochs_values)[-w:]]))
+            if changes is None:
+                continue
+            symbols.append(symbol)
+            changes_list.append(changes)
+        if len(symbols) == 0:
+            return
+
+        cols = np.array([self._get_col(symbol) for symbol in symbols])
+        features = {column: np.array([changes[column] for changes in changes_list])
+                    for column in algo.alpha.jitter_recovery.calculate.consumed_feature_columns}
+        in_position_before = self.status.in_position[cols]
+        self.status.update(features, self.trading_param, cols=cols)
+        in_position = self.status.in_position[cols]
 
+        for k in np.flatnonzero(in_position != in_position_before):
+            symbol, changes = symbols[k], changes_list[k]
+            direction = 1 if in_position[k] == 1 else -1
+            logging.info(f'in_position changes at {epoch_seconds_to_datetime(timestamp_epoch_seconds)} for {symbol} from {in_position_before[k]} to {in_position[k]} with changes: {changes}')
+            self.trade_execution.execute(symbol, timestamp_epoch_seconds, changes['value'], -1, direction)
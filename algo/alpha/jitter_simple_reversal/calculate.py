@@ -1,10 +1,15 @@
 import pandas as pd
+from numba import njit
 
 import algo.feature.simple_jitter.calculate
+import algo.feature.util.jitter_common
+import algo.alpha.util.state_machine
 from algo.feature.simple_jitter.calculate import SimpleJitterFeatureParam
 
 default_jump_threshold, default_drop_from_jump_threshold = 0.18, -0.02
 
+consumed_feature_columns = ['value', 'ch_max', 'ch_min', 'expected_v', 'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to']
+
 
 class JitterSimpleReversalTradingParam:
     def __init__(self, feature_param, jump_threshold, drop_from_jump_threshold):
@@ -172,3 +177,129 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+# the columns of status_as_dict, the output columns of state_machine.
+status_columns = list(status_as_dict(Status()).keys())
+_IN_POSITION, _VALUE_AT_ENTER, _LOWEST_SINCE_ENTER, _HIGHEST_SINCE_ENTER, _CH_MAX_THRESHOLD_CROSSED, _CH_MIN_THRESHOLD_CROSSED, \
+    _LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED, _HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED, _TIMEDELTA_SECONDS_SINCE_POSITION_ENTER, \
+    _V_CH_MAX_IS_TO_WHEN_ENTER, _V_CH_MIN_IS_TO_WHEN_ENTER, _V_CH_MAX_IS_FROM_WHEN_ENTER, _V_CH_MIN_IS_FROM_WHEN_ENTER, \
+    _CH_FROM_ENTER, _CH_FROM_LOWEST_SINCE_ENTER = range(len(status_columns))
+_TIMESTAMP_AT_ENTER = 0
+# rows of the features of the transition, in the order of consumed_feature_columns.
+_VALUE, _CH_MAX, _CH_MIN, _EXPECTED_V, _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO = range(len(consumed_feature_columns))
+_JUMP_THRESHOLD, _DROP_FROM_JUMP_THRESHOLD = range(2)
+
+
+@njit
+def _update_highest_lowest(status, features, i, update_unit):
+    if features[_CH_MAX, i] >= status[_HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED] + update_unit:
+        delta = features[_CH_MAX, i] - status[_HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED]
+        status[_HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED] += int(delta / update_unit) * update_unit
+    if features[_CH_MIN, i] <= status[_LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED] - update_unit:
+        delta = status[_LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED] - features[_CH_MIN, i]
+        status[_LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED] -= int(delta / update_unit) * update_unit
+
+
+@njit
+def _reset_thresholds_crossed(status):
+    status[_CH_MAX_THRESHOLD_CROSSED] = 0
+    status[_CH_MIN_THRESHOLD_CROSSED] = 0
+    status[_HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED] = 0
+    status[_LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED] = 0
+
+
+@njit
+def transition(status, int_status, features, timestamps, i, params):
+    '''
+    Status.update of the row i, where status is of status_columns, int_status is [timestamp_at_enter]
+    and params are of get_params.
+    '''
+    value = features[_VALUE, i]
+    jump_threshold, drop_from_jump_threshold = abs(params[_JUMP_THRESHOLD]), abs(params[_DROP_FROM_JUMP_THRESHOLD])
+
+    if status[_CH_MAX_THRESHOLD_CROSSED] != 0 or status[_CH_MIN_THRESHOLD_CROSSED] != 0:
+        _update_highest_lowest(status, features, i, drop_from_jump_threshold)
+
+    if status[_IN_POSITION] != 0:
+        if value < status[_LOWEST_SINCE_ENTER]:
+            status[_LOWEST_SINCE_ENTER] = value
+        if value > status[_HIGHEST_SINCE_ENTER]:
+            status[_HIGHEST_SINCE_ENTER] = value
+
+        # the seconds of the timedelta, i.e. without the days.
+        status[_TIMEDELTA_SECONDS_SINCE_POSITION_ENTER] = ((timestamps[i] - int_status[_TIMESTAMP_AT_ENTER]) // 1_000_000_000) % 86400
+        status[_CH_FROM_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_VALUE_AT_ENTER], value)
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = algo.feature.util.jitter_common.get_ch_scalar(status[_LOWEST_SINCE_ENTER], value)
+
+        if status[_IN_POSITION] == -1:
+            if status[_TIMEDELTA_SECONDS_SINCE_POSITION_ENTER] > 30 * 60 or features[_CH_MAX, i] < 0.025:
+                status[_IN_POSITION] = 0
+                _reset_thresholds_crossed(status)
+            # take profit or stop loss
+            if status[_CH_FROM_ENTER] < -jump_threshold or status[_CH_FROM_ENTER] > drop_from_jump_threshold:
+                status[_IN_POSITION] = 0
+        elif status[_IN_POSITION] == 1:
+            if status[_TIMEDELTA_SECONDS_SINCE_POSITION_ENTER] > 30 * 60 or features[_CH_MIN, i] > -0.025:
+                status[_IN_POSITION] = 0
+                _reset_thresholds_crossed(status)
+            # take profit or stop loss
+            if status[_CH_FROM_ENTER] > jump_threshold or status[_CH_FROM_ENTER] < -drop_from_jump_threshold:
+                status[_IN_POSITION] = 0
+        return
+
+    new_position = 0
+    if features[_CH_MAX, i] > jump_threshold and status[_CH_MAX_THRESHOLD_CROSSED] == 0 and \
+            value > features[_EXPECTED_V, i] * (1. + jump_threshold):
+        status[_CH_MAX_THRESHOLD_CROSSED] = 1
+        _update_highest_lowest(status, features, i, drop_from_jump_threshold)
+
+    if features[_CH_MIN, i] < -jump_threshold and status[_CH_MIN_THRESHOLD_CROSSED] == 0 and \
+            value < features[_EXPECTED_V, i] * (1. - jump_threshold):
+        status[_CH_MIN_THRESHOLD_CROSSED] = 1
+        _update_highest_lowest(status, features, i, drop_from_jump_threshold)
+
+    if status[_CH_MAX_THRESHOLD_CROSSED] != 0 and \
+            features[_CH_MAX, i] < status[_HIGHEST_CH_MAX_SINCE_CH_MAX_THRESHOLD_CROSSED] - drop_from_jump_threshold and \
+            features[_CH_MIN, i] < -drop_from_jump_threshold and \
+            value > features[_EXPECTED_V, i] * (1. + jump_threshold):
+        new_position = -1
+
+    if status[_CH_MIN_THRESHOLD_CROSSED] != 0 and \
+            features[_CH_MIN, i] > status[_LOWEST_CH_MIN_SINCE_CH_MIN_THRESHOLD_CROSSED] + drop_from_jump_threshold and \
+            features[_CH_MAX, i] > drop_from_jump_threshold and \
+            value < features[_EXPECTED_V, i] * (1. - jump_threshold):
+        new_position = 1
+
+    if new_position != 0:
+        status[_IN_POSITION] = new_position
+        status[_VALUE_AT_ENTER] = value
+        status[_LOWEST_SINCE_ENTER] = value
+        int_status[_TIMESTAMP_AT_ENTER] = timestamps[i]
+        status[_TIMEDELTA_SECONDS_SINCE_POSITION_ENTER] = 0
+        status[_V_CH_MAX_IS_TO_WHEN_ENTER] = features[_V_CH_MAX_IS_TO, i]
+        status[_V_CH_MIN_IS_TO_WHEN_ENTER] = features[_V_CH_MIN_IS_TO, i]
+        status[_V_CH_MAX_IS_FROM_WHEN_ENTER] = features[_V_CH_MAX_IS_FROM, i]
+        status[_V_CH_MIN_IS_FROM_WHEN_ENTER] = features[_V_CH_MIN_IS_FROM, i]
+        status[_CH_FROM_ENTER] = 0
+        status[_CH_FROM_LOWEST_SINCE_ENTER] = 0
+    elif status[_CH_MAX_THRESHOLD_CROSSED] == 0 and status[_CH_MIN_THRESHOLD_CROSSED] != 0:
+        status[:] = 0
+        int_status[:] = 0
+
+
+def get_params(trading_param: JitterSimpleReversalTradingParam):
+    return [trading_param.jump_threshold, trading_param.drop_from_jump_threshold]
+
+
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=status_columns,
+    output_columns=status_columns,
+    transition=transition,
+    get_params=get_params,
+    int_state_columns=['timestamp_at_enter'],
+    dtypes={
+        'in_position': 'int64', 'ch_max_threshold_crossed': bool, 'ch_min_threshold_crossed': bool,
+        'timedelta_seconds_since_position_enter': 'int64'},
+)
@@ -1,9 +1,9 @@
-import pandas as pd
-from collections import defaultdict
 import algo.feature.jitter.calculate
 import algo.alpha.jitter_simple_reversal.calculate
 import algo.feature.util.research
 import algo.feature.jitter.research
+import algo.alpha.util.fused
+import algo.alpha.util.sparse
 from algo.alpha.jitter_simple_reversal.calculate import JitterSimpleReversalTradingParam
 
 _trading_label_prefix = '(changes_simple_reversal_trading)'
@@ -44,23 +44,24 @@ def get_dfst_trading(dfst_feature, trading_param: JitterSimpleReversalTradingPar
     return dfst_trading
 
 
-def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.jitter_simple_reversal.calculate.Status()
-    trading_dict = defaultdict(list)
+def get_dfst_feature_trading(df, trading_param: JitterSimpleReversalTradingParam, symbol_filter=None, value_column='close', n_workers=1):
+    '''
+    (the feature columns, dfst_trading) computing the features and the trading symbol by symbol from the market data df,
+    the same dfst_trading as get_dfst_trading of the dfst_feature (see algo.alpha.util.fused).
+    '''
+    return algo.alpha.util.fused.get_dfst_feature_trading(
+        df, trading_param, add_trading_columns, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
 
-    for timestamp in df_feature.index:
-        features = df_feature.loc[timestamp].to_dict()
-        all_features = features
-        status.update(timestamp, all_features, trading_param)
-        for k, v in {**all_features, **algo.alpha.jitter_simple_reversal.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
 
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * df_feature_trading.in_position.shift()
-    # in position is shifted as the position is reflected in the next time unit.
-    df_feature_trading['profit'] = df_feature_trading.value.pct_change() * df_feature_trading.in_position.shift()
+def get_dfst_trading_sparse(dfst_feature, trading_param):
+    '''
+    the trading columns of get_dfst_trading only at the rows that are not flat, without copying dfst_feature
+    (see algo.alpha.util.sparse for the trades and the dense expansion).
+    '''
+    return algo.alpha.util.sparse.get_dfst_trading_sparse(
+        dfst_feature, trading_param, add_trading_columns,
+        is_traded_func=algo.alpha.util.fused.has_jump)
 
-    del trading_dict
-    return df_feature_trading
 
+def add_trading_columns(df_feature, trading_param):
+    return algo.alpha.jitter_simple_reversal.calculate.state_machine.add_trading_columns(df_feature, trading_param)
@@ -1,13 +1,17 @@
 import datetime
 
 import pandas as pd
+from numba import njit
 
 import algo.feature.momentum.calculate
+import algo.alpha.util.state_machine
 from algo.feature.momentum.calculate import MomentumFeatureParam
 
 default_selection_size = 10
 default_rebalance_interval_minutes = 6 * 60
 
+consumed_feature_columns = ['value', 'ema', 'momentum', 'rank', 'rank_descending']
+
 class MomentumTradingParam:
     def __init__(self, feature_param: MomentumFeatureParam, selection_size: int, rebalance_interval_minutes: int):
         self.feature_param = feature_param
@@ -95,3 +99,67 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+# the columns of status_as_dict, the output columns of state_machine.
+status_columns = list(status_as_dict(Status()).keys())
+_IN_POSITION, _VALUE_AT_ENTER, _CH_FROM_ENTER = range(len(status_columns))
+# not in status_as_dict but a part of the status.
+_EMA_AT_ENTER, _CH_EMA_FROM_ENTER = len(status_columns), len(status_columns) + 1
+state_columns = status_columns + ['ema_at_enter', 'ch_ema_from_enter']
+# rows of the features of the transition, in the order of consumed_feature_columns.
+_VALUE, _EMA, _MOMENTUM, _RANK, _RANK_DESCENDING = range(len(consumed_feature_columns))
+_SELECTION_SIZE, _REBALANCE_INTERVAL_SECONDS, _IS_REVERSAL = range(3)
+
+
+@njit
+def transition(status, int_status, features, timestamps, i, params):
+    '''
+    Status.update of the row i, where status is of state_columns and params are of get_params.
+    the rebalance is at the multiples of the interval since the epoch in utc.
+    the long and the short are swapped if params[_IS_REVERSAL] is set, for momentum_reversal.
+    '''
+    value = features[_VALUE, i]
+    ema = features[_EMA, i]
+
+    if status[_IN_POSITION] != 0:
+        status[_CH_FROM_ENTER] = algo.feature.momentum.calculate._get_ch(status[_VALUE_AT_ENTER], value)
+        status[_CH_EMA_FROM_ENTER] = algo.feature.momentum.calculate._get_ch(status[_EMA_AT_ENTER], ema)
+
+    if (timestamps[i] // 1_000_000_000) % int(params[_REBALANCE_INTERVAL_SECONDS]) != 0:
+        return
+
+    is_long = features[_RANK_DESCENDING, i] <= params[_SELECTION_SIZE] and features[_MOMENTUM, i] > 0
+    is_short = features[_RANK, i] <= params[_SELECTION_SIZE] and features[_MOMENTUM, i] < 0
+    if params[_IS_REVERSAL] != 0:
+        is_long, is_short = is_short, is_long
+
+    if status[_IN_POSITION] == 1:
+        status[_IN_POSITION] = 1 if is_long else 0
+    elif status[_IN_POSITION] == -1:
+        status[_IN_POSITION] = -1 if is_short else 0
+    else:
+        in_position = 1 if is_long else (-1 if is_short else 0)
+        if in_position != 0:
+            status[_IN_POSITION] = in_position
+            status[_VALUE_AT_ENTER] = value
+            status[_CH_FROM_ENTER] = 0
+            status[_EMA_AT_ENTER] = ema
+            status[_CH_EMA_FROM_ENTER] = 0
+
+    if status[_IN_POSITION] == 0:
+        status[:] = 0
+
+
+def get_params(trading_param: MomentumTradingParam):
+    return [trading_param.selection_size, trading_param.rebalance_interval_minutes * 60, 0]
+
+
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=state_columns,
+    output_columns=status_columns,
+    transition=transition,
+    get_params=get_params,
+    dtypes={'in_position': 'int64'},
+)
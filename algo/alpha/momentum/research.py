@@ -1,5 +1,3 @@
-import pandas as pd
-from collections import defaultdict
 import algo.feature.momentum.calculate
 import algo.alpha.momentum.calculate
 import algo.feature.util.research
@@ -45,20 +43,4 @@ def get_dfst_trading(dfst_feature, trading_param: MomentumTradingParam):
 
 
 def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.momentum.calculate.Status()
-    trading_dict = defaultdict(list)
-
-    for i in df_feature.index:
-        features = df_feature.loc[i].to_dict()
-        status.update(i, features, trading_param)
-        for k, v in {**features, **algo.alpha.momentum.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
-
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['in_position'] = df_feature_trading.in_position.shift()
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * df_feature_trading.in_position
-    df_feature_trading['profit'] = df_feature_trading.value.pct_change() * df_feature_trading.in_position
-
-    del trading_dict
-    return df_feature_trading
+    return algo.alpha.momentum.calculate.state_machine.add_trading_columns(df_feature, trading_param, shift_in_position=True)
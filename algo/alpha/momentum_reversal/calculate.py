@@ -3,11 +3,15 @@ import datetime
 import pandas as pd
 
 import algo.feature.momentum.calculate
+import algo.alpha.momentum.calculate
+import algo.alpha.util.state_machine
 from algo.feature.momentum.calculate import MomentumFeatureParam
 
 default_selection_size = 10
 default_rebalance_interval_minutes = 6 * 60
 
+consumed_feature_columns = ['value', 'ema', 'momentum', 'rank', 'rank_descending']
+
 class MomentumReversalTradingParam:
     def __init__(self, feature_param: MomentumFeatureParam, selection_size: int, rebalance_interval_minutes: int):
         self.feature_param = feature_param
@@ -88,3 +92,21 @@ def status_as_dict(status):
 
 def status_as_df(status):
     return pd.DataFrame({k: [v] for k, v in status_as_dict(status).items()})
+
+
+status_columns = algo.alpha.momentum.calculate.status_columns
+
+
+def get_params(trading_param: MomentumReversalTradingParam):
+    return [trading_param.selection_size, trading_param.rebalance_interval_minutes * 60, 1]
+
+
+# the transition of momentum with the long and the short swapped.
+state_machine = algo.alpha.util.state_machine.StateMachine(
+    feature_columns=consumed_feature_columns,
+    state_columns=algo.alpha.momentum.calculate.state_columns,
+    output_columns=status_columns,
+    transition=algo.alpha.momentum.calculate.transition,
+    get_params=get_params,
+    dtypes={'in_position': 'int64'},
+)
@@ -1,5 +1,3 @@
-import pandas as pd
-from collections import defaultdict
 import algo.feature.momentum.calculate
 import algo.alpha.momentum_reversal.calculate
 import algo.feature.util.research
@@ -45,19 +43,4 @@ def get_dfst_trading(dfst_feature, trading_param: MomentumReversalTradingParam):
 
 
 def add_trading_columns(df_feature, trading_param):
-    status = algo.alpha.momentum_reversal.calculate.Status()
-    trading_dict = defaultdict(list)
-
-    for i in df_feature.index:
-        features = df_feature.loc[i].to_dict()
-        status.update(i, features, trading_param)
-        for k, v in {**features, **algo.alpha.momentum_reversal.calculate.status_as_dict(status)}.items():
-            trading_dict[k].append(v)
-
-    df_feature_trading = pd.DataFrame(trading_dict, index=df_feature.index)
-    df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
-    df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * df_feature_trading.in_position.shift()
-    df_feature_trading['profit'] = df_feature_trading.value.pct_change() * df_feature_trading.in_position.shift()
-
-    del trading_dict
-    return df_feature_trading
+    return algo.alpha.momentum_reversal.calculate.state_machine.add_trading_columns(df_feature, trading_param)
@@ -0,0 +1,88 @@
+import typing
+import algo.feature.registry
+import algo.feature.util.assembly
+import algo.feature.util.research
+
+
+def _get_usdt_symbol_filter():
+    return lambda s: 'USDT' in s
+
+
+def has_jump(df_feature, trading_param) -> bool:
+    '''
+    whether the symbol has a jump or a drop beyond trading_param.jump_threshold, i.e. could trade at all.
+    '''
+    if 'ch_max' not in df_feature.columns:
+        return False
+    return bool(((df_feature.ch_max > abs(trading_param.jump_threshold)) | (df_feature.ch_min < -abs(trading_param.jump_threshold))).any())
+
+
+class _FusedPlan:
+    '''
+    what a symbol needs for the fused feature and trading, picklable for the process pool.
+    '''
+    def __init__(self, trading_param, add_trading_columns_func, is_traded_func):
+        self.trading_param = trading_param
+        self.add_trading_columns_func = add_trading_columns_func
+        self.is_traded_func = is_traded_func
+
+
+def _get_symbol_feature_trading_dfs(dfs, fused_plan: _FusedPlan, value_column='close'):
+    '''
+    (df_feature, df_trading) of a symbol, df_trading being None if the symbol does not trade.
+    '''
+    feature_param = fused_plan.trading_param.feature_param
+    spec = algo.feature.registry.get_spec(feature_param)
+    df_feature = spec.get_feature_dfs(dfs, [spec.get_kernel_param(feature_param)], value_column=value_column)[0]
+    if not fused_plan.is_traded_func(df_feature, fused_plan.trading_param):
+        return df_feature, None
+    df_trading = fused_plan.add_trading_columns_func(df_feature, fused_plan.trading_param)
+    return df_feature, df_trading[[column for column in df_trading.columns if column not in df_feature.columns]]
+
+
+def get_dfst_feature_trading(
+        df, trading_param, add_trading_columns_func, is_traded_func=has_jump,
+        symbol_filter=None, value_column='close', n_workers=1) -> typing.Tuple[typing.List[str], typing.Any]:
+    '''
+    computes the features of trading_param.feature_param and the trading of a symbol in one go, symbol by symbol,
+    writing them into the preallocated columns instead of materializing the dfst_feature to be copied for the trading.
+    returns (the feature columns, dfst_trading), where dfst_trading is the same as get_dfst_trading(get_dfst_feature(df))
+    of the alpha, and dfst_trading[feature columns] (with the market data columns) is the dfst_feature.
+
+    only a feature computed per symbol (without the cross-sectional post process in algo.feature.registry) can be fused.
+    is_traded_func(df_feature, trading_param) selects the symbols to run the trading for, the others having nan trading columns.
+    a trading_param whose feature_param is of StateMachine.get_feature_param_for (see algo.alpha.util.state_machine)
+    computes and stores only the feature columns the trading consumes.
+    '''
+    spec = algo.feature.registry.get_spec(trading_param.feature_param)
+    if spec.post_process is not None:
+        raise ValueError(f'the {spec.name} feature has a cross-sectional stage, thus can not be fused with the trading')
+
+    all_symbols = df.symbol.unique()
+    if symbol_filter is None:
+        symbol_filter = _get_usdt_symbol_filter()
+    all_symbols = [s for s in all_symbols if symbol_filter(s)]
+    print(f'all_symbols: {len(all_symbols)}')
+
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
+    feature_arrays, trading_arrays = {}, {}
+    fused_plan = _FusedPlan(trading_param, add_trading_columns_func, is_traded_func)
+    for i, (symbol, (df_feature, df_trading)) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+            symbol_blocks, all_symbols, _get_symbol_feature_trading_dfs, fused_plan, value_column=value_column, n_workers=n_workers)):
+        symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
+        if df_trading is not None:
+            print(f'{i} symbol: {symbol} (feature, trading)')
+            symbol_blocks.write_feature(trading_arrays, symbol, df_trading)
+        del df_feature, df_trading
+
+    feature_columns = list(feature_arrays.keys())
+    feature_arrays.update(trading_arrays)
+    return feature_columns, symbol_blocks.get_dfst(feature_arrays)
+
+
+def get_dfst_feature_of_trading(df, dfst_trading, feature_columns):
+    '''
+    the dfst_feature out of the dfst_trading of get_dfst_feature_trading, selecting the market data and the feature columns.
+    '''
+    market_data_columns = [column for column in df.columns if column not in ('symbol', 'timestamp') and column not in feature_columns]
+    return dfst_trading[market_data_columns + feature_columns]
@@ -0,0 +1,99 @@
+import typing
+import numpy as np
+import pandas as pd
+
+
+'''
+the sparse trading keeps, out of the trading columns of a dfst_trading, only the rows that are not flat,
+a flat row being a row of a traded symbol with all the trading columns zero (out of position, after the reset of the status).
+the rows in position, their exit rows and the first row of each traded symbol (nan position_changed) are always kept,
+thus the symbols of the sparse trading are the traded symbols, and the dense dfst_trading can be recovered from it.
+'''
+
+
+def get_sparse_label(trading_label: str) -> str:
+    return f'{trading_label}_sparse'
+
+
+def _get_non_flat(df_trading) -> pd.DataFrame:
+    return df_trading[(df_trading != 0).any(axis=1)]
+
+
+def get_dfst_trading_sparse(dfst_feature, trading_param, add_trading_columns_func, is_traded_func=None) -> pd.DataFrame:
+    '''
+    the sparse trading of the symbols of dfst_feature, indexed by (symbol, timestamp), without copying dfst_feature.
+    is_traded_func(df_feature, trading_param), if given, selects the symbols to run the trading for.
+    '''
+    all_symbols = dfst_feature.index.get_level_values('symbol').unique().values
+
+    df_tradings = {}
+    for i, symbol in enumerate(all_symbols):
+        df_feature = dfst_feature.xs(symbol, level=0)
+        if is_traded_func is not None and not is_traded_func(df_feature, trading_param):
+            continue
+        print(f'{i} symbol: {symbol} (trading)')
+        df_trading = add_trading_columns_func(df_feature, trading_param)
+        df_tradings[symbol] = _get_non_flat(df_trading[[column for column in df_trading.columns if column not in df_feature.columns]])
+        del df_feature, df_trading
+
+    print(f'traded symbols: {len(df_tradings)}')
+    if len(df_tradings) == 0:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['symbol', 'timestamp']))
+    return pd.concat(df_tradings, names=['symbol'])
+
+
+def get_sparse_trading(dfst_trading, feature_columns: typing.List[str]) -> pd.DataFrame:
+    '''
+    the sparse trading of a dense dfst_trading, whose columns other than feature_columns are the trading columns.
+    '''
+    dfst_trading = dfst_trading[[column for column in dfst_trading.columns if column not in feature_columns]]
+    # the trading columns of a symbol without the trading are all nan.
+    return _get_non_flat(dfst_trading[dfst_trading.notna().any(axis=1)])
+
+
+def get_dense_trading(dfst_feature, dfst_trading_sparse) -> pd.DataFrame:
+    '''
+    the dense dfst_trading of dfst_feature, the same as get_dfst_trading of the alpha up to the dtypes:
+    the flat rows of the traded symbols are zeros, and the trading columns of the other symbols are nan.
+    '''
+    traded_symbols = dfst_trading_sparse.index.get_level_values('symbol').unique()
+    df_trading = dfst_trading_sparse.astype(np.float64).reindex(dfst_feature.index)
+    is_flat = dfst_feature.index.get_level_values('symbol').isin(traded_symbols) & ~dfst_feature.index.isin(dfst_trading_sparse.index)
+    df_trading.loc[is_flat] = 0.0
+    return pd.concat([dfst_feature, df_trading], axis=1)
+
+
+def get_trades(dfst_trading, shift_in_position=False) -> pd.DataFrame:
+    '''
+    a row per position interval of a sparse or dense dfst_trading: the symbol, the timestamps of the enter and the exit
+    (NaT if still in position at the end), in_position, value_at_enter, the number of rows in position,
+    and the sum of profit and profit_raw of the position.
+    the profit of a position is of the rows after the enter up to the exit, or of the rows in position
+    if shift_in_position (see algo.alpha.util.state_machine.StateMachine.add_trading_columns).
+    '''
+    trades = []
+    for symbol, df_trading in dfst_trading.groupby(level='symbol', sort=False):
+        in_position = df_trading.in_position.fillna(0).to_numpy(dtype=np.float64)
+        n = len(in_position)
+        boundaries = np.flatnonzero(np.diff(np.concatenate([[0.0], in_position, [0.0]])) != 0)
+        if len(boundaries) == 0:
+            continue
+        timestamps = df_trading.index.get_level_values('timestamp')
+        cumsum_profit = np.concatenate([[0.0], np.cumsum(np.nan_to_num(df_trading.profit.to_numpy(dtype=np.float64)))])
+        cumsum_profit_raw = np.concatenate([[0.0], np.cumsum(np.nan_to_num(df_trading.profit_raw.to_numpy(dtype=np.float64)))])
+        for head, tail in zip(boundaries[:-1], boundaries[1:]):
+            if in_position[head] == 0:
+                continue
+            first, last = (head, tail - 1) if shift_in_position else (head + 1, min(tail, n - 1))
+            trades.append({
+                'symbol': symbol,
+                'timestamp_enter': timestamps[head],
+                'timestamp_exit': timestamps[tail] if tail < n else pd.NaT,
+                'in_position': in_position[head],
+                'value_at_enter': df_trading.value_at_enter.iloc[head],
+                'rows': tail - head,
+                'profit': cumsum_profit[last + 1] - cumsum_profit[first],
+                'profit_raw': cumsum_profit_raw[last + 1] - cumsum_profit_raw[first],
+            })
+    return pd.DataFrame(trades, columns=[
+        'symbol', 'timestamp_enter', 'timestamp_exit', 'in_position', 'value_at_enter', 'rows', 'profit', 'profit_raw'])
@@ -0,0 +1,216 @@
+import copy
+import typing
+import pandas as pd, numpy as np
+from numba import njit
+import algo.feature.util.time_window
+import algo.feature.registry
+
+
+'''
+the compiled whole-series runner of the alpha Status transitions.
+
+an alpha declares a StateMachine of
+    feature_columns: the feature columns the transition reads, the rows of its features array.
+        these are the consumed_feature_columns of the alpha calculate module, and get_feature_param_for narrows
+        the columns of the feature param to them, to compute and store only those.
+    state_columns: the float64 state fields, of which the first len(output_columns) are output_columns (status_as_dict).
+    int_state_columns: the int64 state fields, such as the epoch nanoseconds at the position enter.
+    transition(state, int_state, features, timestamps, i, params): the njit Status.update of the row i, updating the states in place.
+        timestamps are the int64 epoch nanoseconds of the rows and params is the float64 array of get_params(trading_param).
+the states start from zeros, the same as Status.reset.
+get_candidates(features, params), if given, is the vectorized scan of the rows where the position could be entered from the reset state,
+    with which only the segments from a candidate to the reset after the exit are run (see run_segments).
+step_all advances the states of all the symbols by a row at once, for the live trading (see StateMachine.step).
+run_grid runs the transition for several params at once, for a parameter sweep (see algo.alpha.util.sweep).
+'''
+
+
+@njit
+def run_series(transition, state, int_state, features, timestamps, params, out):
+    '''
+    fills out, of shape (the number of the output columns, the number of rows), with the state after the transition of each row.
+    '''
+    for i in range(features.shape[1]):
+        transition(state, int_state, features, timestamps, i, params)
+        out[:, i] = state[:out.shape[0]]
+
+
+@njit
+def step_all(transition, states, int_states, features, timestamps, params):
+    '''
+    advances the state of every symbol by a row, where states[j] and int_states[j] are the states of the symbol j,
+    whose features are features[:, j] and timestamp is timestamps[j].
+    '''
+    for j in range(features.shape[1]):
+        transition(states[j], int_states[j], features, timestamps, j, params)
+
+
+@njit
+def _is_reset(state, int_state):
+    for v in state:
+        if v != 0:
+            return False
+    for v in int_state:
+        if v != 0:
+            return False
+    return True
+
+
+@njit
+def run_segments(transition, state, int_state, features, timestamps, params, candidates, out):
+    '''
+    run_series over only the segments from a candidate row to the row where the state is reset again, out being zeros elsewhere.
+    the same as run_series as long as the transition of a row other than the candidates keeps the reset state reset.
+    '''
+    out[:, :] = 0
+    i = 0
+    while i < features.shape[1]:
+        if not candidates[i]:
+            i += 1
+            continue
+        while i < features.shape[1]:
+            transition(state, int_state, features, timestamps, i, params)
+            out[:, i] = state[:out.shape[0]]
+            i += 1
+            if _is_reset(state, int_state):
+                break
+
+
+_PNL, _TRADES, _ROWS_IN_POSITION = range(3)
+
+
+@njit
+def run_grid(transition, states, int_states, features, timestamps, params_grid, values, in_position_index, profit_sign, summary):
+    '''
+    runs the transition of each row of params_grid over the same rows, states and int_states having a row per params.
+    summary[k] is (pnl, trades, rows in position) of params_grid[k], where pnl is the sum of the profit of add_trading_columns
+    (a row of nan value does not count) and a trade is an enter or a flip of the position.
+    '''
+    n_params = params_grid.shape[0]
+    in_position_before = np.zeros(n_params)
+    for i in range(features.shape[1]):
+        ch = np.nan
+        if i > 0 and values[i - 1] != 0:
+            ch = (values[i] - values[i - 1]) / values[i - 1]
+        for k in range(n_params):
+            if in_position_before[k] != 0 and not np.isnan(ch):
+                summary[k, _PNL] += profit_sign * ch * in_position_before[k]
+            transition(states[k], int_states[k], features, timestamps, i, params_grid[k])
+            in_position = states[k, in_position_index]
+            if in_position != 0:
+                summary[k, _ROWS_IN_POSITION] += 1
+                if in_position != in_position_before[k]:
+                    summary[k, _TRADES] += 1
+            in_position_before[k] = in_position
+
+
+class StateMachine:
+    def __init__(
+            self,
+            feature_columns: typing.List[str],
+            state_columns: typing.List[str],
+            output_columns: typing.List[str],
+            transition,
+            get_params: typing.Callable,
+            int_state_columns: typing.Optional[typing.List[str]] = None,
+            dtypes: typing.Optional[typing.Dict[str, typing.Any]] = None,
+            get_candidates: typing.Optional[typing.Callable] = None,
+    ):
+        '''
+        dtypes are the dtypes of the output columns other than float64, e.g. bool for a flag.
+        '''
+        if state_columns[:len(output_columns)] != output_columns:
+            raise ValueError(f'the state columns should start with the output columns {output_columns}')
+        self.feature_columns = feature_columns
+        self.state_columns = state_columns
+        self.output_columns = output_columns
+        self.transition = transition
+        self.get_params = get_params
+        self.int_state_columns = int_state_columns if int_state_columns is not None else []
+        self.dtypes = dtypes if dtypes is not None else {}
+        self.get_candidates = get_candidates
+
+    def get_feature_param_for(self, trading_param, extra_columns=None):
+        '''
+        a copy of trading_param.feature_param with the columns of feature_columns and extra_columns only,
+        extra_columns being the other feature columns needed, e.g. by an is_traded_func.
+        raises ValueError if the feature does not have all of those columns.
+        '''
+        feature_param = copy.copy(trading_param.feature_param)
+        extra_columns = [] if extra_columns is None else [column for column in extra_columns if column not in self.feature_columns]
+        feature_param.columns = list(self.feature_columns) + extra_columns
+        feature_columns = algo.feature.registry.get_spec(feature_param).get_columns(feature_param)
+        missing_columns = [column for column in feature_param.columns if column not in feature_columns]
+        if len(missing_columns) > 0:
+            raise ValueError(f'{type(feature_param).__name__} does not have the feature columns {missing_columns}')
+        return feature_param
+
+    def step(self, states, features, trading_param, int_states=None, timestamps=None) -> None:
+        '''
+        advances states, of shape (the number of the symbols, the number of the state columns), by a row in place (see step_all).
+        features is of shape (the number of the feature columns, the number of the symbols),
+        and timestamps are the int64 epoch nanoseconds of the symbols.
+        '''
+        if int_states is None:
+            int_states = np.zeros((states.shape[0], len(self.int_state_columns)), dtype=np.int64)
+        if timestamps is None:
+            timestamps = np.zeros(states.shape[0], dtype=np.int64)
+        params = np.asarray(self.get_params(trading_param), dtype=np.float64)
+        step_all(self.transition, states, int_states, np.ascontiguousarray(features, dtype=np.float64), timestamps, params)
+
+    def get_status_df(self, df_feature, trading_param) -> pd.DataFrame:
+        '''
+        the output columns after the transition of each row of df_feature, indexed by the timestamps.
+        '''
+        features = np.ascontiguousarray(df_feature[self.feature_columns].to_numpy(dtype=np.float64).T)
+        timestamps = algo.feature.util.time_window.get_epoch_nanos(df_feature.index)
+        params = np.asarray(self.get_params(trading_param), dtype=np.float64)
+        state = np.zeros(len(self.state_columns))
+        int_state = np.zeros(len(self.int_state_columns), dtype=np.int64)
+        out = np.empty((len(self.output_columns), len(df_feature)))
+        if self.get_candidates is None:
+            run_series(self.transition, state, int_state, features, timestamps, params, out)
+        else:
+            candidates = np.ascontiguousarray(self.get_candidates(features, params), dtype=np.bool_)
+            run_segments(self.transition, state, int_state, features, timestamps, params, candidates, out)
+        df_status = pd.DataFrame(out.T, index=df_feature.index, columns=self.output_columns, copy=False)
+        if len(self.dtypes) > 0:
+            df_status = df_status.astype(self.dtypes)
+        return df_status
+
+    def get_summary(self, df_feature, trading_params, profit_sign=1) -> np.ndarray:
+        '''
+        (pnl, trades, rows in position) of each of trading_params over df_feature, of shape (len(trading_params), 3),
+        running all the params in one pass over the rows (see run_grid).
+        '''
+        features = np.ascontiguousarray(df_feature[self.feature_columns].to_numpy(dtype=np.float64).T)
+        timestamps = algo.feature.util.time_window.get_epoch_nanos(df_feature.index)
+        values = df_feature['value'].to_numpy(dtype=np.float64)
+        params_grid = np.asarray([self.get_params(trading_param) for trading_param in trading_params], dtype=np.float64)
+        states = np.zeros((len(trading_params), len(self.state_columns)))
+        int_states = np.zeros((len(trading_params), len(self.int_state_columns)), dtype=np.int64)
+        summary = np.zeros((len(trading_params), 3))
+        run_grid(self.transition, states, int_states, features, timestamps, params_grid, values,
+                 self.output_columns.index('in_position'), float(profit_sign), summary)
+        return summary
+
+    def add_trading_columns(self, df_feature, trading_param, profit_sign=1, shift_in_position=False) -> pd.DataFrame:
+        '''
+        df_feature with the output columns, then position_changed, profit_raw and profit,
+        where the position is reflected in the profit of the next row.
+        shift_in_position shifts in_position itself by a row instead, for the position taking effect at the next row.
+        '''
+        df_feature_trading = pd.concat([df_feature, self.get_status_df(df_feature, trading_param)], axis=1)
+        if shift_in_position:
+            df_feature_trading['in_position'] = df_feature_trading.in_position.shift()
+            in_position_before = df_feature_trading.in_position
+        else:
+            in_position_before = df_feature_trading.in_position.shift()
+        df_feature_trading['position_changed'] = df_feature_trading.in_position.diff()
+        if profit_sign < 0:
+            df_feature_trading['profit_raw'] = -df_feature_trading.value.diff() * in_position_before
+            df_feature_trading['profit'] = -df_feature_trading.value.pct_change() * in_position_before
+        else:
+            df_feature_trading['profit_raw'] = df_feature_trading.value.diff() * in_position_before
+            df_feature_trading['profit'] = df_feature_trading.value.pct_change() * in_position_before
+        return df_feature_trading
@@ -0,0 +1,55 @@
+import copy
+import itertools
+import typing
+import pandas as pd
+import algo.alpha.util.state_machine
+
+
+summary_columns = ['pnl', 'trades', 'exposure']
+
+
+def get_trading_params_grid(trading_param, grid: typing.Dict[str, typing.List]) -> typing.List:
+    '''
+    copies of trading_param for every combination of the values of grid, keyed by the attribute name,
+    e.g. {'jump_threshold': [0.1, 0.2], 'exit_jumpt_threshold': [0.01, 0.02]}.
+    '''
+    trading_params = []
+    for values in itertools.product(*grid.values()):
+        p = copy.copy(trading_param)
+        for k, v in zip(grid.keys(), values):
+            setattr(p, k, v)
+        trading_params.append(p)
+    return trading_params
+
+
+def get_df_sweep(
+        dfst_feature, trading_params: typing.List, state_machine: algo.alpha.util.state_machine.StateMachine,
+        profit_sign=1, is_traded_func=None) -> pd.DataFrame:
+    '''
+    the summary of the trading of each of trading_params for each symbol of dfst_feature, indexed by (param, symbol),
+    where param is the position in trading_params, with summary_columns:
+    pnl (the sum of the profit), trades (the number of the position enters) and exposure (the ratio of the rows in position).
+
+    the trading params share the feature param of dfst_feature and run in one pass over the rows of a symbol.
+    is_traded_func(df_feature, trading_param), if given, skips the symbols not traded under any of trading_params,
+    which have zeros in the summary.
+    '''
+    symbols = dfst_feature.index.get_level_values('symbol').unique().values
+    print(f'symbols: {len(symbols)}, trading params: {len(trading_params)}')
+
+    df_sweeps = []
+    for i, symbol in enumerate(symbols):
+        df_feature = dfst_feature.xs(symbol, level=0)
+        df_sweep = pd.DataFrame(0.0, index=pd.MultiIndex.from_product(
+            [range(len(trading_params)), [symbol]], names=['param', 'symbol']), columns=summary_columns)
+        if is_traded_func is None or any(is_traded_func(df_feature, trading_param) for trading_param in trading_params):
+            print(f'{i} symbol: {symbol} (sweep)')
+            summary = state_machine.get_summary(df_feature, trading_params, profit_sign=profit_sign)
+            df_sweep['pnl'] = summary[:, 0]
+            df_sweep['trades'] = summary[:, 1]
+            df_sweep['exposure'] = summary[:, 2] / max(len(df_feature), 1)
+        df_sweeps.append(df_sweep)
+        del df_feature
+
+    df_sweep = pd.concat(df_sweeps).sort_index()
+    return df_sweep.astype({'trades': 'int64'})
@@ -5,6 +5,10 @@ import types
 import market_data.ingest.bq.cache
 import market_data.ingest.bq.common
 import market_data.ingest.util.time
+import algo.util.compact
+import algo.feature.registry
+import algo.alpha.util.fused
+import algo.alpha.util.sparse
 
 
 def verify_cache(
@@ -27,6 +31,22 @@ def verify_cache(
         )
 
 
+def _get_df_to_cache(df, label, compact_labels):
+    if compact_labels is None or label not in compact_labels:
+        return df
+    return algo.util.compact.to_compact_dtypes(df)
+
+
+def _get_dfst_of_trading_feature_columns(dfst, feature_param, trading_feature_columns):
+    '''
+    dfst with only the feature columns of feature_param that are in trading_feature_columns, keeping the other columns.
+    '''
+    if trading_feature_columns is None:
+        return dfst
+    feature_columns = algo.feature.registry.get_spec(feature_param).get_columns(feature_param)
+    return dfst[[column for column in dfst.columns if column not in feature_columns or column in trading_feature_columns]]
+
+
 def cache_features(
     date_str_from: str,
     date_str_to: str,
@@ -38,7 +58,16 @@ def cache_features(
     get_dfst_feature_func: types.FunctionType,
     symbol_filter=None,
     value_column='close',
+    get_dfst_features_func: typing.Optional[types.FunctionType] = None,
+    n_workers=1,
+    compact_labels: typing.Optional[typing.Collection[str]] = None,
 ) -> None:
+    '''
+    get_dfst_features_func, if given, computes the features for all of feature_params in one pass
+    and is used instead of calling get_dfst_feature_func per feature_param.
+    n_workers > 1 computes the symbols in a process pool of that size.
+    the labels in compact_labels are cached in the compact dtypes (see algo.util.compact).
+    '''
     df = market_data.ingest.bq.cache.read_from_cache(
         dataset_mode=dataset_mode,
         export_mode=export_mode,
@@ -53,9 +82,25 @@ def cache_features(
 
     df = df.reset_index()
 
+    if get_dfst_features_func is not None:
+        logging.info(f"for {labels}")
+        dfst_features = get_dfst_features_func(df, feature_params, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
+        for dfst_feature, label in zip(dfst_features, labels):
+            dfst_feature = _get_df_to_cache(dfst_feature, label, compact_labels)
+            market_data.ingest.bq.cache.cache_df(
+                dfst_feature,
+                label=label,
+                dataset_mode=dataset_mode,
+                export_mode=export_mode,
+                aggregation_mode=aggregation_mode,
+                overwrite=True)
+        del dfst_features
+        return
+
     for feature_param, label in zip(feature_params, labels):
         logging.info(f"for {label}")
-        dfst_feature = get_dfst_feature_func(df, feature_param, symbol_filter=symbol_filter, value_column=value_column)
+        dfst_feature = get_dfst_feature_func(df, feature_param, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
+        dfst_feature = _get_df_to_cache(dfst_feature, label, compact_labels)
         market_data.ingest.bq.cache.cache_df(
             dfst_feature,
             label=label,
@@ -76,7 +121,25 @@ def cache_trading(
     feature_labels: typing.List,
     trading_labels: typing.List,
     get_dfst_trading_func: types.FunctionType,
+    compact_labels: typing.Optional[typing.Collection[str]] = None,
+    get_dfst_trading_sparse_func: typing.Optional[types.FunctionType] = None,
+    trading_feature_columns: typing.Optional[typing.List[str]] = None,
 ) -> None:
+    '''
+    the trading labels in compact_labels are cached in the compact dtypes (see algo.util.compact).
+    trading_feature_columns, if given, are the feature columns the trading reads (see algo.alpha.util.state_machine),
+    the dense dfst_trading keeping only those of the features read.
+    if get_dfst_trading_sparse_func is given, the sparse trading is cached instead of the dense dfst_trading,
+    under the sparse label of the trading label (see algo.alpha.util.sparse),
+    and compacted if the (dense) trading label or its sparse label is in compact_labels.
+    '''
+    if get_dfst_trading_sparse_func is not None:
+        get_dfst_trading_func = get_dfst_trading_sparse_func
+        if compact_labels is not None:
+            compact_labels = set(compact_labels) | {
+                algo.alpha.util.sparse.get_sparse_label(trading_label) for trading_label in trading_labels if trading_label in compact_labels}
+        trading_labels = [algo.alpha.util.sparse.get_sparse_label(trading_label) for trading_label in trading_labels]
+
     for trading_param, feature_label, trading_label in zip(trading_params, feature_labels, trading_labels):
         logging.info(f"for {trading_label}")
         dfst_feature = market_data.ingest.bq.cache.read_from_cache(
@@ -89,7 +152,10 @@ def cache_trading(
         if dfst_feature is None:
             logging.error(f"feature for {feature_label} can not be found in the cache.")
             continue
+        if get_dfst_trading_sparse_func is None:
+            dfst_feature = _get_dfst_of_trading_feature_columns(dfst_feature, trading_param.feature_param, trading_feature_columns)
         dfst_trading = get_dfst_trading_func(dfst_feature, trading_param)
+        dfst_trading = _get_df_to_cache(dfst_trading, trading_label, compact_labels)
         del dfst_feature
         market_data.ingest.bq.cache.cache_df(
             dfst_trading,
@@ -100,3 +166,72 @@ def cache_trading(
             overwrite=True)
         del dfst_trading
 
+
+
+def cache_feature_trading_fused(
+    date_str_from: str,
+    date_str_to: str,
+    dataset_mode: market_data.ingest.bq.common.DATASET_MODE,
+    export_mode: market_data.ingest.bq.common.EXPORT_MODE,
+    aggregation_mode: market_data.ingest.bq.common.AGGREGATION_MODE,
+    trading_params: typing.List,
+    feature_labels: typing.List,
+    trading_labels: typing.List,
+    get_dfst_feature_trading_func: types.FunctionType,
+    if_cache_features=False,
+    symbol_filter=None,
+    value_column='close',
+    n_workers=1,
+    compact_labels: typing.Optional[typing.Collection[str]] = None,
+    trading_feature_columns: typing.Optional[typing.List[str]] = None,
+) -> typing.List[str]:
+    '''
+    caches the trading computed from the market data with the features per symbol (see algo.alpha.util.fused),
+    without caching the features then reading them back. the features are cached as well only if if_cache_features,
+    each feature label once for the trading params sharing it.
+    trading_feature_columns, if given, are the feature columns the dfst_trading keeps (see cache_trading).
+    returns the feature labels cached.
+    '''
+    df = market_data.ingest.bq.cache.read_from_cache(
+        dataset_mode=dataset_mode,
+        export_mode=export_mode,
+        aggregation_mode=aggregation_mode,
+        label=market_data.ingest.bq.cache._label_market_data,
+        date_str_from=date_str_from,
+        date_str_to=date_str_to)
+
+    if df is None:
+        logging.error(f"the market data for cache_feature_trading_fused for {dataset_mode} {export_mode} {aggregation_mode} is not available")
+        return []
+
+    df = df.reset_index()
+
+    cached_feature_labels = []
+    for trading_param, feature_label, trading_label in zip(trading_params, feature_labels, trading_labels):
+        logging.info(f"for {trading_label}")
+        feature_columns, dfst_trading = get_dfst_feature_trading_func(
+            df, trading_param, symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)
+        if if_cache_features and feature_label not in cached_feature_labels:
+            dfst_feature = algo.alpha.util.fused.get_dfst_feature_of_trading(df, dfst_trading, feature_columns)
+            dfst_feature = _get_df_to_cache(dfst_feature, feature_label, compact_labels)
+            market_data.ingest.bq.cache.cache_df(
+                dfst_feature,
+                label=feature_label,
+                dataset_mode=dataset_mode,
+                export_mode=export_mode,
+                aggregation_mode=aggregation_mode,
+                overwrite=True)
+            cached_feature_labels.append(feature_label)
+            del dfst_feature
+        dfst_trading = _get_dfst_of_trading_feature_columns(dfst_trading, trading_param.feature_param, trading_feature_columns)
+        dfst_trading = _get_df_to_cache(dfst_trading, trading_label, compact_labels)
+        market_data.ingest.bq.cache.cache_df(
+            dfst_trading,
+            label=trading_label,
+            dataset_mode=dataset_mode,
+            export_mode=export_mode,
+            aggregation_mode=aggregation_mode,
+            overwrite=True)
+        del dfst_trading
+
+    return cached_feature_labels
@@ -4,9 +4,13 @@ default_collective_window = 40
 
 
 class CollectiveJitterFeatureParam:
-    def __init__(self, window: int, collective_window: int):
+    def __init__(self, window: int, collective_window: int, columns=None):
+        '''
+        columns are the jitter feature columns and the {column}_collective columns to store, all if None.
+        '''
         self.window = window
         self.collective_window = collective_window
+        self.columns = columns
 
     @staticmethod
     def get_default_param():
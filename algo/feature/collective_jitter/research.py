@@ -1,6 +1,9 @@
-import pandas as pd
+import pandas as pd, numpy as np
 from collections import defaultdict
 import algo.feature.jitter.calculate
+import algo.feature.util.assembly
+import algo.feature.util.cross_section
+import algo.feature.util.rolling
 import algo.feature.util.research
 from algo.feature.collective_jitter.calculate import CollectiveJitterFeatureParam
 
@@ -20,35 +23,57 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, feature_param: CollectiveJitterFeatureParam, symbol_filter=None, value_column='close'):
-    dfi = df.set_index(['timestamp', 'symbol'])
+def get_dfst_feature(df, feature_param: CollectiveJitterFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
     all_symbols = df.symbol.unique()
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
     all_symbols = [s for s in all_symbols if symbol_filter(s)]
     print(f'all_symbols: {len(all_symbols)}')
 
-    dfst_feature = df.set_index(['symbol', 'timestamp'])
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
     if len(all_symbols) == 0:
-        return dfst_feature
-    for i, symbol in enumerate(all_symbols):
-        dfs = dfi.xs(symbol, level=1)
+        return symbol_blocks.get_dfst({})
+    feature_arrays = {}
+    jitter_feature_param = get_jitter_feature_param(feature_param)
+    for i, (symbol, df_feature) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+            symbol_blocks, all_symbols, algo.feature.jitter.calculate.get_feature_df, jitter_feature_param, value_column=value_column, n_workers=n_workers)):
+        print(f'{i} symbol: {symbol} (feature)')
+        symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
+        del df_feature
 
-        df_feature = algo.feature.jitter.calculate.get_feature_df(dfs, feature_param, value_column=value_column)
-        del dfs
+    dfst_feature = symbol_blocks.get_dfst(feature_arrays)
+    return get_dfst_with_collective_feature(df, dfst_feature, feature_param, symbol_filter=symbol_filter)
 
-        print(f'{i} symbol: {symbol} (feature)')
 
-        for column in df_feature.columns:
-            dfst_feature.loc[symbol, column] = df_feature[column].values
-        del df_feature
+def get_jitter_feature_param(feature_param: CollectiveJitterFeatureParam):
+    '''
+    the per-symbol jitter feature param, with collective_feature_columns_no_rolling regardless of the columns to store
+    as the collective stage needs them.
+    '''
+    return algo.feature.jitter.calculate.JitterFeatureParam(
+        feature_param.window,
+        columns=None if feature_param.columns is None else list(feature_param.columns) + collective_feature_columns_no_rolling)
+
 
+def get_dfst_with_collective_feature(df, dfst_feature, feature_param: CollectiveJitterFeatureParam, symbol_filter=None):
+    '''
+    appends the collective features to the per-symbol jitter features dfst_feature,
+    then drops the columns not in feature_param.columns if given.
+    '''
     dfst_with_collective_feature = _append_collective_feature(df, dfst_feature, feature_param,
                                                               symbol_filter=symbol_filter)
+    if feature_param.columns is not None:
+        unused_columns = [column for column in dfst_with_collective_feature.columns
+                          if column not in df.columns and column not in feature_param.columns]
+        dfst_with_collective_feature = dfst_with_collective_feature.drop(columns=unused_columns)
     return dfst_with_collective_feature
 
 
 def _append_collective_feature(df, dfst_feature, feature_param: CollectiveJitterFeatureParam, symbol_filter=None):
+    '''
+    appends the collective features as the {column}_collective columns to the rows of the symbols passing symbol_filter,
+    aligning them by the timestamp codes of the index. the other rows are left nan.
+    '''
     all_symbols = dfst_feature.index.get_level_values('symbol').unique()
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
@@ -56,33 +81,43 @@ def _append_collective_feature(df, dfst_feature, feature_param: CollectiveJitter
 
     df_collective_feature = _get_df_collective_feature(dfst_feature, feature_param)
 
-    dfst_with_collective_feature = df.set_index(['symbol', 'timestamp'])
-    for i, symbol in enumerate(all_symbols):
-        print(f'{i} symbol: {symbol} (collective_feature)')
-
-        df_feature = dfst_feature.xs(symbol, level=0)
-        for column in df_feature.columns:
-            dfst_with_collective_feature.loc[symbol, column] = df_feature[column].values
-
-        index = df_feature.index
-        df_collective_feature_index_aligned = df_collective_feature.loc[index]
-        for column in df_collective_feature.columns:
-            dfst_with_collective_feature.loc[symbol, f'{column}_collective'] = df_collective_feature_index_aligned[column].values
-        del df_feature
-
+    symbol_codes, timestamp_codes, symbols, timestamps = algo.feature.util.cross_section.get_index_codes(dfst_feature)
+    is_symbol_row = symbols.isin(all_symbols)[symbol_codes]
+    collective_values = df_collective_feature.reindex(timestamps).to_numpy(dtype=np.float64)[timestamp_codes]
+    collective_values[~is_symbol_row] = np.nan
+    collective_columns = [f'{column}_collective' for column in df_collective_feature.columns]
     del df_collective_feature
 
+    dfst_with_collective_feature = pd.concat([dfst_feature, pd.DataFrame(
+        collective_values, index=dfst_feature.index, columns=collective_columns, copy=False)], axis=1)
     return dfst_with_collective_feature
 
 
 def _get_df_collective_feature(dfst_feature, feature_param: CollectiveJitterFeatureParam):
-    df_collective_feature = dfst_feature.dropna().groupby('timestamp')[
-        collective_feature_columns_no_rolling].median().resample('1min').asfreq().ffill()
-    df_collective_feature['ch_std'] = dfst_feature.dropna().groupby('timestamp')[
-        ['ch']].std().resample('1min').asfreq().ffill().values
-    df_collective_feature[f'ch_window{feature_param.collective_window}_min'] = df_collective_feature.ch.rolling(
-        window=feature_param.collective_window).min()
-    df_collective_feature[f'ch_window{feature_param.collective_window}_max'] = df_collective_feature.ch.rolling(
-        window=feature_param.collective_window).max()
+    '''
+    the cross-sectional median of collective_feature_columns_no_rolling and the std of ch per timestamp
+    over the rows without nan, computed on timestamp x symbol matrices, then resampled to 1min and forward filled.
+    '''
+    is_valid_row = dfst_feature.notna().all(axis=1).to_numpy()
+    _, timestamp_codes, _, timestamps = algo.feature.util.cross_section.get_index_codes(dfst_feature)
+    is_valid_timestamp = np.bincount(timestamp_codes[is_valid_row], minlength=len(timestamps)) > 0
+
+    collective_features = {}
+    for column in collective_feature_columns_no_rolling:
+        matrix = algo.feature.util.cross_section.get_matrix(dfst_feature, column, mask=is_valid_row)
+        collective_features[column] = np.empty(matrix.shape[0])
+        algo.feature.util.cross_section.get_row_medians(matrix, collective_features[column])
+        if column == 'ch':
+            collective_features['ch_std'] = np.empty(matrix.shape[0])
+            algo.feature.util.cross_section.get_row_stds(matrix, 1, collective_features['ch_std'])
+        del matrix
+
+    df_collective_feature = pd.DataFrame(
+        {column: collective_features[column][is_valid_timestamp] for column in collective_feature_columns_no_rolling + ['ch_std']},
+        index=pd.Index(timestamps[is_valid_timestamp], name='timestamp')).sort_index()
+    df_collective_feature = df_collective_feature.resample('1min').asfreq().ffill()
+
+    ch = df_collective_feature.ch.to_numpy(dtype=np.float64)
+    df_collective_feature[f'ch_window{feature_param.collective_window}_min'] = algo.feature.util.rolling.get_rolling_min(ch, feature_param.collective_window)
+    df_collective_feature[f'ch_window{feature_param.collective_window}_max'] = algo.feature.util.rolling.get_rolling_max(ch, feature_param.collective_window)
     return df_collective_feature
-
@@ -3,7 +3,9 @@ import datetime
 import pandas as pd, numpy as np
 from collections import defaultdict
 from collections import deque
+from numba import njit
 import algo.feature.util.jitter_common
+import algo.feature.util.time_window
 
 default_symbols = ("BTC-USDT-SWAP", "ETH-USDT-SWAP")
 default_window_minutes = 60 * 24
@@ -22,25 +24,25 @@ class CryptoTemperatureFeatureParam:
         return ', '.join([f'{k}: {v}' for k, v in vars(self).items()])
 
 
-def get_feature_df(dfs, feature_param: CryptoTemperatureFeatureParam, value_column='close'):
-    rows = []
-    minimum_input_window_size = min(10, feature_param.window_minutes)
-    input_window_rows = deque()
-    for timestamp, row in dfs.iterrows():
-        input_window_rows.append((timestamp, row[value_column],))
-        last_timestamp = input_window_rows[-1][0]
-        while last_timestamp - input_window_rows[0][0] > datetime.timedelta(minutes=feature_param.window_minutes):
-            input_window_rows.popleft()
-
-        if len(input_window_rows) < minimum_input_window_size:
-            rows.append(None)
+@njit
+def get_ch_series(values, heads, minimum_input_window_size, out):
+    '''
+    fills out with the ch from the head to the last of the window values[heads[i]:i + 1] at i.
+    the windows shorter than minimum_input_window_size are nan.
+    '''
+    for i in range(values.shape[0]):
+        if i + 1 - heads[i] < minimum_input_window_size:
+            out[i] = np.nan
             continue
+        out[i] = algo.feature.util.jitter_common.get_ch_scalar(values[heads[i]], values[i])
 
-        ch = algo.feature.util.jitter_common.get_ch(input_window_rows[0][1], input_window_rows[-1][1])
-        values = {
-            'ch': ch,
-        }
-        rows.append(values)
-
-    return algo.feature.util.jitter_common.rows_to_dataframe(rows, dfs.index)
 
+def get_feature_df(dfs, feature_param: CryptoTemperatureFeatureParam, value_column='close'):
+    '''
+    dfs is indexed by the timestamps in ascending order.
+    '''
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    heads = algo.feature.util.time_window.get_window_heads_for_index(dfs.index, feature_param.window_minutes)
+    out = np.empty(values.shape[0])
+    get_ch_series(values, heads, algo.feature.util.time_window.get_minimum_window_size(feature_param.window_minutes), out)
+    return pd.DataFrame({'ch': out}, index=dfs.index, copy=False)
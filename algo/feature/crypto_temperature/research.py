@@ -1,4 +1,5 @@
 import algo.feature.crypto_temperature.calculate
+import algo.feature.util.assembly
 import algo.feature.util.research
 from algo.feature.crypto_temperature.calculate import CryptoTemperatureFeatureParam
 
@@ -17,28 +18,22 @@ def _get_usdt_symbol_filter():
 
 
 
-def get_dfst_feature(df, feature_param: CryptoTemperatureFeatureParam, symbol_filter=None, value_column='close'):
-    dfi = df.set_index(['timestamp', 'symbol'])
+def get_dfst_feature(df, feature_param: CryptoTemperatureFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
     symbols = feature_param.symbols
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
     symbols = [s for s in symbols if symbol_filter(s)]
     print(f'symbols: {len(symbols)}')
 
-    dfst_feature = df.set_index(['symbol', 'timestamp'])
-    for i, symbol in enumerate(symbols):
-        dfs = dfi.xs(symbol, level=1)
-
-        df_feature = algo.feature.crypto_temperature.calculate.get_feature_df(dfs, feature_param, value_column=value_column)
-        del dfs
-
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
+    feature_arrays = {}
+    for i, (symbol, df_feature) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+            symbol_blocks, symbols, algo.feature.crypto_temperature.calculate.get_feature_df, feature_param, value_column=value_column, n_workers=n_workers)):
         print(f'{i} symbol: {symbol} ({_feature_label_prefix})')
-
-        for column in df_feature.columns:
-            dfst_feature.loc[symbol, column] = df_feature[column].values
-
+        symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
         del df_feature
 
+    dfst_feature = symbol_blocks.get_dfst(feature_arrays)
     return dfst_feature
 
 '''
@@ -0,0 +1,116 @@
+import typing
+from collections import defaultdict
+import pandas as pd
+import algo.feature.registry
+import algo.feature.util.assembly
+import algo.feature.util.research
+import algo.feature.util.time_window
+import algo.util.compact
+
+
+def _get_usdt_symbol_filter():
+    return lambda s: 'USDT' in s
+
+
+class _SymbolPlan:
+    '''
+    the kernel params per feature spec name to compute for a symbol, picklable for the process pool.
+    '''
+    def __init__(self, kernel_params_per_spec: typing.List[typing.Tuple[str, typing.List]], chunk_size: typing.Optional[int]):
+        self.kernel_params_per_spec = kernel_params_per_spec
+        self.chunk_size = chunk_size
+
+
+def get_feature_dfs_chunked(spec, dfs, kernel_params, lookbacks, chunk_size=None, value_column='close'):
+    '''
+    spec.get_feature_dfs over the rows of dfs in chunks of chunk_size rows, each preceded by the rows of the lookbacks.
+    the rows of the lookback are dropped from the result of a chunk, so that the chunks concatenate into the same result
+    as the whole dfs, for a feature depending only on its lookback.
+    '''
+    if chunk_size is None or len(dfs) <= chunk_size:
+        return spec.get_feature_dfs(dfs, kernel_params, value_column=value_column)
+
+    timestamps = algo.feature.util.time_window.get_epoch_nanos(dfs.index)
+    df_feature_chunks = [[] for _ in kernel_params]
+    for head in range(0, len(dfs), chunk_size):
+        lookback_head = min([lookback.get_head(timestamps, head) for lookback in lookbacks])
+        df_features = spec.get_feature_dfs(dfs.iloc[lookback_head:head + chunk_size], kernel_params, value_column=value_column)
+        for chunks, df_feature in zip(df_feature_chunks, df_features):
+            chunks.append(df_feature.iloc[head - lookback_head:])
+        del df_features
+    return [pd.concat(chunks) for chunks in df_feature_chunks]
+
+
+def _get_symbol_feature_dfs(dfs, symbol_plan: _SymbolPlan, value_column='close'):
+    '''
+    the df_features of a symbol for all the kernel params of symbol_plan, flattened in its order.
+    '''
+    df_features = []
+    for name, feature_params in symbol_plan.kernel_params_per_spec:
+        spec = algo.feature.registry.get_spec_by_name(name)
+        kernel_params = [spec.get_kernel_param(feature_param) for feature_param in feature_params]
+        lookbacks = [spec.get_lookback(feature_param) for feature_param in feature_params]
+        df_features += get_feature_dfs_chunked(
+            spec, dfs, kernel_params, lookbacks, chunk_size=symbol_plan.chunk_size, value_column=value_column)
+    return df_features
+
+
+def get_dfst_features(df, feature_params: typing.List, symbol_filter=None, value_column='close', n_workers=1, chunk_size=None, compact=False):
+    '''
+    computes any combination of the registered features (see algo.feature.registry) in one pass over the symbols.
+    returns the dfst_feature for each of feature_params, in the same order.
+
+    the params computing the same symbols share the pass, the params of the same feature share a batch kernel call per symbol,
+    n_workers > 1 computes the symbols in a process pool of that size,
+    chunk_size, if given, computes the rows of a symbol in chunks of that many rows (see get_feature_dfs_chunked),
+    and compact converts the output columns to their declared compact dtypes.
+    '''
+    if symbol_filter is None:
+        symbol_filter = _get_usdt_symbol_filter()
+    all_symbols = df.symbol.unique()
+    specs = [algo.feature.registry.get_spec(feature_param) for feature_param in feature_params]
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
+
+    positions_per_symbols = defaultdict(list)
+    for k, (spec, feature_param) in enumerate(zip(specs, feature_params)):
+        positions_per_symbols[tuple(spec.get_symbols(all_symbols, feature_param, symbol_filter))].append(k)
+
+    feature_arrays_per_param = [{} for _ in feature_params]
+    for symbols, positions in positions_per_symbols.items():
+        print(f'all_symbols: {len(symbols)} for {[specs[k].name for k in positions]}')
+        if len(symbols) == 0:
+            continue
+        positions_per_spec = defaultdict(list)
+        for k in positions:
+            positions_per_spec[specs[k].name].append(k)
+        symbol_plan = _SymbolPlan(
+            [(name, [feature_params[k] for k in spec_positions]) for name, spec_positions in positions_per_spec.items()],
+            chunk_size)
+        ordered_positions = [k for spec_positions in positions_per_spec.values() for k in spec_positions]
+
+        for i, (symbol, df_features) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+                symbol_blocks, list(symbols), _get_symbol_feature_dfs, symbol_plan, value_column=value_column, n_workers=n_workers)):
+            print(f'{i} symbol: {symbol} (feature)')
+            for k, df_feature in zip(ordered_positions, df_features):
+                symbol_blocks.write_feature(feature_arrays_per_param[k], symbol, df_feature)
+            del df_features
+
+    dfst_features = []
+    for spec, feature_param, feature_arrays in zip(specs, feature_params, feature_arrays_per_param):
+        dfst_feature = symbol_blocks.get_dfst(feature_arrays)
+        row_symbols = spec.get_row_symbols(all_symbols, feature_param)
+        if row_symbols is not None:
+            dfst_feature = dfst_feature[dfst_feature.index.get_level_values('symbol').isin(row_symbols)]
+            dfst_feature.index = dfst_feature.index.remove_unused_levels()
+        if spec.post_process is not None:
+            dfst_feature = spec.post_process(df, dfst_feature, feature_param, symbol_filter)
+        if compact:
+            dfst_feature = algo.util.compact.to_compact_dtypes(dfst_feature, spec.get_dtypes(feature_param))
+        dfst_features.append(dfst_feature)
+    return dfst_features
+
+
+def get_dfst_feature(df, feature_param, symbol_filter=None, value_column='close', n_workers=1, chunk_size=None, compact=False):
+    return get_dfst_features(
+        df, [feature_param], symbol_filter=symbol_filter, value_column=value_column,
+        n_workers=n_workers, chunk_size=chunk_size, compact=compact)[0]
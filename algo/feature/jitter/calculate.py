@@ -4,13 +4,21 @@ import numba
 from numba import njit
 from numba.experimental import jitclass
 import algo.feature.util.jitter_common
+import algo.feature.util.rolling
 
 default_window = 30
 default_window_longterm = 240
 
 class JitterFeatureParam:
-    def __init__(self, window):
+    def __init__(self, window, columns=None, prefilter_ratio=None):
+        '''
+        columns are the feature columns to compute and store, all of feature_columns if None.
+        prefilter_ratio, if given, skips the windows whose range (max - min) / min is below it,
+        which then have only value and ch, the other features being nan (see get_active_windows).
+        '''
         self.window = window
+        self.columns = columns
+        self.prefilter_ratio = prefilter_ratio
 
     @staticmethod
     def get_default_param():
@@ -26,10 +34,10 @@ class JitterFeatureParam:
         return ', '.join([f'{k}: {v}' for k, v in vars(self).items()])
 
 
-@njit
 def get_changes_1dim(values):
     '''
     values is a 1 dimensional array.
+    the scan of a single window in python, e.g. for the latest window of the live trading (the dict of the features can not be compiled).
     '''
     l = values.shape[0]
     if l < 1: return None
@@ -59,11 +67,11 @@ def get_changes_1dim(values):
         sum_v += v
         avg_v = sum_v * 1.0 / (i + 1)
 
-        ch_jump = algo.feature.util.jitter_common.get_ch(min_v, v)
-        ch_drop = algo.feature.util.jitter_common.get_ch(max_v, v)
+        ch_jump = algo.feature.util.jitter_common.get_ch_scalar(min_v, v)
+        ch_drop = algo.feature.util.jitter_common.get_ch_scalar(max_v, v)
 
-        ch = algo.feature.util.jitter_common.get_ch(first_v, v)
-        ch_since = algo.feature.util.jitter_common.get_ch(v, last_v)
+        ch = algo.feature.util.jitter_common.get_ch_scalar(first_v, v)
+        ch_since = algo.feature.util.jitter_common.get_ch_scalar(v, last_v)
 
         d = l - 1 - i
 
@@ -81,7 +89,7 @@ def get_changes_1dim(values):
 
     return {
         'value': values[-1],
-        'ch': algo.feature.util.jitter_common.get_ch(values[0], values[-1]),
+        'ch': algo.feature.util.jitter_common.get_ch_scalar(values[0], values[-1]),
         'ch_max': ch_max, 'ch_min': ch_min,
         'avg_v_before_max_ch': avg_v_before_max_ch,
         'avg_v_before_min_ch': avg_v_before_min_ch,
@@ -92,8 +100,309 @@ def get_changes_1dim(values):
     }
 
 
+feature_columns = [
+    'value', 'ch', 'ch_max', 'ch_min',
+    'avg_v_before_max_ch', 'avg_v_before_min_ch',
+    'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to',
+    'ch_since_max', 'ch_since_min', 'distance_max_ch', 'distance_min_ch',
+]
+# rows of the output of get_changes_series, in the order of feature_columns.
+_VALUE, _CH, _CH_MAX_COLUMN, _CH_MIN_COLUMN = 0, 1, 2, 3
+_AVG_V_BEFORE_MAX_CH, _AVG_V_BEFORE_MIN_CH = 4, 5
+_V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO = 6, 7, 8, 9
+_CH_SINCE_MAX, _CH_SINCE_MIN, _DISTANCE_MAX_CH, _DISTANCE_MIN_CH = 10, 11, 12, 13
+
+
+def get_feature_columns(columns=None):
+    '''
+    the columns of feature_columns that are in columns (all if None), in the order of feature_columns.
+    '''
+    if columns is None:
+        return list(feature_columns)
+    return [column for column in feature_columns if column in columns]
+
+
+def get_column_rows(columns=None):
+    '''
+    the row of each of feature_columns in the output of get_changes_series computing only columns, -1 if not computed.
+    '''
+    selected_columns = get_feature_columns(columns)
+    return np.array([selected_columns.index(column) if column in selected_columns else -1 for column in feature_columns], dtype=np.int64)
+
+
+# fields of a window aggregate. the indices are stored as float64 to keep the aggregate a single array.
+_MIN_V, _MIN_I, _MAX_V, _MAX_I = 0, 1, 2, 3
+_CH_MAX, _CH_MAX_I, _CH_MAX_FROM = 4, 5, 6
+_CH_MIN, _CH_MIN_I, _CH_MIN_FROM = 7, 8, 9
+_AGGREGATE_SIZE = 10
+
+
+@njit
+def _set_leaf_aggregate(values, i, out):
+    v = values[i]
+    out[_MIN_V], out[_MIN_I], out[_MAX_V], out[_MAX_I] = v, i, v, i
+    out[_CH_MAX], out[_CH_MAX_I], out[_CH_MAX_FROM] = 0.0, i, v
+    out[_CH_MIN], out[_CH_MIN_I], out[_CH_MIN_FROM] = 0.0, i, v
+
+
+@njit
+def _merge_aggregates(l, r, out):
+    '''
+    merges the aggregate of a segment l with the aggregate of the segment r that immediately follows it.
+    ties are resolved to the latest index, the same as the scan of get_changes_1dim.
+    out may be the same array as l or r.
+    '''
+    l_min_v, l_max_v = l[_MIN_V], l[_MAX_V]
+
+    # the jump of an element of r is measured from min(min of l, min of r up to the element).
+    ch_max_cross = algo.feature.util.jitter_common.get_ch_scalar(l_min_v, r[_MAX_V])
+    ch_max = max(l[_CH_MAX], r[_CH_MAX], ch_max_cross)
+    if r[_CH_MAX] == ch_max or ch_max_cross == ch_max:
+        i_r = r[_CH_MAX_I] if r[_CH_MAX] == ch_max else -1.0
+        i_cross = r[_MAX_I] if ch_max_cross == ch_max else -1.0
+        if i_r >= i_cross:
+            ch_max_i, ch_max_from = i_r, min(l_min_v, r[_CH_MAX_FROM])
+        else:
+            ch_max_i, ch_max_from = i_cross, l_min_v
+    else:
+        ch_max_i, ch_max_from = l[_CH_MAX_I], l[_CH_MAX_FROM]
+
+    ch_min_cross = algo.feature.util.jitter_common.get_ch_scalar(l_max_v, r[_MIN_V])
+    ch_min = min(l[_CH_MIN], r[_CH_MIN], ch_min_cross)
+    if r[_CH_MIN] == ch_min or ch_min_cross == ch_min:
+        i_r = r[_CH_MIN_I] if r[_CH_MIN] == ch_min else -1.0
+        i_cross = r[_MIN_I] if ch_min_cross == ch_min else -1.0
+        if i_r >= i_cross:
+            ch_min_i, ch_min_from = i_r, max(l_max_v, r[_CH_MIN_FROM])
+        else:
+            ch_min_i, ch_min_from = i_cross, l_max_v
+    else:
+        ch_min_i, ch_min_from = l[_CH_MIN_I], l[_CH_MIN_FROM]
+
+    if r[_MIN_V] <= l_min_v:
+        min_v, min_i = r[_MIN_V], r[_MIN_I]
+    else:
+        min_v, min_i = l_min_v, l[_MIN_I]
+    if r[_MAX_V] >= l_max_v:
+        max_v, max_i = r[_MAX_V], r[_MAX_I]
+    else:
+        max_v, max_i = l_max_v, l[_MAX_I]
+
+    out[_MIN_V], out[_MIN_I], out[_MAX_V], out[_MAX_I] = min_v, min_i, max_v, max_i
+    out[_CH_MAX], out[_CH_MAX_I], out[_CH_MAX_FROM] = ch_max, ch_max_i, ch_max_from
+    out[_CH_MIN], out[_CH_MIN_I], out[_CH_MIN_FROM] = ch_min, ch_min_i, ch_min_from
+
+
+@njit
+def get_block_aggregates(values, block, needed_blocks):
+    '''
+    splits values into blocks of the given size and returns, for every index,
+    the aggregate from the block head to the index (prefix), the aggregate from the index to the block tail (suffix)
+    and the sum of the values from the block head to the index.
+    only the blocks where needed_blocks are filled, the others are left uninitialized.
+
+    any range no longer than the block spans at most two blocks, thus its aggregate is
+    either a prefix or the merge of a suffix and a prefix.
+    '''
+    l = values.shape[0]
+    prefix = np.empty((l, _AGGREGATE_SIZE))
+    suffix = np.empty((l, _AGGREGATE_SIZE))
+    prefix_sum = np.empty(l)
+    leaf = np.empty(_AGGREGATE_SIZE)
+
+    for block_head in range(0, l, block):
+        if not needed_blocks[block_head // block]:
+            continue
+        block_tail = min(block_head + block, l)
+        for i in range(block_head, block_tail):
+            _set_leaf_aggregate(values, i, prefix[i])
+            if i == block_head:
+                prefix_sum[i] = values[i]
+            else:
+                _merge_aggregates(prefix[i - 1], prefix[i], prefix[i])
+                prefix_sum[i] = prefix_sum[i - 1] + values[i]
+
+        for i in range(block_tail - 1, block_head - 1, -1):
+            if i == block_tail - 1:
+                _set_leaf_aggregate(values, i, suffix[i])
+            else:
+                _set_leaf_aggregate(values, i, leaf)
+                _merge_aggregates(leaf, suffix[i + 1], suffix[i])
+
+    return prefix, suffix, prefix_sum
+
+
+@njit
+def get_needed_blocks(window, active):
+    '''
+    the blocks of the window size spanned by the active rolling windows.
+    '''
+    l = active.shape[0]
+    needed_blocks = np.zeros((l + window - 1) // window, dtype=np.bool_)
+    for i in range(l):
+        if active[i]:
+            needed_blocks[max(0, i - window + 1) // window] = True
+            needed_blocks[i // window] = True
+    return needed_blocks
+
+
+@njit
+def _get_range_sum(prefix_sum, block, head, tail):
+    '''
+    sum of the values in [head, tail] where the range spans at most two blocks.
+    '''
+    block_head = (tail // block) * block
+    if head >= block_head:
+        s = prefix_sum[tail]
+        if head > block_head:
+            s -= prefix_sum[head - 1]
+        return s
+
+    s = prefix_sum[block_head - 1]
+    if head % block != 0:
+        s -= prefix_sum[head - 1]
+    return s + prefix_sum[tail]
+
+
+@njit
+def get_range_aggregate(prefix, suffix, block, head, tail, out):
+    '''
+    the aggregate of [head, tail] where tail - head < block.
+    '''
+    block_head = (tail // block) * block
+    if head >= block_head:
+        out[:] = prefix[tail]
+    else:
+        _merge_aggregates(suffix[head], prefix[tail], out)
+
+
+@njit
+def _set(out, column_rows, column, i, v):
+    if column_rows[column] >= 0:
+        out[column_rows[column], i] = v
+
+
+@njit
+def fill_changes_at(values, prefix, suffix, prefix_sum, window, i, aggregate, column_rows, out):
+    '''
+    writes the features of get_changes_1dim for the rolling window ending at i into out[:, i], in O(1).
+    aggregate is a scratch array of _AGGREGATE_SIZE.
+    column_rows is the row in out of each of feature_columns (see get_column_rows), the columns with -1 are skipped.
+    '''
+    head = max(0, i - window + 1)
+    get_range_aggregate(prefix, suffix, window, head, i, aggregate)
+
+    first_v, last_v = values[head], values[i]
+    i_max_ch, i_min_ch = int(aggregate[_CH_MAX_I]), int(aggregate[_CH_MIN_I])
+
+    _set(out, column_rows, _VALUE, i, last_v)
+    _set(out, column_rows, _CH, i, algo.feature.util.jitter_common.get_ch_scalar(first_v, last_v))
+    _set(out, column_rows, _CH_MAX_COLUMN, i, aggregate[_CH_MAX])
+    _set(out, column_rows, _CH_MIN_COLUMN, i, aggregate[_CH_MIN])
+    if column_rows[_AVG_V_BEFORE_MAX_CH] >= 0:
+        _set(out, column_rows, _AVG_V_BEFORE_MAX_CH, i, _get_range_sum(prefix_sum, window, head, i_max_ch) / (i_max_ch - head + 1))
+    if column_rows[_AVG_V_BEFORE_MIN_CH] >= 0:
+        _set(out, column_rows, _AVG_V_BEFORE_MIN_CH, i, _get_range_sum(prefix_sum, window, head, i_min_ch) / (i_min_ch - head + 1))
+    _set(out, column_rows, _V_CH_MAX_IS_FROM, i, aggregate[_CH_MAX_FROM])
+    _set(out, column_rows, _V_CH_MIN_IS_FROM, i, aggregate[_CH_MIN_FROM])
+    _set(out, column_rows, _V_CH_MAX_IS_TO, i, values[i_max_ch])
+    _set(out, column_rows, _V_CH_MIN_IS_TO, i, values[i_min_ch])
+    _set(out, column_rows, _CH_SINCE_MAX, i, algo.feature.util.jitter_common.get_ch_scalar(values[i_max_ch], last_v))
+    _set(out, column_rows, _CH_SINCE_MIN, i, algo.feature.util.jitter_common.get_ch_scalar(values[i_min_ch], last_v))
+    _set(out, column_rows, _DISTANCE_MAX_CH, i, i - i_max_ch)
+    _set(out, column_rows, _DISTANCE_MIN_CH, i, i - i_min_ch)
+
+
+@njit
+def fill_quiet_changes_at(values, window, i, column_rows, out):
+    '''
+    writes value and ch for the rolling window ending at i, the other features are expected to be nan already.
+    '''
+    head = max(0, i - window + 1)
+    _set(out, column_rows, _VALUE, i, values[i])
+    _set(out, column_rows, _CH, i, algo.feature.util.jitter_common.get_ch_scalar(values[head], values[i]))
+
+
+@njit
+def get_active_windows(values, window, prefilter_ratio):
+    '''
+    whether each rolling window could have a ch_max or a -ch_min of prefilter_ratio or larger.
+    both are bounded by (max - min) / min of the window for the positive values,
+    thus a window with a smaller range (or a non-positive min) is quiet.
+    '''
+    rolling_min = algo.feature.util.rolling.get_rolling_min(values, window, partial=True)
+    rolling_max = algo.feature.util.rolling.get_rolling_max(values, window, partial=True)
+    active = np.empty(values.shape[0], dtype=np.bool_)
+    for i in range(values.shape[0]):
+        min_v, max_v = rolling_min[i], rolling_max[i]
+        active[i] = not (min_v > 0 and max_v - min_v < prefilter_ratio * min_v)
+    return active
+
+
+@njit
+def get_changes_series_filtered(values, window, active, column_rows, out):
+    '''
+    the same as get_changes_series for the windows where active, and fill_quiet_changes_at for the others.
+    the block aggregates are built only for the blocks the active windows span.
+    '''
+    prefix, suffix, prefix_sum = get_block_aggregates(values, window, get_needed_blocks(window, active))
+    aggregate = np.empty(_AGGREGATE_SIZE)
+    if not np.all(active):
+        out[:] = np.nan
+    for i in range(values.shape[0]):
+        if active[i]:
+            fill_changes_at(values, prefix, suffix, prefix_sum, window, i, aggregate, column_rows, out)
+        else:
+            fill_quiet_changes_at(values, window, i, column_rows, out)
+
+
+@njit
+def get_changes_series(values, window, column_rows, out):
+    '''
+    fills out, of shape (the number of the computed columns, len(values)), with the features of every rolling window of values
+    in a single call. the head rows use the shorter windows, the same as dfs.rolling(window).
+    '''
+    get_changes_series_filtered(values, window, np.ones(values.shape[0], dtype=np.bool_), column_rows, out)
+
+
+@njit
+def get_changes_multi_series(values, windows, actives, column_rows, out):
+    '''
+    fills out, of shape (len(windows), the largest number of the computed columns, len(values)), with get_changes_series_filtered for each window.
+    actives[k] and column_rows[k] are the active windows and the column rows of windows[k].
+    '''
+    for k in range(windows.shape[0]):
+        get_changes_series_filtered(values, windows[k], actives[k], column_rows[k], out[k])
+
+
+def _get_active_windows(values, feature_param):
+    if feature_param.prefilter_ratio is None:
+        return np.ones(values.shape[0], dtype=np.bool_)
+    return get_active_windows(values, feature_param.window, feature_param.prefilter_ratio)
+
+
 def get_feature_df(dfs, feature_param, value_column='close'):
-    window = feature_param.window
-    rows = [get_changes_1dim(np.array([v[0] for v in df_.to_numpy(dtype=np.float64)], dtype=np.float64)) for df_ in
-         dfs[[value_column]].rolling(window, min_periods=window)]
-    return algo.feature.util.jitter_common.rows_to_dataframe(rows, dfs.index)
\ No newline at end of file
+    '''
+    each window is aggregated from precomputed block aggregates rather than rescanned.
+    avg_v_before_* are summed in a different order than get_changes_1dim, thus can differ by float rounding.
+    only the feature_param.columns are computed, if given.
+    '''
+    columns = get_feature_columns(feature_param.columns)
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    out = np.empty((len(columns), values.shape[0]))
+    get_changes_series_filtered(values, feature_param.window, _get_active_windows(values, feature_param), get_column_rows(columns), out)
+    return pd.DataFrame(out.T, index=dfs.index, columns=columns, copy=False)
+
+
+def get_feature_dfs(dfs, feature_params, value_column='close'):
+    '''
+    the same as get_feature_df for each of feature_params, reading the values of dfs once.
+    '''
+    columns_per_param = [get_feature_columns(feature_param.columns) for feature_param in feature_params]
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    windows = np.array([feature_param.window for feature_param in feature_params], dtype=np.int64)
+    column_rows = np.array([get_column_rows(columns) for columns in columns_per_param], dtype=np.int64).reshape(len(feature_params), len(feature_columns))
+    actives = np.array([_get_active_windows(values, feature_param) for feature_param in feature_params], dtype=np.bool_).reshape(len(feature_params), values.shape[0])
+    out = np.empty((windows.shape[0], max([len(columns) for columns in columns_per_param], default=0), values.shape[0]))
+    get_changes_multi_series(values, windows, actives, column_rows, out)
+    return [pd.DataFrame(out_window[:len(columns)].T, index=dfs.index, columns=columns, copy=False) for out_window, columns in zip(out, columns_per_param)]
@@ -1,4 +1,6 @@
+import typing
 import algo.feature.jitter.calculate
+import algo.feature.util.assembly
 import algo.feature.util.research
 from algo.feature.jitter.calculate import JitterFeatureParam
 import matplotlib.pyplot as plt
@@ -16,26 +18,30 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close'):
-    dfi = df.set_index(['timestamp', 'symbol'])
+def get_dfst_feature(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
+    return get_dfst_features(df, [feature_param], symbol_filter=symbol_filter, value_column=value_column, n_workers=n_workers)[0]
+
+
+def get_dfst_features(df, feature_params: typing.List[JitterFeatureParam], symbol_filter=None, value_column='close', n_workers=1):
+    '''
+    computes the features for all of feature_params in one pass over the symbols.
+    returns the dfst_feature for each of feature_params, in the same order.
+    '''
     all_symbols = df.symbol.unique()
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
     all_symbols = [s for s in all_symbols if symbol_filter(s)]
     print(f'all_symbols: {len(all_symbols)}')
 
-    dfst_feature = df.set_index(['symbol', 'timestamp'])
-    for i, symbol in enumerate(all_symbols):
-        dfs = dfi.xs(symbol, level=1)
-
-        df_feature = algo.feature.jitter.calculate.get_feature_df(dfs, feature_param, value_column=value_column)
-        del dfs
-
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
+    feature_arrays_per_param = [{} for _ in feature_params]
+    for i, (symbol, df_features) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+            symbol_blocks, all_symbols, algo.feature.jitter.calculate.get_feature_dfs, feature_params, value_column=value_column, n_workers=n_workers)):
         print(f'{i} symbol: {symbol} ({_feature_label_prefix})')
 
-        for column in df_feature.columns:
-            dfst_feature.loc[symbol, column] = df_feature[column].values
+        for feature_arrays, df_feature in zip(feature_arrays_per_param, df_features):
+            symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
 
-        del df_feature
+        del df_features
 
-    return dfst_feature
\ No newline at end of file
+    return [symbol_blocks.get_dfst(feature_arrays) for feature_arrays in feature_arrays_per_param]
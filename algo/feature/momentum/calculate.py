@@ -9,13 +9,21 @@ default_ema_window = 60
 default_filter_out_non_gemini_symbol = False
 default_filter_out_reportable_symbols = False
 
+feature_columns = ['value', 'ema', 'ch', 'ch_ema', 'momentum']
+_VALUE, _EMA, _CH, _CH_EMA, _MOMENTUM = range(len(feature_columns))
+
 
 class MomentumFeatureParam:
-    def __init__(self, window: int, ema_window: int, filter_out_non_gemini_symbol: bool, filter_out_reportable_symbols:bool):
+    def __init__(self, window: int, ema_window: int, filter_out_non_gemini_symbol: bool, filter_out_reportable_symbols:bool, columns=None):
+        '''
+        columns are the feature columns (including rank and rank_descending) to store, all if None.
+        momentum is computed regardless for the ranks.
+        '''
         self.window = window
         self.ema_window = ema_window
         self.filter_out_non_gemini_symbol = filter_out_non_gemini_symbol
         self.filter_out_reportable_symbols = filter_out_reportable_symbols
+        self.columns = columns
 
     @staticmethod
     def get_default_param():
@@ -74,8 +82,59 @@ def get_momentum_1dim(values, ema_window):
     }
 
 
+@njit
+def _get_window_ema_tail(values, head, tail, alpha):
+    '''
+    the ema of values[head:tail] without the term of the seed values[head].
+    '''
+    x = 0.0
+    for k in range(head + 1, tail):
+        x = (1 - alpha) * x + alpha * values[k]
+    return x
+
+
+@njit
+def get_momentum_series(values, window, ema_window, out):
+    '''
+    fills out, of shape (len(feature_columns), len(values)), with get_momentum_1dim of every rolling window of values.
+    the head rows use the shorter windows, the same as dfs.rolling(window).
+
+    the ema of values[s:e + 1] seeded at values[s] is beta**(e - s) * values[s] + x(s, e),
+    where x(s, e) = alpha * sum(beta**(e - k) * values[k] for k in (s, e]) slides in O(1):
+    x(s + 1, e + 1) = beta * x(s, e) + alpha * values[e + 1] - alpha * beta**(window - 1) * values[s + 1].
+    a window with nan recomputes x from the window.
+    '''
+    alpha = 2 / float(ema_window + 1)
+    beta = 1 - alpha
+    beta_window = beta ** (window - 1)
+    x = 0.0
+    for e in range(values.shape[0]):
+        s = max(0, e - window + 1)
+        if e == 0:
+            x = 0.0
+        elif s == 0:
+            x = beta * x + alpha * values[e]
+        else:
+            x = beta * x + alpha * values[e] - alpha * beta_window * values[s]
+        if np.isnan(x):
+            x = _get_window_ema_tail(values, s, e + 1, alpha)
+
+        ema = beta ** (e - s) * values[s] + x
+        out[_VALUE, e] = values[e]
+        out[_EMA, e] = ema
+        out[_CH, e] = _get_ch(values[s], values[e])
+        out[_CH_EMA, e] = _get_ch(values[s], ema)
+        out[_MOMENTUM, e] = out[_CH_EMA, e]
+
+
 def get_feature_df(dfs, feature_param: MomentumFeatureParam, value_column='close'):
-    window = feature_param.window
-    return pd.DataFrame(
-        [get_momentum_1dim(np.array([v[0] for v in df_.to_numpy(dtype=np.float64)], dtype=np.float64), feature_param.ema_window) for df_ in
-         dfs[[value_column]].rolling(window, min_periods=window)], index=dfs.index)
+    '''
+    ema, ch_ema and momentum can differ from get_momentum_1dim by float rounding.
+    '''
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    out = np.empty((len(feature_columns), values.shape[0]))
+    get_momentum_series(values, feature_param.window, feature_param.ema_window, out)
+    df_feature = pd.DataFrame(out.T, index=dfs.index, columns=feature_columns, copy=False)
+    if feature_param.columns is not None:
+        df_feature = df_feature[[column for column in feature_columns if column in feature_param.columns or column == 'momentum']]
+    return df_feature
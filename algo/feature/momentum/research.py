@@ -1,6 +1,8 @@
 import pandas as pd
 from collections import defaultdict
 import algo.feature.momentum.calculate
+import algo.feature.util.assembly
+import algo.feature.util.cross_section
 import algo.feature.util.research
 import algo.util.symbol_filter
 from algo.feature.momentum.calculate import MomentumFeatureParam
@@ -17,7 +19,7 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, feature_param: MomentumFeatureParam, symbol_filter=None, value_column='close'):
+def get_dfst_feature(df, feature_param: MomentumFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
     if feature_param.filter_out_non_gemini_symbol:
         print(f'before filtering out any symbols: {len(df.symbol.unique())}')
         df = algo.util.symbol_filter.filter_out_non_gemini_symbol(df)
@@ -26,7 +28,6 @@ def get_dfst_feature(df, feature_param: MomentumFeatureParam, symbol_filter=None
         df = algo.util.symbol_filter.filter_out_reportable_symbols(df)
         print(f'after filtering out reportable symbols: {len(df.symbol.unique())}')
 
-    dfi = df.set_index(['timestamp', 'symbol'])
     all_symbols = df.symbol.unique()
     print(f'before applying the symbol_filter: {len(all_symbols)}')
     if symbol_filter is None:
@@ -34,23 +35,40 @@ def get_dfst_feature(df, feature_param: MomentumFeatureParam, symbol_filter=None
     all_symbols = [s for s in all_symbols if symbol_filter(s)]
     print(f'all_symbols: {len(all_symbols)}')
 
-    dfst_feature = df.set_index(['symbol', 'timestamp'])
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
     if len(all_symbols) == 0:
-        return dfst_feature
-    for i, symbol in enumerate(all_symbols):
-        dfs = dfi.xs(symbol, level=1)
+        return symbol_blocks.get_dfst({})
+    feature_arrays = {}
+    for i, (symbol, df_feature) in enumerate(algo.feature.util.research.iterate_feature_dfs(
+            symbol_blocks, all_symbols, algo.feature.momentum.calculate.get_feature_df, feature_param, value_column=value_column, n_workers=n_workers)):
+        print(f'{i} symbol: {symbol} (feature)')
+        symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
+        del df_feature
 
-        df_feature = algo.feature.momentum.calculate.get_feature_df(dfs, feature_param, value_column=value_column)
-        del dfs
+    dfst_feature = symbol_blocks.get_dfst(feature_arrays)
+    return append_ranks(dfst_feature, feature_param)
 
-        print(f'{i} symbol: {symbol} (feature)')
 
-        for column in df_feature.columns:
-            dfst_feature.loc[symbol, column] = df_feature[column].values
-        del df_feature
+def get_row_symbols(symbols, feature_param: MomentumFeatureParam):
+    '''
+    the symbols whose rows are kept in the dfst_feature, after filtering out the symbols by feature_param.
+    '''
+    if feature_param.filter_out_non_gemini_symbol:
+        symbols = [s for s in symbols if algo.util.symbol_filter.if_gemini_symbol(s)]
+    if feature_param.filter_out_reportable_symbols:
+        symbols = [s for s in symbols if not algo.util.symbol_filter.if_reportable_symbol(s)]
+    return list(symbols)
+
 
+def append_ranks(dfst_feature, feature_param: MomentumFeatureParam):
+    '''
+    appends the cross-sectional ranks of the momentum, then drops the columns not in feature_param.columns if given.
+    '''
     momentum_column_name = 'momentum'
-    dfst_feature['rank'] = dfst_feature.groupby('timestamp')[[momentum_column_name]].rank('average').rename(columns={momentum_column_name: 'rank'})
-    dfst_feature['rank_descending'] = dfst_feature.groupby('timestamp')[[momentum_column_name]].rank('average', ascending=False).rename(columns={momentum_column_name: 'rank_descending'})
+    dfst_feature['rank'], dfst_feature['rank_descending'] = algo.feature.util.cross_section.get_ranks(dfst_feature, momentum_column_name)
+    if feature_param.columns is not None:
+        unused_columns = [column for column in algo.feature.momentum.calculate.feature_columns + ['rank', 'rank_descending']
+                          if column in dfst_feature.columns and column not in feature_param.columns]
+        dfst_feature = dfst_feature.drop(columns=unused_columns)
     return dfst_feature
 
@@ -0,0 +1,215 @@
+import typing
+import numpy as np
+import algo.feature.jitter.calculate
+import algo.feature.jitter.research
+import algo.feature.simple_jitter.calculate
+import algo.feature.simple_jitter.research
+import algo.feature.momentum.calculate
+import algo.feature.momentum.research
+import algo.feature.timed_burst.calculate
+import algo.feature.timed_burst.research
+import algo.feature.std_off_trend.calculate
+import algo.feature.std_off_trend.research
+import algo.feature.crypto_temperature.calculate
+import algo.feature.crypto_temperature.research
+import algo.feature.collective_jitter.calculate
+import algo.feature.collective_jitter.research
+import algo.feature.util.research
+import algo.util.compact
+
+
+class Lookback:
+    '''
+    the history a feature row depends on: the rows preceding it, and the rows within minutes before it.
+    '''
+    def __init__(self, rows: int = 0, minutes: int = 0):
+        self.rows = rows
+        self.minutes = minutes
+
+    def get_head(self, timestamps: np.ndarray, i: int) -> int:
+        '''
+        the first row the feature at i depends on. timestamps are the int64 epoch nanoseconds in ascending order.
+        '''
+        head = max(0, i - self.rows)
+        if self.minutes > 0:
+            head = min(head, int(np.searchsorted(timestamps, timestamps[i] - np.int64(self.minutes * 60 * 1_000_000_000), side='left')))
+        return head
+
+    def __str__(self):
+        return ', '.join([f'{k}: {v}' for k, v in vars(self).items()])
+
+
+def _get_feature_dfs_func(get_feature_df_func):
+    def get_feature_dfs(dfs, feature_params, value_column='close'):
+        return [get_feature_df_func(dfs, feature_param, value_column=value_column) for feature_param in feature_params]
+    return get_feature_dfs
+
+
+class FeatureSpec:
+    '''
+    what the engine (algo.feature.engine) needs to know of a feature.
+
+    get_feature_dfs(dfs, kernel_params, value_column) is the batch kernel computing the features of a symbol for several params,
+    where the kernel param of a feature param is get_kernel_param(feature_param).
+    get_lookback(feature_param) is the Lookback of a row, with which the rows of a symbol can be computed in chunks.
+    get_columns(feature_param) are the output columns, and get_dtypes(feature_param) their compact dtypes (None to keep float64).
+    get_symbols(symbols, feature_param, symbol_filter) are the symbols to compute,
+    get_row_symbols(symbols, feature_param) the symbols whose rows are kept (None for all),
+    and post_process(df, dfst_feature, feature_param, symbol_filter) the cross-sectional stage after all the symbols are computed.
+    '''
+    def __init__(
+            self,
+            name: str,
+            param_class: type,
+            label_prefix: str,
+            get_feature_dfs: typing.Callable,
+            get_lookback: typing.Callable,
+            get_columns: typing.Callable,
+            get_kernel_param: typing.Optional[typing.Callable] = None,
+            get_symbols: typing.Optional[typing.Callable] = None,
+            get_row_symbols: typing.Optional[typing.Callable] = None,
+            post_process: typing.Optional[typing.Callable] = None,
+    ):
+        self.name = name
+        self.param_class = param_class
+        self.label_prefix = label_prefix
+        self.get_feature_dfs = get_feature_dfs
+        self.get_lookback = get_lookback
+        self.get_columns = get_columns
+        self.get_kernel_param = get_kernel_param if get_kernel_param is not None else lambda feature_param: feature_param
+        self.get_symbols = get_symbols if get_symbols is not None else lambda symbols, feature_param, symbol_filter: [s for s in symbols if symbol_filter(s)]
+        self.get_row_symbols = get_row_symbols if get_row_symbols is not None else lambda symbols, feature_param: None
+        self.post_process = post_process
+
+    def get_dtypes(self, feature_param) -> typing.Dict[str, typing.Optional[str]]:
+        return {column: algo.util.compact.get_compact_dtype(column) for column in self.get_columns(feature_param)}
+
+    def get_feature_label_for_caching(self, feature_param, label_suffix=None) -> str:
+        r = algo.feature.util.research.get_param_label_for_caching(feature_param, self.label_prefix, label_suffix=label_suffix)
+        return f'feature/{r}'
+
+
+_specs = {}
+
+
+def register(spec: FeatureSpec) -> None:
+    _specs[spec.name] = spec
+
+
+def get_spec_by_name(name: str) -> FeatureSpec:
+    return _specs[name]
+
+
+def get_spec(feature_param) -> FeatureSpec:
+    '''
+    the spec of the feature whose param class is the class of feature_param.
+    '''
+    for spec in _specs.values():
+        if type(feature_param) is spec.param_class:
+            return spec
+    raise ValueError(f'no feature is registered for {type(feature_param).__name__}')
+
+
+def get_names() -> typing.List[str]:
+    return list(_specs.keys())
+
+
+def get_feature_label_for_caching(feature_param, label_suffix=None) -> str:
+    return get_spec(feature_param).get_feature_label_for_caching(feature_param, label_suffix=label_suffix)
+
+
+def _get_collective_columns(feature_param):
+    collective_window = feature_param.collective_window
+    collective_columns = algo.feature.collective_jitter.research.collective_feature_columns_no_rolling + \
+        ['ch_std', f'ch_window{collective_window}_min', f'ch_window{collective_window}_max']
+    columns = algo.feature.jitter.calculate.feature_columns + [f'{column}_collective' for column in collective_columns]
+    if feature_param.columns is None:
+        return columns
+    return [column for column in columns if column in feature_param.columns]
+
+
+def _get_momentum_columns(feature_param):
+    columns = algo.feature.momentum.calculate.feature_columns + ['rank', 'rank_descending']
+    if feature_param.columns is None:
+        return columns
+    return [column for column in columns if column in feature_param.columns]
+
+
+def _post_process_momentum(df, dfst_feature, feature_param, symbol_filter):
+    if 'momentum' not in dfst_feature.columns:
+        return dfst_feature
+    return algo.feature.momentum.research.append_ranks(dfst_feature, feature_param)
+
+
+register(FeatureSpec(
+    name='jitter',
+    param_class=algo.feature.jitter.calculate.JitterFeatureParam,
+    label_prefix=algo.feature.jitter.research._feature_label_prefix,
+    get_feature_dfs=algo.feature.jitter.calculate.get_feature_dfs,
+    get_lookback=lambda feature_param: Lookback(rows=feature_param.window - 1),
+    get_columns=lambda feature_param: algo.feature.jitter.calculate.get_feature_columns(feature_param.columns),
+))
+
+register(FeatureSpec(
+    name='simple_jitter',
+    param_class=algo.feature.simple_jitter.calculate.SimpleJitterFeatureParam,
+    label_prefix=algo.feature.simple_jitter.research._feature_label_prefix,
+    get_feature_dfs=_get_feature_dfs_func(algo.feature.simple_jitter.calculate.get_feature_df),
+    get_lookback=lambda feature_param: Lookback(rows=feature_param.window * 2 - 1),
+    get_columns=lambda feature_param: [
+        column for column in algo.feature.simple_jitter.calculate.feature_columns
+        if feature_param.columns is None or column in feature_param.columns],
+))
+
+register(FeatureSpec(
+    name='momentum',
+    param_class=algo.feature.momentum.calculate.MomentumFeatureParam,
+    label_prefix=algo.feature.momentum.research._feature_label_prefix,
+    get_feature_dfs=_get_feature_dfs_func(algo.feature.momentum.calculate.get_feature_df),
+    get_lookback=lambda feature_param: Lookback(rows=feature_param.window - 1),
+    get_columns=_get_momentum_columns,
+    get_symbols=lambda symbols, feature_param, symbol_filter: [
+        s for s in algo.feature.momentum.research.get_row_symbols(symbols, feature_param) if symbol_filter(s)],
+    get_row_symbols=algo.feature.momentum.research.get_row_symbols,
+    post_process=_post_process_momentum,
+))
+
+register(FeatureSpec(
+    name='timed_burst',
+    param_class=algo.feature.timed_burst.calculate.TimedBurstFeatureParam,
+    label_prefix=algo.feature.timed_burst.research._feature_label_prefix,
+    get_feature_dfs=_get_feature_dfs_func(algo.feature.timed_burst.calculate.get_feature_df),
+    get_lookback=lambda feature_param: Lookback(minutes=feature_param.window_minutes),
+    get_columns=lambda feature_param: list(algo.feature.timed_burst.calculate.feature_columns),
+))
+
+register(FeatureSpec(
+    name='std_off_trend',
+    param_class=algo.feature.std_off_trend.calculate.StdOffTrendFeatureParam,
+    label_prefix=algo.feature.std_off_trend.research._feature_label_prefix,
+    get_feature_dfs=_get_feature_dfs_func(algo.feature.std_off_trend.calculate.get_feature_df),
+    get_lookback=lambda feature_param: Lookback(minutes=feature_param.window_minutes),
+    get_columns=lambda feature_param: list(algo.feature.std_off_trend.calculate.feature_columns),
+))
+
+register(FeatureSpec(
+    name='crypto_temperature',
+    param_class=algo.feature.crypto_temperature.calculate.CryptoTemperatureFeatureParam,
+    label_prefix=algo.feature.crypto_temperature.research._feature_label_prefix,
+    get_feature_dfs=_get_feature_dfs_func(algo.feature.crypto_temperature.calculate.get_feature_df),
+    get_lookback=lambda feature_param: Lookback(minutes=feature_param.window_minutes),
+    get_columns=lambda feature_param: ['ch'],
+    get_symbols=lambda symbols, feature_param, symbol_filter: [s for s in feature_param.symbols if symbol_filter(s)],
+))
+
+register(FeatureSpec(
+    name='collective_jitter',
+    param_class=algo.feature.collective_jitter.calculate.CollectiveJitterFeatureParam,
+    label_prefix=algo.feature.collective_jitter.research._feature_label_prefix,
+    get_feature_dfs=algo.feature.jitter.calculate.get_feature_dfs,
+    get_lookback=lambda feature_param: Lookback(rows=feature_param.window - 1),
+    get_columns=_get_collective_columns,
+    get_kernel_param=algo.feature.collective_jitter.research.get_jitter_feature_param,
+    post_process=lambda df, dfst_feature, feature_param, symbol_filter: algo.feature.collective_jitter.research.get_dfst_with_collective_feature(
+        df, dfst_feature, feature_param, symbol_filter=symbol_filter),
+))
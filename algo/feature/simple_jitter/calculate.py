@@ -1,14 +1,29 @@
 import pandas as pd, numpy as np
 from collections import defaultdict
 import algo.feature.util.jitter_common
+import algo.feature.util.rolling
 import numba
 from numba import njit
 
 default_window = 30
+_smooth_window = 3
+
+feature_columns = [
+    'value', 'ch', 'ch_max', 'ch_min', 'avg_v_before_max_ch', 'avg_v_before_min_ch',
+    'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to',
+    'distance_max_ch', 'distance_min_ch', 'expected_v',
+]
+_VALUE, _CH, _CH_MAX, _CH_MIN, _AVG_V_BEFORE_MAX_CH, _AVG_V_BEFORE_MIN_CH, \
+    _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO, \
+    _DISTANCE_MAX_CH, _DISTANCE_MIN_CH, _EXPECTED_V = range(len(feature_columns))
 
 class SimpleJitterFeatureParam:
-    def __init__(self, window):
+    def __init__(self, window, columns=None):
+        '''
+        columns are the feature columns to store, all of feature_columns if None.
+        '''
         self.window = window
+        self.columns = columns
 
     @staticmethod
     def get_default_param():
@@ -81,9 +96,108 @@ def get_changes_1dim(values, window: int):
     }
 
 
+@njit
+def _scan_changes_at(values, window, e, out):
+    '''
+    the jitter scan of get_changes_1dim over values[e - window + 1: e + 1], for the windows with non-positive values.
+    '''
+    last_v = values[e]
+    ch_max, ch_min = 0.0, 0.0
+    max_v, min_v = values[e - window + 1], values[e - window + 1]
+    sum_v = 0.0
+    out[_CH_MAX, e], out[_CH_MIN, e] = 0.0, 0.0
+    out[_DISTANCE_MAX_CH, e], out[_DISTANCE_MIN_CH, e] = 1, 1
+    out[_AVG_V_BEFORE_MAX_CH, e], out[_AVG_V_BEFORE_MIN_CH, e] = 0.0, 0.0
+    out[_V_CH_MAX_IS_FROM, e], out[_V_CH_MIN_IS_FROM, e] = max_v, min_v
+    out[_V_CH_MAX_IS_TO, e], out[_V_CH_MIN_IS_TO, e] = max_v, min_v
+    for i in range(window):
+        v = values[e - window + 1 + i]
+        min_v, max_v = min(min_v, v), max(max_v, v)
+        sum_v += v
+        avg_v = sum_v / (i + 1)
+        ch_jump = algo.feature.util.jitter_common.get_ch_scalar(min_v, last_v)
+        ch_drop = algo.feature.util.jitter_common.get_ch_scalar(max_v, last_v)
+        d = 2 * window - 1 - i
+        if ch_max <= ch_jump:
+            ch_max = ch_jump
+            out[_DISTANCE_MAX_CH, e], out[_CH_MAX, e] = d, ch_jump
+            out[_V_CH_MAX_IS_FROM, e], out[_V_CH_MAX_IS_TO, e] = min_v, last_v
+            out[_AVG_V_BEFORE_MAX_CH, e] = avg_v
+        if ch_min >= ch_drop:
+            ch_min = ch_drop
+            out[_DISTANCE_MIN_CH, e], out[_CH_MIN, e] = d, ch_drop
+            out[_V_CH_MIN_IS_FROM, e], out[_V_CH_MIN_IS_TO, e] = max_v, last_v
+            out[_AVG_V_BEFORE_MIN_CH, e] = avg_v
+
+
+@njit
+def _get_smoothed(values, head, smooth_head, smooth_tail):
+    sum_v = 0.0
+    for i in range(head + smooth_head, head + smooth_tail):
+        sum_v += values[i]
+    return sum_v / _smooth_window
+
+
+@njit
+def get_changes_series(values, window, past_smooth_bounds, first_smooth_bounds, out):
+    '''
+    fills out, of shape (len(feature_columns), len(values)), with get_changes_1dim of every rolling window of window * 2.
+    the rows before the first full window are nan.
+
+    for positive values the running min (max) only decreases (increases) over the scan, thus the last bar of the scan wins:
+    the jump (drop) is from the min (max) of the last window values to the last value, with the average of those values.
+    the smoothing bounds are the (head, tail) of the smoothing slices relative to the window * 2 window.
+    '''
+    l = values.shape[0]
+    full_window = window * 2
+    rolling_min = algo.feature.util.rolling.get_rolling_min(values, window)
+    rolling_max = algo.feature.util.rolling.get_rolling_max(values, window)
+    rolling_sum = algo.feature.util.rolling.get_rolling_sum(values, window)
+    out[:, :min(full_window - 1, l)] = np.nan
+    for e in range(full_window - 1, l):
+        head = e - full_window + 1
+        last_v = values[e]
+        out[_VALUE, e] = last_v
+        out[_CH, e] = algo.feature.util.jitter_common.get_ch_scalar(values[head], last_v)
+
+        min_v, max_v = rolling_min[e], rolling_max[e]
+        if min_v > 0:
+            avg_v = rolling_sum[e] / window
+            out[_CH_MAX, e] = algo.feature.util.jitter_common.get_ch_scalar(min_v, last_v)
+            out[_CH_MIN, e] = algo.feature.util.jitter_common.get_ch_scalar(max_v, last_v)
+            out[_AVG_V_BEFORE_MAX_CH, e], out[_AVG_V_BEFORE_MIN_CH, e] = avg_v, avg_v
+            out[_V_CH_MAX_IS_FROM, e], out[_V_CH_MIN_IS_FROM, e] = min_v, max_v
+            out[_V_CH_MAX_IS_TO, e], out[_V_CH_MIN_IS_TO, e] = last_v, last_v
+            out[_DISTANCE_MAX_CH, e], out[_DISTANCE_MIN_CH, e] = window, window
+        else:
+            _scan_changes_at(values, window, e, out)
+
+        past_v_smoothed = _get_smoothed(values, head, past_smooth_bounds[0], past_smooth_bounds[1])
+        first_v_smoothed = _get_smoothed(values, head, first_smooth_bounds[0], first_smooth_bounds[1])
+        out[_EXPECTED_V, e] = first_v_smoothed + (first_v_smoothed - past_v_smoothed)
+
+
+def _get_smooth_bounds(window):
+    '''
+    the (head, tail) of the slices values[:3] and values[-window - 1: -window + 2] in get_changes_1dim,
+    with the python slicing of the window * 2 values.
+    '''
+    full_window = window * 2
+    smooth_window_half = _smooth_window // 2
+    past = slice(None, _smooth_window).indices(full_window)
+    first = slice(-window - smooth_window_half, -window + _smooth_window - smooth_window_half).indices(full_window)
+    return np.array([past[0], max(past[0], past[1])], dtype=np.int64), np.array([first[0], max(first[0], first[1])], dtype=np.int64)
+
+
 def get_feature_df(dfs, feature_param, value_column='close'):
-    # twice the size to calculate extrapolation
-    full_window = feature_param.window * 2
-    rows = [get_changes_1dim(np.array([v[0] for v in df_.to_numpy(dtype=np.float64)], dtype=np.float64), feature_param.window) for df_ in
-         dfs[[value_column]].rolling(full_window, min_periods=full_window)]
-    return algo.feature.util.jitter_common.rows_to_dataframe(rows, dfs.index)
+    '''
+    avg_v_before_* are summed in a different order than get_changes_1dim, thus can differ by float rounding.
+    '''
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    out = np.empty((len(feature_columns), values.shape[0]))
+    past_smooth_bounds, first_smooth_bounds = _get_smooth_bounds(feature_param.window)
+    get_changes_series(values, feature_param.window, past_smooth_bounds, first_smooth_bounds, out)
+    df_feature = pd.DataFrame(out.T, index=dfs.index, columns=feature_columns, copy=False)
+    if feature_param.columns is not None:
+        df_feature = df_feature[[column for column in feature_columns if column in feature_param.columns]]
+    return df_feature
@@ -3,10 +3,16 @@ import datetime
 import pandas as pd, numpy as np
 from collections import defaultdict
 from collections import deque
+from numba import njit
 import algo.feature.util.jitter_common
+import algo.feature.util.moments
+import algo.feature.util.time_window
 
 default_window_minutes = 60 * 1
 
+feature_columns = ['value', 'std_off_trend', 'std_off_trend_to_value']
+_VALUE, _STD_OFF_TREND, _STD_OFF_TREND_TO_VALUE = range(len(feature_columns))
+
 
 class StdOffTrendFeatureParam:
     def __init__(self, window_minutes):
@@ -42,23 +48,42 @@ def get_std_off_trend(values):
     }
 
 
-def get_feature_df(dfs, feature_param: StdOffTrendFeatureParam, value_column='close'):
-    rows = []
-    minimum_input_window_size = min(10, feature_param.window_minutes)
-    input_window_rows = deque()
-    for timestamp, row in dfs.iterrows():
-        input_window_rows.append((timestamp, row[value_column],))
-        last_timestamp = input_window_rows[-1][0]
-        while last_timestamp - input_window_rows[0][0] > datetime.timedelta(minutes=feature_param.window_minutes):
-            input_window_rows.popleft()
-
-        if len(input_window_rows) < minimum_input_window_size:
-            rows.append(None)
+@njit(error_model='numpy')
+def get_std_off_trend_series(values, heads, minimum_input_window_size, out):
+    '''
+    fills out, of shape (len(feature_columns), len(values)), with get_std_off_trend(values[heads[i]:i + 1]) at i.
+    the windows shorter than minimum_input_window_size are nan.
+
+    with a = v - first_v, the squared deviation from the trend first_v + delta_v * j / l expands to
+    sum(a**2) - 2 * (delta_v / l) * sum(j * a) + (delta_v / l)**2 * sum(j**2), O(1) from the block moments.
+    it can differ from get_std_off_trend by float rounding.
+    '''
+    block = algo.feature.util.moments.get_block_size(heads)
+    prefix_w, prefix_w2, prefix_tw = algo.feature.util.moments.get_block_moments(values, block)
+    for i in range(values.shape[0]):
+        head = heads[i]
+        l = i + 1 - head
+        if l < minimum_input_window_size:
+            out[:, i] = np.nan
             continue
 
-        vs = [p[1] for p in input_window_rows]
-        feature = get_std_off_trend(np.array(vs))
-        rows.append(feature)
+        s_a, s_a2, s_ja = algo.feature.util.moments.get_range_moments(values, prefix_w, prefix_w2, prefix_tw, block, head, i + 1)
+        slope = (values[i] - values[head]) / l
+        s_j2 = (l - 1) * l * (2 * l - 1) / 6.0
+        dev_sum = max(s_a2 - 2 * slope * s_ja + slope * slope * s_j2, 0.0)
 
-    return algo.feature.util.jitter_common.rows_to_dataframe(rows, dfs.index)
+        std_off_trend = np.sqrt(dev_sum / (l - 1))
+        out[_VALUE, i] = values[i]
+        out[_STD_OFF_TREND, i] = std_off_trend
+        out[_STD_OFF_TREND_TO_VALUE, i] = std_off_trend / values[i]
 
+
+def get_feature_df(dfs, feature_param: StdOffTrendFeatureParam, value_column='close'):
+    '''
+    dfs is indexed by the timestamps in ascending order.
+    '''
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    heads = algo.feature.util.time_window.get_window_heads_for_index(dfs.index, feature_param.window_minutes)
+    out = np.empty((len(feature_columns), values.shape[0]))
+    get_std_off_trend_series(values, heads, algo.feature.util.time_window.get_minimum_window_size(feature_param.window_minutes), out)
+    return pd.DataFrame(out.T, index=dfs.index, columns=feature_columns, copy=False)
@@ -11,6 +11,6 @@ def get_feature_label_for_caching(feature_param: StdOffTrendFeatureParam, label_
     return f'feature/{r}'
 
 
-def get_dfst_feature(df, feature_param: StdOffTrendFeatureParam, symbol_filter=None, value_column='close'):
+def get_dfst_feature(df, feature_param: StdOffTrendFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
     return algo.feature.util.research.get_dfst_feature(
-        df, algo.feature.std_off_trend.calculate.get_feature_df, feature_param, _feature_label_prefix, symbol_filter=symbol_filter, value_column='close')
+        df, algo.feature.std_off_trend.calculate.get_feature_df, feature_param, _feature_label_prefix, symbol_filter=symbol_filter, value_column='close', n_workers=n_workers)
@@ -3,10 +3,22 @@ import datetime
 import pandas as pd, numpy as np
 from collections import deque
 import algo.feature.util.jitter_common
+import algo.feature.util.moments
+import algo.feature.util.time_window
 import numba
 from numba import njit
 
 default_window_minutes = 5
+_smooth_window = 3
+
+feature_columns = [
+    'value', 'ch', 'ch_max', 'ch_min', 'avg_v_before_max_ch', 'avg_v_before_min_ch',
+    'v_ch_max_is_from', 'v_ch_min_is_from', 'v_ch_max_is_to', 'v_ch_min_is_to',
+    'distance_max_ch', 'distance_min_ch', 'stdev_before_max_head', 'stdev_before_min_head', 'expected_v',
+]
+_VALUE, _CH, _CH_MAX, _CH_MIN, _AVG_V_BEFORE_MAX_CH, _AVG_V_BEFORE_MIN_CH, \
+    _V_CH_MAX_IS_FROM, _V_CH_MIN_IS_FROM, _V_CH_MAX_IS_TO, _V_CH_MIN_IS_TO, \
+    _DISTANCE_MAX_CH, _DISTANCE_MIN_CH, _STDEV_BEFORE_MAX_HEAD, _STDEV_BEFORE_MIN_HEAD, _EXPECTED_V = range(len(feature_columns))
 
 class TimedBurstFeatureParam:
     def __init__(self, window_minutes):
@@ -91,21 +103,94 @@ def get_feature_for_window(values):
     }
 
 
-def get_feature_df(dfs, feature_param: TimedBurstFeatureParam, value_column='close'):
-    rows = []
-    minimum_input_window_size = min(10, feature_param.window_minutes)
-    input_window_rows = deque()
-    for timestamp, row in dfs.iterrows():
-        input_window_rows.append((timestamp, row[value_column],))
-        last_timestamp = input_window_rows[-1][0]
-        while last_timestamp - input_window_rows[0][0] > datetime.timedelta(minutes=feature_param.window_minutes):
-            input_window_rows.popleft()
-
-        if len(input_window_rows) < minimum_input_window_size:
-            rows.append(None)
-            continue
+@njit
+def _get_sum(values, head, tail):
+    sum_v = 0.0
+    for i in range(head, tail):
+        sum_v += values[i]
+    return sum_v
+
+
+@njit(error_model='numpy')
+def fill_feature_for_window(values, moments, block, head, tail, out_i):
+    '''
+    fills out_i, of shape (len(feature_columns),), with get_feature_for_window(values[head:tail]).
+    moments are the block moments of values for the stdev before the heads in O(1),
+    which can differ from np.std by float rounding.
+    '''
+    l = tail - head
+    first_v, last_v = values[head], values[tail - 1]
+    ch_max, ch_min = 0.0, 0.0
+    distance_max_ch, distance_min_ch = 1, 1
+    max_v, min_v = first_v, first_v
+    sum_v = 0.0
+    out_i[_AVG_V_BEFORE_MAX_CH], out_i[_AVG_V_BEFORE_MIN_CH] = 0.0, 0.0
+    out_i[_V_CH_MAX_IS_FROM], out_i[_V_CH_MIN_IS_FROM] = max_v, min_v
+    out_i[_V_CH_MAX_IS_TO], out_i[_V_CH_MIN_IS_TO] = max_v, min_v
+
+    for i in range(l):
+        v = values[head + i]
+        min_v, max_v = min(min_v, v), max(max_v, v)
+        sum_v += v
+        avg_v = sum_v / (i + 1)
+
+        ch_jump = algo.feature.util.jitter_common.get_ch_scalar(min_v, last_v)
+        ch_drop = algo.feature.util.jitter_common.get_ch_scalar(max_v, last_v)
+
+        d = l - 1 - i
+
+        if ch_max <= ch_jump:
+            distance_max_ch, ch_max = d, ch_jump
+            out_i[_V_CH_MAX_IS_FROM], out_i[_V_CH_MAX_IS_TO] = min_v, last_v
+            out_i[_AVG_V_BEFORE_MAX_CH] = avg_v
+
+        if ch_min >= ch_drop:
+            distance_min_ch, ch_min = d, ch_drop
+            out_i[_V_CH_MIN_IS_FROM], out_i[_V_CH_MIN_IS_TO] = max_v, last_v
+            out_i[_AVG_V_BEFORE_MIN_CH] = avg_v
+
+    smooth_window_half = _smooth_window // 2
+    past_head, past_tail = algo.feature.util.time_window.get_slice_bounds(l, 0, _smooth_window)
+    first_head, first_tail = algo.feature.util.time_window.get_slice_bounds(l, -smooth_window_half, _smooth_window - smooth_window_half)
+    past_v_smoothed = _get_sum(values, head + past_head, head + past_tail) / _smooth_window
+    first_v_smoothed = _get_sum(values, head + first_head, head + first_tail) / _smooth_window
+
+    _, max_head_tail = algo.feature.util.time_window.get_slice_bounds(l, 0, l - 1 - distance_max_ch)
+    _, min_head_tail = algo.feature.util.time_window.get_slice_bounds(l, 0, l - 1 - distance_min_ch)
+
+    out_i[_VALUE] = last_v
+    out_i[_CH] = algo.feature.util.jitter_common.get_ch_scalar(first_v, last_v)
+    out_i[_CH_MAX], out_i[_CH_MIN] = ch_max, ch_min
+    out_i[_DISTANCE_MAX_CH], out_i[_DISTANCE_MIN_CH] = distance_max_ch, distance_min_ch
+    prefix_w, prefix_w2, prefix_tw = moments
+    out_i[_STDEV_BEFORE_MAX_HEAD] = algo.feature.util.moments.get_range_std(values, prefix_w, prefix_w2, prefix_tw, block, head, head + max_head_tail)
+    out_i[_STDEV_BEFORE_MIN_HEAD] = algo.feature.util.moments.get_range_std(values, prefix_w, prefix_w2, prefix_tw, block, head, head + min_head_tail)
+    out_i[_EXPECTED_V] = first_v_smoothed + (first_v_smoothed - past_v_smoothed)
 
-        rows.append(get_feature_for_window(np.array([p[1] for p in input_window_rows])))
 
-    return algo.feature.util.jitter_common.rows_to_dataframe(rows, dfs.index)
+@njit
+def get_features_series(values, heads, minimum_input_window_size, out):
+    '''
+    fills out, of shape (len(feature_columns), len(values)), with the feature of the window values[heads[i]:i + 1] at i.
+    the windows shorter than minimum_input_window_size are nan.
+    '''
+    out_i = np.empty(out.shape[0])
+    block = algo.feature.util.moments.get_block_size(heads)
+    moments = algo.feature.util.moments.get_block_moments(values, block)
+    for i in range(values.shape[0]):
+        if i + 1 - heads[i] < minimum_input_window_size:
+            out[:, i] = np.nan
+            continue
+        fill_feature_for_window(values, moments, block, heads[i], i + 1, out_i)
+        out[:, i] = out_i
 
+
+def get_feature_df(dfs, feature_param: TimedBurstFeatureParam, value_column='close'):
+    '''
+    dfs is indexed by the timestamps in ascending order.
+    '''
+    values = dfs[value_column].to_numpy(dtype=np.float64)
+    heads = algo.feature.util.time_window.get_window_heads_for_index(dfs.index, feature_param.window_minutes)
+    out = np.empty((len(feature_columns), values.shape[0]))
+    get_features_series(values, heads, algo.feature.util.time_window.get_minimum_window_size(feature_param.window_minutes), out)
+    return pd.DataFrame(out.T, index=dfs.index, columns=feature_columns, copy=False)
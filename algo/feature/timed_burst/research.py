@@ -15,6 +15,6 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, feature_param: TimedBurstFeatureParam, symbol_filter=None, value_column='close'):
+def get_dfst_feature(df, feature_param: TimedBurstFeatureParam, symbol_filter=None, value_column='close', n_workers=1):
     return algo.feature.util.research.get_dfst_feature(
-        df, algo.feature.timed_burst.calculate.get_feature_df, feature_param, _feature_label_prefix, symbol_filter=symbol_filter, value_column='close')
+        df, algo.feature.timed_burst.calculate.get_feature_df, feature_param, _feature_label_prefix, symbol_filter=symbol_filter, value_column='close', n_workers=n_workers)
@@ -0,0 +1,57 @@
+import typing
+import pandas as pd, numpy as np
+
+
+class SymbolBlocks:
+    '''
+    the market data sorted by symbol (keeping the order of the rows within a symbol),
+    so that the rows of each symbol are a contiguous block [head, tail).
+
+    the features are written to preallocated columns by the block offsets,
+    then assembled into a (symbol, timestamp) indexed frame without per-symbol .loc writes.
+    '''
+    def __init__(self, df):
+        codes, symbols = pd.factorize(df.symbol)
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(symbols))
+        tails = np.cumsum(counts)
+        heads = tails - counts
+
+        self.df = df.take(order).reset_index(drop=True)
+        timestamp_codes, timestamps = pd.factorize(self.df.timestamp)
+        self.index = pd.MultiIndex(
+            levels=[symbols, timestamps], codes=[codes[order], timestamp_codes],
+            names=['symbol', 'timestamp'], verify_integrity=False)
+        self.blocks = {symbol: (head, tail) for symbol, head, tail in zip(symbols, heads, tails)}
+
+    def __len__(self):
+        return len(self.df)
+
+    def get_dfs(self, symbol, value_column='close'):
+        '''
+        the frame of a symbol indexed by timestamp, with the value_column only.
+        '''
+        head, tail = self.blocks[symbol]
+        return pd.DataFrame(
+            {value_column: self.df[value_column].to_numpy()[head:tail]},
+            index=pd.Index(self.df.timestamp.array[head:tail], name='timestamp', copy=False), copy=False)
+
+    def write_feature(self, feature_arrays: typing.Dict[str, np.ndarray], symbol, df_feature) -> None:
+        '''
+        writes the columns of df_feature into the block of the symbol in feature_arrays,
+        allocating a nan-filled column for a feature column seen for the first time.
+        '''
+        head, tail = self.blocks[symbol]
+        for column in df_feature.columns:
+            if column not in feature_arrays:
+                feature_arrays[column] = np.full(len(self), np.nan)
+            feature_arrays[column][head:tail] = df_feature[column].to_numpy(dtype=np.float64)
+
+    def get_dfst(self, feature_arrays: typing.Dict[str, np.ndarray]):
+        '''
+        the market data and the feature columns indexed by (symbol, timestamp).
+        a feature column replaces the market data column of the same name.
+        '''
+        columns = {column: self.df[column].to_numpy() for column in self.df.columns if column not in ('symbol', 'timestamp')}
+        columns.update(feature_arrays)
+        return pd.DataFrame(columns, index=self.index, copy=False)
@@ -0,0 +1,109 @@
+import numpy as np
+from numba import njit
+
+
+@njit
+def get_row_ranks(matrix, ranks, ranks_descending):
+    '''
+    fills ranks and ranks_descending with the average rank (1-based) of each row of matrix, ascending and descending.
+    nan is not ranked and stays nan, the same as the pandas rank('average').
+    '''
+    n_columns = matrix.shape[1]
+    valid = np.empty(n_columns, dtype=np.int64)
+    for t in range(matrix.shape[0]):
+        row = matrix[t]
+        ranks[t, :] = np.nan
+        ranks_descending[t, :] = np.nan
+        count = 0
+        for j in range(n_columns):
+            if not np.isnan(row[j]):
+                valid[count] = j
+                count += 1
+        if count == 0:
+            continue
+        valid_columns = valid[:count]
+        order = valid_columns[np.argsort(row[valid_columns], kind='mergesort')]
+        head = 0
+        while head < count:
+            tail = head + 1
+            while tail < count and row[order[tail]] == row[order[head]]:
+                tail += 1
+            rank = (head + tail + 1) / 2.0
+            for k in range(head, tail):
+                ranks[t, order[k]] = rank
+                ranks_descending[t, order[k]] = count + 1 - rank
+            head = tail
+
+
+@njit
+def get_row_medians(matrix, out):
+    '''
+    fills out with the median of the non-nan values of each row of matrix, nan for a row without any.
+    '''
+    buffer = np.empty(matrix.shape[1])
+    for t in range(matrix.shape[0]):
+        count = 0
+        for j in range(matrix.shape[1]):
+            if not np.isnan(matrix[t, j]):
+                buffer[count] = matrix[t, j]
+                count += 1
+        out[t] = np.median(buffer[:count]) if count > 0 else np.nan
+
+
+@njit
+def get_row_stds(matrix, ddof, out):
+    '''
+    fills out with the std of the non-nan values of each row of matrix, nan for a row with ddof values or fewer.
+    '''
+    for t in range(matrix.shape[0]):
+        count, sum_v = 0, 0.0
+        for j in range(matrix.shape[1]):
+            if not np.isnan(matrix[t, j]):
+                count += 1
+                sum_v += matrix[t, j]
+        if count <= ddof:
+            out[t] = np.nan
+            continue
+        mean_v = sum_v / count
+        dev_sum = 0.0
+        for j in range(matrix.shape[1]):
+            if not np.isnan(matrix[t, j]):
+                dev_sum += (matrix[t, j] - mean_v) ** 2
+        out[t] = np.sqrt(dev_sum / (count - ddof))
+
+
+def get_index_codes(dfst):
+    '''
+    the (symbol codes, timestamp codes, symbols, timestamps) of dfst indexed by (symbol, timestamp).
+    '''
+    symbol_level, timestamp_level = dfst.index.names.index('symbol'), dfst.index.names.index('timestamp')
+    return dfst.index.codes[symbol_level], dfst.index.codes[timestamp_level], dfst.index.levels[symbol_level], dfst.index.levels[timestamp_level]
+
+
+def get_matrix(dfst, column, mask=None):
+    '''
+    the column of dfst indexed by (symbol, timestamp) as a timestamp x symbol matrix, by the codes of the index.
+    the rows not in mask and the missing (symbol, timestamp) are nan.
+    '''
+    symbol_codes, timestamp_codes, symbols, timestamps = get_index_codes(dfst)
+    values = dfst[column].to_numpy(dtype=np.float64)
+    if mask is not None:
+        symbol_codes, timestamp_codes, values = symbol_codes[mask], timestamp_codes[mask], values[mask]
+    matrix = np.full((len(timestamps), len(symbols)), np.nan)
+    matrix[timestamp_codes, symbol_codes] = values
+    return matrix
+
+
+def get_ranks(dfst, column):
+    '''
+    the cross-sectional (per timestamp) average ranks of the column of dfst indexed by (symbol, timestamp),
+    ascending and descending, aligned with the rows of dfst.
+
+    the column is scattered into a timestamp x symbol matrix by the codes of the index, ranked row by row,
+    then gathered back, hence a (symbol, timestamp) is expected to be unique.
+    '''
+    symbol_codes, timestamp_codes, _, _ = get_index_codes(dfst)
+    matrix = get_matrix(dfst, column)
+    ranks, ranks_descending = np.empty_like(matrix), np.empty_like(matrix)
+    get_row_ranks(matrix, ranks, ranks_descending)
+    return ranks[timestamp_codes, symbol_codes], ranks_descending[timestamp_codes, symbol_codes]
@@ -10,6 +10,13 @@ def get_ch(v1: np.array, v2: np.array) -> np.array:
     return np.where(v1 != 0, (v2 - v1) / v1, 0)
 
 
+@njit
+def get_ch_scalar(v1: float, v2: float) -> float:
+    if v1 == 0:
+        return 0.0
+    return (v2 - v1) / v1
+
+
 def rows_to_dataframe(rows: typing.List, index):
     null_row_vals = {}
     for r in rows:
@@ -0,0 +1,92 @@
+import numpy as np
+from numba import njit
+
+
+'''
+the sums of a, a**2 and j * a over a range values[head:tail] in O(1),
+where a = values[k] - values[head] and j = k - head.
+
+the prefix sums restart at every block and are taken of the values shifted by the first value of the block,
+so that their magnitude (thus the cancellation error) is bounded by the block rather than by the whole series.
+a range spans at most two blocks when the block is not shorter than the range.
+'''
+
+
+@njit
+def get_block_size(heads):
+    '''
+    the block size for the windows values[heads[i]:i + 1], the longest of them.
+    '''
+    block = 1
+    for i in range(heads.shape[0]):
+        block = max(block, i + 1 - heads[i])
+    return block
+
+
+@njit
+def get_block_moments(values, block):
+    '''
+    the block-local prefix sums of w, w**2 and t * w, where w = values[k] - values[block head] and t = k - block head.
+    '''
+    l = values.shape[0]
+    prefix_w, prefix_w2, prefix_tw = np.empty(l), np.empty(l), np.empty(l)
+    for head in range(0, l, block):
+        shift = values[head]
+        sum_w, sum_w2, sum_tw = 0.0, 0.0, 0.0
+        for k in range(head, min(head + block, l)):
+            w = values[k] - shift
+            sum_w += w
+            sum_w2 += w * w
+            sum_tw += (k - head) * w
+            prefix_w[k], prefix_w2[k], prefix_tw[k] = sum_w, sum_w2, sum_tw
+    return prefix_w, prefix_w2, prefix_tw
+
+
+@njit
+def _get_part_sum(prefix, block_head, head, last):
+    if head > block_head:
+        return prefix[last] - prefix[head - 1]
+    return prefix[last]
+
+
+@njit
+def _get_part_moments(values, prefix_w, prefix_w2, prefix_tw, block_head, head, last, range_head):
+    n = last - head + 1
+    s_w = _get_part_sum(prefix_w, block_head, head, last)
+    s_w2 = _get_part_sum(prefix_w2, block_head, head, last)
+    s_tw = _get_part_sum(prefix_tw, block_head, head, last)
+    s_jw = s_tw + (block_head - range_head) * s_w
+    # a = w + d
+    d = values[block_head] - values[range_head]
+    s_j = n * (head - range_head) + n * (n - 1) / 2.0
+    return s_w + n * d, s_w2 + 2 * d * s_w + n * d * d, s_jw + d * s_j
+
+
+@njit
+def get_range_moments(values, prefix_w, prefix_w2, prefix_tw, block, head, tail):
+    '''
+    (sum of a, sum of a**2, sum of j * a) over values[head:tail], where a = values[k] - values[head] and j = k - head.
+    tail - head is not larger than block.
+    '''
+    if tail <= head:
+        return 0.0, 0.0, 0.0
+    last = tail - 1
+    block_head = head - head % block
+    if last < block_head + block:
+        return _get_part_moments(values, prefix_w, prefix_w2, prefix_tw, block_head, head, last, head)
+    s_a1, s_a21, s_ja1 = _get_part_moments(values, prefix_w, prefix_w2, prefix_tw, block_head, head, block_head + block - 1, head)
+    s_a2, s_a22, s_ja2 = _get_part_moments(values, prefix_w, prefix_w2, prefix_tw, block_head + block, block_head + block, last, head)
+    return s_a1 + s_a2, s_a21 + s_a22, s_ja1 + s_ja2
+
+
+@njit(error_model='numpy')
+def get_range_std(values, prefix_w, prefix_w2, prefix_tw, block, head, tail):
+    '''
+    np.std (population) of values[head:tail], nan if empty.
+    '''
+    n = tail - head
+    if n <= 0:
+        return np.nan
+    s_a, s_a2, _ = get_range_moments(values, prefix_w, prefix_w2, prefix_tw, block, head, tail)
+    mean_a = s_a / n
+    return np.sqrt(max(s_a2 / n - mean_a * mean_a, 0.0))
@@ -1,3 +1,6 @@
+import concurrent.futures
+import algo.feature.util.assembly
+
 
 _primitives = (bool, str, int, float, type(None))
 
@@ -8,6 +11,8 @@ def _is_primitive(obj):
 def _param_as_label(param):
     if _is_primitive(param):
         return str(param)
+    if isinstance(param, (list, tuple)):
+        return ','.join([_param_as_label(v) for v in param])
     # new directory is used to avoid the file name limit (256) violation.
     d = {k: v for k, v in vars(param).items()}
     # for backward compatibility
@@ -15,6 +20,9 @@ def _param_as_label(param):
         del d['filter_out_non_gemini_symbol']
     if 'filter_out_reportable_symbols' in d and not d['filter_out_reportable_symbols']:
         del d['filter_out_reportable_symbols']
+    for k in ['columns', 'prefilter_ratio']:
+        if k in d and d[k] is None:
+            del d[k]
     return '/'.join([f'{k}({_param_as_label(v)})' for k, v in d.items()])
 
 
@@ -44,26 +52,50 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, get_feature_df_func, feature_param, feature_label_prefix, symbol_filter=None, value_column='close'):
-    dfi = df.set_index(['timestamp', 'symbol'])
+def _get_feature_df_for_symbol(get_feature_df_func, dfs, feature_param, value_column):
+    return get_feature_df_func(dfs, feature_param, value_column=value_column)
+
+
+def iterate_feature_dfs(symbol_blocks, symbols, get_feature_df_func, feature_param, value_column='close', n_workers=1):
+    '''
+    yields (symbol, df_feature) for each of symbols, in the order of symbols.
+    symbol_blocks is algo.feature.util.assembly.SymbolBlocks of the market data.
+
+    with n_workers > 1, the symbols are computed in a process pool.
+    the longest symbols are submitted first so that they do not straggle at the end,
+    and the results are yielded in the order of symbols regardless of which finishes first.
+    '''
+    if n_workers <= 1:
+        for symbol in symbols:
+            dfs = symbol_blocks.get_dfs(symbol, value_column=value_column)
+            yield symbol, get_feature_df_func(dfs, feature_param, value_column=value_column)
+            del dfs
+        return
+
+    symbols_longest_first = sorted(symbols, key=lambda s: symbol_blocks.blocks[s][1] - symbol_blocks.blocks[s][0], reverse=True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            symbol: executor.submit(
+                _get_feature_df_for_symbol, get_feature_df_func, symbol_blocks.get_dfs(symbol, value_column=value_column), feature_param, value_column)
+            for symbol in symbols_longest_first
+        }
+        for symbol in symbols:
+            yield symbol, futures.pop(symbol).result()
+
+
+def get_dfst_feature(df, get_feature_df_func, feature_param, feature_label_prefix, symbol_filter=None, value_column='close', n_workers=1):
     all_symbols = df.symbol.unique()
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
     all_symbols = [s for s in all_symbols if symbol_filter(s)]
     print(f'all_symbols: {len(all_symbols)}')
 
-    dfst_feature = df.set_index(['symbol', 'timestamp'])
-    for i, symbol in enumerate(all_symbols):
-        dfs = dfi.xs(symbol, level=1)
-
-        df_feature = get_feature_df_func(dfs, feature_param=feature_param, value_column=value_column)
-        del dfs
-
+    symbol_blocks = algo.feature.util.assembly.SymbolBlocks(df)
+    feature_arrays = {}
+    for i, (symbol, df_feature) in enumerate(iterate_feature_dfs(
+            symbol_blocks, all_symbols, get_feature_df_func, feature_param, value_column=value_column, n_workers=n_workers)):
         print(f'{i} symbol: {symbol} {feature_label_prefix}')
-
-        for column in df_feature.columns:
-            dfst_feature.loc[symbol, column] = df_feature[column].values
-
+        symbol_blocks.write_feature(feature_arrays, symbol, df_feature)
         del df_feature
 
-    return dfst_feature
+    return symbol_blocks.get_dfst(feature_arrays)
@@ -0,0 +1,73 @@
+import numpy as np
+from numba import njit
+
+
+'''
+the rolling aggregates over a fixed window, computed from the aggregates of the prefixes and the suffixes
+of the blocks of the window size (any window spans at most two blocks), hence O(1) per row regardless of the window.
+a window with a nan aggregates to nan.
+'''
+
+
+@njit
+def _get_block_prefix_suffix(values, block, op):
+    '''
+    op 0: sum, 1: min, 2: max.
+    '''
+    l = values.shape[0]
+    prefix, suffix = np.empty(l), np.empty(l)
+    for head in range(0, l, block):
+        tail = min(head + block, l)
+        for i in range(head, tail):
+            prefix[i] = values[i] if i == head else _apply(prefix[i - 1], values[i], op)
+        for i in range(tail - 1, head - 1, -1):
+            suffix[i] = values[i] if i == tail - 1 else _apply(values[i], suffix[i + 1], op)
+    return prefix, suffix
+
+
+@njit
+def _apply(v1, v2, op):
+    if op == 0:
+        return v1 + v2
+    if np.isnan(v1) or np.isnan(v2):
+        return np.nan
+    if op == 1:
+        return v1 if v1 < v2 else v2
+    return v1 if v1 > v2 else v2
+
+
+@njit
+def _get_rolling(values, window, op, partial):
+    '''
+    the aggregate of values[i - window + 1: i + 1] at i.
+    the rows before a full window are nan, or the aggregate of values[:i + 1] if partial.
+    '''
+    l = values.shape[0]
+    out = np.full(l, np.nan)
+    if window < 1:
+        return out
+    prefix, suffix = _get_block_prefix_suffix(values, window, op)
+    if partial:
+        out[:min(window - 1, l)] = prefix[:min(window - 1, l)]
+    for i in range(window - 1, l):
+        head = i - window + 1
+        if head % window == 0:
+            out[i] = prefix[i]
+        else:
+            out[i] = _apply(suffix[head], prefix[i], op)
+    return out
+
+
+@njit
+def get_rolling_sum(values, window, partial=False):
+    return _get_rolling(values, window, 0, partial)
+
+
+@njit
+def get_rolling_min(values, window, partial=False):
+    return _get_rolling(values, window, 1, partial)
+
+
+@njit
+def get_rolling_max(values, window, partial=False):
+    return _get_rolling(values, window, 2, partial)
@@ -0,0 +1,49 @@
+import pandas as pd, numpy as np
+from numba import njit
+
+_nanos_per_minute = 60 * 1_000_000_000
+
+
+def get_epoch_nanos(index) -> np.ndarray:
+    '''
+    the int64 epoch nanoseconds of a timestamp index.
+    '''
+    return pd.DatetimeIndex(index).values.astype('datetime64[ns]').view(np.int64)
+
+
+def get_window_heads(timestamps: np.ndarray, window_minutes) -> np.ndarray:
+    '''
+    timestamps are the int64 epoch nanoseconds in ascending order.
+
+    the head of the window ending at each row, i.e. the first row within window_minutes of the row,
+    the same rows as a deque trimmed while the last timestamp - the first timestamp > window_minutes.
+    '''
+    window = np.int64(window_minutes * _nanos_per_minute)
+    return np.searchsorted(timestamps, timestamps - window, side='left').astype(np.int64)
+
+
+def get_minimum_window_size(window_minutes) -> int:
+    '''
+    the windows with fewer rows than this are left nan.
+    '''
+    return min(10, window_minutes)
+
+
+def get_window_heads_for_index(index, window_minutes) -> np.ndarray:
+    return get_window_heads(get_epoch_nanos(index), window_minutes)
+
+
+@njit
+def get_slice_bounds(l, start, stop):
+    '''
+    the (head, tail) of values[start:stop] for len(values) == l, with the python slicing of the negative indices.
+    '''
+    if start < 0:
+        start = max(start + l, 0)
+    else:
+        start = min(start, l)
+    if stop < 0:
+        stop = max(stop + l, 0)
+    else:
+        stop = min(stop, l)
+    return start, max(start, stop)
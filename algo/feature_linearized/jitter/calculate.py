@@ -4,6 +4,8 @@ import numba
 from numba import njit
 from numba.experimental import jitclass
 import algo.feature.util.jitter_common
+import algo.feature.jitter.calculate
+from algo.feature.jitter.calculate import feature_columns
 
 default_window = 30
 default_window_longterm = 240
@@ -76,12 +78,12 @@ def get_changes_1dim(values):
         avg_v_before_max_ch = np.where(where_max_to_be_updated, avg_v, avg_v_before_max_ch)
 
         where_min_to_be_updated = ch_min >= ch_drop
-        distance_min_ch = np.where(where_min_to_be_updated, d, distance_max_ch)
-        ch_since_min = np.where(where_min_to_be_updated, ch_since, ch_since_max)
-        ch_min = np.where(where_min_to_be_updated, ch_drop, ch_max)
-        v_ch_min_is_from = np.where(where_min_to_be_updated, max_v, v_ch_max_is_from)
-        v_ch_min_is_to = np.where(where_min_to_be_updated, v, v_ch_max_is_to)
-        avg_v_before_min_ch = np.where(where_min_to_be_updated, avg_v, avg_v_before_max_ch)
+        distance_min_ch = np.where(where_min_to_be_updated, d, distance_min_ch)
+        ch_since_min = np.where(where_min_to_be_updated, ch_since, ch_since_min)
+        ch_min = np.where(where_min_to_be_updated, ch_drop, ch_min)
+        v_ch_min_is_from = np.where(where_min_to_be_updated, max_v, v_ch_min_is_from)
+        v_ch_min_is_to = np.where(where_min_to_be_updated, v, v_ch_min_is_to)
+        avg_v_before_min_ch = np.where(where_min_to_be_updated, avg_v, avg_v_before_min_ch)
 
     return {
         'value': last_v,
@@ -96,6 +98,32 @@ def get_changes_1dim(values):
     }
 
 
+@njit
+def get_changes_matrix(values, window, out):
+    '''
+    values is a (timestamp, symbol) matrix where a missing value is nan.
+    fills out, of shape (len(feature_columns), timestamps, symbols), with get_changes_series
+    over the non-missing values of each symbol, which is the same as the per-symbol feature.
+    the missing values get nan features.
+    the sameness holds only for the market data without a nan value: a nan here is taken as a missing bar,
+    while the per-symbol feature has the row of a nan value in its windows (see scripts/check_jitter_linearized_parity.py).
+    '''
+    l, cols = values.shape
+    out[:] = np.nan
+    column_rows = np.arange(out.shape[0])
+    for c in range(cols):
+        rows = np.nonzero(~np.isnan(values[:, c]))[0]
+        values_symbol = np.empty(rows.shape[0])
+        for j in range(rows.shape[0]):
+            values_symbol[j] = values[rows[j], c]
+
+        out_symbol = np.empty((out.shape[0], rows.shape[0]))
+        algo.feature.jitter.calculate.get_changes_series(values_symbol, window, column_rows, out_symbol)
+        for k in range(out_symbol.shape[0]):
+            for j in range(rows.shape[0]):
+                out[k, rows[j], c] = out_symbol[k, j]
+
+
 def get_feature_df(dfs, feature_param, value_column='close'):
     window = feature_param.window
     rows = [get_changes_1dim(np.array([v[0] for v in df_.to_numpy(dtype=np.float64)], dtype=np.float64)) for df_ in
@@ -1,8 +1,11 @@
 import pandas as pd
 import numpy as np
 import algo.feature.jitter.calculate
+import algo.feature.jitter.research
+import algo.feature_linearized.jitter.calculate
+import algo.feature_linearized.tensor
 import algo.feature.util.research
-from algo.feature.jitter.calculate import JitterFeatureParam
+from algo.feature.jitter.calculate import JitterFeatureParam, feature_columns
 
 
 _feature_label_prefix = '(changes)'
@@ -17,24 +20,60 @@ def _get_usdt_symbol_filter():
     return lambda s: 'USDT' in s
 
 
-def get_dfst_feature(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close'):
+def _get_df_values(df, symbol_filter=None, value_column='close'):
     all_symbols = df.symbol.unique()
     if symbol_filter is None:
         symbol_filter = _get_usdt_symbol_filter()
     all_symbols = [s for s in all_symbols if symbol_filter(s)]
     print(f'all_symbols: {len(all_symbols)}')
 
-    df_values = df[df.symbol.isin(set(all_symbols))].reset_index().pivot(index="timestamp", columns="symbol", values=value_column)
+    return df[df.symbol.isin(set(all_symbols))].reset_index().pivot(index="timestamp", columns="symbol", values=value_column)
+
+
+def get_feature_tensor(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close'):
+    '''
+    returns the features in a (timestamp, symbol, feature) FeatureTensor.
+    '''
+    df_values = _get_df_values(df, symbol_filter=symbol_filter, value_column=value_column)
 
-    window = feature_param.window
-    rows = [algo.feature.jitter.calculate.get_changes_1dim(
-        np.array([v for v in df_.to_numpy(dtype=np.float64)], dtype=np.float64)
-    ) for df_ in df_values.rolling(window, min_periods=window)]
+    values = df_values.to_numpy(dtype=np.float64)
+    tensor_values = np.empty((values.shape[0], values.shape[1], len(feature_columns)))
+    # the kernel fills (feature, timestamp, symbol), written through a view of the (timestamp, symbol, feature) array.
+    algo.feature_linearized.jitter.calculate.get_changes_matrix(values, feature_param.window, tensor_values.transpose(2, 0, 1))
 
-    feature_keys = list(rows[0].keys())
-    feature_values = sum([[r[k] for k in feature_keys] for r in rows], [])
-    feature_index = pd.MultiIndex.from_product([df_values.index, feature_keys], names=[df_values.index.name, 'feature'])
-    df_feature = pd.DataFrame(np.array(feature_values), index=feature_index, columns=df_values.columns)
+    return algo.feature_linearized.tensor.FeatureTensor(tensor_values, df_values.index, df_values.columns, feature_columns)
+
+
+def get_dfst_feature(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close'):
+    '''
+    returns the features in a frame of (timestamp, feature) index and symbol columns.
+    '''
+    feature_tensor = get_feature_tensor(df, feature_param, symbol_filter=symbol_filter, value_column=value_column)
+
+    feature_index = pd.MultiIndex.from_product([feature_tensor.timestamps, feature_tensor.features], names=['timestamp', 'feature'])
+    feature_values = feature_tensor.values.transpose(0, 2, 1).reshape(-1, len(feature_tensor.symbols))
+    df_feature = pd.DataFrame(feature_values, index=feature_index, columns=feature_tensor.symbols)
 
     return df_feature
 
+
+def get_parity_report(df, feature_param: JitterFeatureParam, symbol_filter=None, value_column='close'):
+    '''
+    compares get_dfst_feature against the per-symbol algo.feature.jitter.research.get_dfst_feature.
+    returns the max absolute difference and the count of mismatching (nan vs not nan) values per feature,
+    which should be all zeros for df without a nan value (see get_changes_matrix).
+    '''
+    df_feature = get_dfst_feature(df, feature_param, symbol_filter=symbol_filter, value_column=value_column)
+    dfst_feature = algo.feature.jitter.research.get_dfst_feature(
+        df, algo.feature.jitter.calculate.JitterFeatureParam(feature_param.window), symbol_filter=symbol_filter, value_column=value_column)
+
+    report = {}
+    for column in feature_columns:
+        df_linearized = df_feature.xs(column, level='feature')
+        df_per_symbol = dfst_feature[column].unstack(level='symbol').reindex(index=df_linearized.index, columns=df_linearized.columns)
+        linearized, per_symbol = df_linearized.to_numpy(dtype=np.float64), df_per_symbol.to_numpy(dtype=np.float64)
+        report[column] = {
+            'max_abs_diff': np.nanmax(np.abs(linearized - per_symbol), initial=0),
+            'nan_mismatch': int((np.isnan(linearized) != np.isnan(per_symbol)).sum()),
+        }
+    return pd.DataFrame(report).T
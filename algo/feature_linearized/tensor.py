@@ -0,0 +1,97 @@
+import json
+import os
+import typing
+
+import pandas as pd, numpy as np
+
+
+_values_file_name = 'values.npy'
+_timestamps_file_name = 'timestamps.npy'
+_symbols_file_name = 'symbols.npy'
+_features_file_name = 'features.npy'
+_meta_file_name = 'meta.json'
+
+
+class FeatureTensor:
+    '''
+    a contiguous (time, symbol, feature) array labeled by the timestamps, the symbols and the features.
+    the accessors return views of the array, without copying.
+    '''
+    def __init__(self, values: np.ndarray, timestamps, symbols, features):
+        self.values = values
+        self.timestamps = pd.DatetimeIndex(timestamps, name='timestamp')
+        self.symbols = pd.Index(symbols, name='symbol')
+        self.features = pd.Index(features, name='feature')
+        self._feature_positions = {feature: i for i, feature in enumerate(self.features)}
+        self._symbol_positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def feature(self, feature) -> np.ndarray:
+        '''
+        the (time, symbol) view of a feature.
+        '''
+        return self.values[:, :, self._feature_positions[feature]]
+
+    def symbol(self, symbol) -> np.ndarray:
+        '''
+        the (time, feature) view of a symbol.
+        '''
+        return self.values[:, self._symbol_positions[symbol], :]
+
+    def at(self, i: int) -> np.ndarray:
+        '''
+        the (symbol, feature) view at the i-th timestamp.
+        '''
+        return self.values[i]
+
+    def time_slice(self, start=None, end=None) -> 'FeatureTensor':
+        '''
+        the tensor of the timestamps in [start, end], both inclusive as in .loc, sharing the array.
+        '''
+        indexer = self.timestamps.slice_indexer(start, end)
+        return FeatureTensor(self.values[indexer], self.timestamps[indexer], self.symbols, self.features)
+
+    def feature_df(self, feature) -> pd.DataFrame:
+        '''
+        a feature as a frame of timestamp index and symbol columns, wrapping the view.
+        '''
+        return pd.DataFrame(self.feature(feature), index=self.timestamps, columns=self.symbols, copy=False)
+
+    def symbol_df(self, symbol) -> pd.DataFrame:
+        '''
+        a symbol as a frame of timestamp index and feature columns, wrapping the view.
+        '''
+        return pd.DataFrame(self.symbol(symbol), index=self.timestamps, columns=self.features, copy=False)
+
+    def save(self, path: str) -> None:
+        '''
+        saves the array and the labels as .npy files in the directory of path.
+        '''
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, _values_file_name), np.ascontiguousarray(self.values))
+        np.save(os.path.join(path, _timestamps_file_name), self.timestamps.as_unit('ns').asi8)
+        np.save(os.path.join(path, _symbols_file_name), np.array(self.symbols, dtype=str))
+        np.save(os.path.join(path, _features_file_name), np.array(self.features, dtype=str))
+        with open(os.path.join(path, _meta_file_name), 'w') as f:
+            json.dump({'tz': None if self.timestamps.tz is None else str(self.timestamps.tz)}, f)
+
+    @staticmethod
+    def load(path: str, mmap_mode: typing.Optional[str] = None) -> 'FeatureTensor':
+        '''
+        loads a tensor saved by save. mmap_mode (e.g. 'r') maps the array from the disk instead of reading it.
+        '''
+        values = np.load(os.path.join(path, _values_file_name), mmap_mode=mmap_mode)
+        timestamps = pd.to_datetime(np.load(os.path.join(path, _timestamps_file_name)), unit='ns')
+        with open(os.path.join(path, _meta_file_name)) as f:
+            tz = json.load(f)['tz']
+        if tz is not None:
+            timestamps = timestamps.tz_localize('UTC').tz_convert(tz)
+        symbols = np.load(os.path.join(path, _symbols_file_name))
+        features = np.load(os.path.join(path, _features_file_name))
+        return FeatureTensor(values, timestamps, symbols, features)
@@ -0,0 +1,72 @@
+import typing
+import numpy as np
+import pandas as pd
+
+# the position columns only take -1, 0, +1 (and their differences).
+position_columns = {'in_position', 'position_changed'}
+# the distances in rows, bounded by the feature window.
+distance_columns = {'distance_max_ch', 'distance_min_ch'}
+# the elapsed time in rows or seconds since the position enter.
+timedelta_columns = {'timedelta_since_position_enter', 'timedelta_seconds_since_position_enter'}
+# the ratios that do not need the float64 precision, unlike the prices (value, v_ch_*, avg_v_*, *_at_enter, ...).
+ratio_columns = {
+    'ch', 'ch_max', 'ch_min', 'ch_since_max', 'ch_since_min', 'ch_std', 'ch_ema', 'momentum',
+    'ch_from_enter', 'ch_from_lowest_since_enter', 'ch_from_highest_since_enter', 'ch_ema_from_enter',
+    'lowest_ch_min_since_ch_min_threshold_crossed', 'highest_ch_max_since_ch_max_threshold_crossed',
+    'std_off_trend_to_value', 'rank', 'rank_descending', 'profit',
+}
+
+_collective_suffix = '_collective'
+
+
+def _get_base_column(column: str) -> str:
+    if column.endswith(_collective_suffix):
+        return column[:-len(_collective_suffix)]
+    return column
+
+
+def get_compact_dtype(column: str) -> typing.Optional[str]:
+    '''
+    the compact dtype name of a feature or trading column, None if the column is kept as it is.
+    the integer dtypes are made nullable by to_compact_dtypes when the column has nan.
+    '''
+    base_column = _get_base_column(column)
+    if base_column in position_columns:
+        return 'int8'
+    if base_column in distance_columns:
+        return 'int16'
+    if base_column in timedelta_columns:
+        return 'int32'
+    if base_column in ratio_columns or (base_column.startswith('ch_window') and (base_column.endswith('_min') or base_column.endswith('_max'))):
+        return 'float32'
+    return None
+
+
+def to_compact_dtypes(df: pd.DataFrame, compact_dtypes: typing.Optional[typing.Dict[str, str]] = None) -> pd.DataFrame:
+    '''
+    returns df with float32 ratios, int8 positions and int16/int32 distances.
+    compact_dtypes overrides the dtype per column, where None keeps the column as it is.
+
+    an integer column with nan becomes the nullable integer dtype (e.g. Int8).
+    a column with non-integral values is not converted to an integer dtype.
+    '''
+    compact_dtypes = compact_dtypes if compact_dtypes is not None else {}
+    astype = {}
+    for column in df.columns:
+        dtype = compact_dtypes[column] if column in compact_dtypes else get_compact_dtype(column)
+        if dtype is None or df[column].dtype == dtype:
+            continue
+        if not pd.api.types.is_numeric_dtype(df[column].dtype) or pd.api.types.is_bool_dtype(df[column].dtype):
+            continue
+        if dtype.startswith('int'):
+            values = df[column].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]
+            if not np.all(values == np.floor(values)):
+                continue
+            if df[column].hasnans:
+                dtype = dtype.capitalize()
+        astype[column] = dtype
+
+    if len(astype) == 0:
+        return df
+    return df.astype(astype)
@@ -1,3 +1,4 @@
+import copy
 import datetime
 import logging, sys, os
 
@@ -29,6 +30,8 @@ import algo.feature.jitter.research
 import algo.feature.simple_jitter.research
 import algo.feature.collective_jitter.research
 import algo.feature.momentum.research
+import algo.feature.registry
+import algo.feature.engine
 import algo.alpha.jitter_recovery.calculate
 import algo.alpha.jitter_simple_reversal.calculate
 import algo.alpha.jitter_following.calculate
@@ -41,6 +44,7 @@ import algo.alpha.jitter_following.research
 import algo.alpha.collective_jitter_recovery.research
 import algo.alpha.momentum.research
 import algo.alpha.momentum_reversal.research
+import algo.alpha.util.sparse
 
 
 def _get_jitter_feature_param_labels_get_dfst_feature_func():
@@ -84,6 +88,18 @@ def _get_feature_param_labels_get_dfst_feature_func(feature_name: str):
         return [], [], []
 
 
+def _get_dfst_features_func(feature_name: str):
+    '''
+    the function computing all the feature params of the feature in one pass, if the feature supports it.
+    '''
+    if feature_name == 'jitter':
+        return algo.feature.jitter.research.get_dfst_features
+    elif feature_name in algo.feature.registry.get_names():
+        return algo.feature.engine.get_dfst_features
+    else:
+        return None
+
+
 def _get_jitter_reversal_trading_param_labels_trading_func():
     params = [
         algo.alpha.jitter_recovery.calculate.JitterRecoveryTradingParam(
@@ -102,11 +118,11 @@ def _get_jitter_reversal_trading_param_labels_trading_func():
 def _get_jitter_simple_reversal_trading_param_labels_trading_func():
     params = [
         algo.alpha.jitter_simple_reversal.calculate.JitterSimpleReversalTradingParam(
-            algo.feature.jitter.calculate.JitterFeatureParam(30),
+            algo.feature.simple_jitter.calculate.SimpleJitterFeatureParam(30),
             jump_threshold=0.18, drop_from_jump_threshold=-0.02),
     ]
     feature_labels = [
-        algo.feature.jitter.research.get_feature_label_for_caching(param.feature_param) for param in params
+        algo.feature.simple_jitter.research.get_feature_label_for_caching(param.feature_param) for param in params
     ]
     trading_labels = [
         algo.alpha.jitter_simple_reversal.research.get_trading_label_for_caching(param) for param in params
@@ -143,6 +159,65 @@ def _get_trading_param_labels_get_dfst_trading_func(alpha_name: str):
         return [], [], [], []
 
 
+def _get_state_machine(alpha_name: str):
+    if alpha_name == 'jitter_reversal':
+        return algo.alpha.jitter_recovery.calculate.state_machine
+    elif alpha_name == 'jitter_simple_reversal':
+        return algo.alpha.jitter_simple_reversal.calculate.state_machine
+    elif alpha_name == 'collective_jitter_reversal':
+        return algo.alpha.collective_jitter_recovery.calculate.state_machine
+    else:
+        return None
+
+
+def _get_trading_params_feature_labels_to_read(trading_params, feature_labels, state_machine, full_feature_labels):
+    '''
+    the trading params and the feature labels their trading reads, where a feature label not in full_feature_labels
+    is replaced with the label of the feature narrowed to the columns the trading consumes
+    (see algo.alpha.util.state_machine.StateMachine.get_feature_param_for), as is the feature param of the trading param.
+    the trading labels stay keyed on the full feature params.
+    '''
+    if state_machine is None:
+        return trading_params, feature_labels
+    trading_params_to_read, feature_labels_to_read = [], []
+    for trading_param, feature_label in zip(trading_params, feature_labels):
+        if feature_label not in full_feature_labels:
+            trading_param = copy.copy(trading_param)
+            trading_param.feature_param = state_machine.get_feature_param_for(trading_param)
+            feature_label = algo.feature.registry.get_feature_label_for_caching(trading_param.feature_param)
+        trading_params_to_read.append(trading_param)
+        feature_labels_to_read.append(feature_label)
+    return trading_params_to_read, feature_labels_to_read
+
+
+def _get_dfst_feature_trading_func(alpha_name: str):
+    '''
+    the function computing the features and the trading per symbol in one go, if the alpha supports it.
+    an alpha is routed here only once its path passes scripts/check_trading_paths.py.
+    '''
+    if alpha_name == 'jitter_reversal':
+        return algo.alpha.jitter_recovery.research.get_dfst_feature_trading
+    elif alpha_name == 'jitter_simple_reversal':
+        return algo.alpha.jitter_simple_reversal.research.get_dfst_feature_trading
+    else:
+        return None
+
+
+def _get_dfst_trading_sparse_func(alpha_name: str):
+    '''
+    the function computing the sparse trading (see algo.alpha.util.sparse), if the alpha supports it.
+    an alpha is routed here only once its path passes scripts/check_trading_paths.py.
+    '''
+    if alpha_name == 'jitter_reversal':
+        return algo.alpha.jitter_recovery.research.get_dfst_trading_sparse
+    elif alpha_name == 'jitter_simple_reversal':
+        return algo.alpha.jitter_simple_reversal.research.get_dfst_trading_sparse
+    elif alpha_name == 'collective_jitter_reversal':
+        return algo.alpha.collective_jitter_recovery.research.get_dfst_trading_sparse
+    else:
+        return None
+
+
 def cache_all(
     date_str_from: str,
     date_str_to: str,
@@ -158,7 +233,23 @@ def cache_all(
     if_verify_trading=False,
     symbol_filter=lambda s: s.endswith('USD'),
     value_column='close',
+    n_workers=1,
+    compact_labels=None,
+    if_fuse_feature_trading=False,
+    if_sparse_trading=False,
 ):
+    '''
+    the trading reads the full feature of its feature label when that is cached in the run as a feature of feature_name,
+    or when the features are not cached in the run, keeping only the feature columns it consumes.
+    otherwise only the consumed feature columns are computed, cached under their own feature label if if_cache_features.
+    if_fuse_feature_trading computes the trading together with the features per symbol when the alpha supports it,
+    instead of caching the features then reading them back. the features are then cached only if if_cache_features,
+    the fused pass caching the feature labels of the trading params and cache_features the other labels of feature_name.
+    if_sparse_trading caches the sparse trading under the sparse trading labels (see algo.alpha.util.sparse)
+    when the alpha supports it, instead of the dense dfst_trading.
+    compact_labels are the labels to cache in the compact dtypes (see algo.util.compact),
+    where a dense trading label in it compacts its sparse trading as well.
+    '''
     print(f"{date_str_from=} {date_str_to=}")
     aggregation_mode = market_data.ingest.bq.common.AGGREGATION_MODE.TAKE_LASTEST
 
@@ -178,42 +269,115 @@ def cache_all(
             labels=[market_data.ingest.bq.cache._label_market_data],
         )
 
+    get_dfst_trading_sparse_func = _get_dfst_trading_sparse_func(alpha_name) if if_sparse_trading else None
+    if if_sparse_trading and get_dfst_trading_sparse_func is None:
+        logging.warning(f"{alpha_name} does not support the sparse trading, falling back to the dense trading")
+    if get_dfst_trading_sparse_func is not None and if_fuse_feature_trading:
+        logging.warning(f"the sparse trading is not fused with the features, falling back to the separate caching")
+        if_fuse_feature_trading = False
+
+    get_dfst_feature_trading_func = _get_dfst_feature_trading_func(alpha_name) if if_fuse_feature_trading else None
+    if if_fuse_feature_trading and get_dfst_feature_trading_func is None:
+        logging.warning(f"{alpha_name} does not support fusing the feature and the trading, falling back to the separate caching")
+    is_fused = get_dfst_feature_trading_func is not None and if_cache_trading
+
+    feature_params, labels, get_dfst_feature_func = _get_feature_param_labels_get_dfst_feature_func(feature_name)
+    trading_params, feature_labels, trading_labels, get_dfst_trading_func = _get_trading_param_labels_get_dfst_trading_func(alpha_name)
+    state_machine = _get_state_machine(alpha_name)
     if if_cache_features:
-        feature_params, labels, get_dfst_feature_func = _get_feature_param_labels_get_dfst_feature_func(feature_name)
-        algo.cache.cache_features(
+        full_feature_labels = labels
+    elif is_fused:
+        full_feature_labels = []
+    else:
+        full_feature_labels = feature_labels
+    trading_params_to_read, feature_labels_to_read = _get_trading_params_feature_labels_to_read(
+        trading_params, feature_labels, state_machine, full_feature_labels)
+    trading_feature_columns = state_machine.feature_columns if state_machine is not None else None
+
+    fused_feature_labels = []
+    if is_fused:
+        fused_feature_labels = algo.cache.cache_feature_trading_fused(
             date_str_from=date_str_from, date_str_to=date_str_to,
             dataset_mode=dataset_mode, export_mode=export_mode,
             aggregation_mode=market_data.ingest.bq.common.AGGREGATION_MODE.TAKE_LASTEST,
-            feature_params=feature_params,
-            labels=labels,
-            get_dfst_feature_func=get_dfst_feature_func,
+            trading_params=trading_params_to_read,
+            feature_labels=feature_labels_to_read,
+            trading_labels=trading_labels,
+            get_dfst_feature_trading_func=get_dfst_feature_trading_func,
+            if_cache_features=if_cache_features,
             symbol_filter=symbol_filter,
             value_column=value_column,
+            n_workers=n_workers,
+            compact_labels=compact_labels,
+            trading_feature_columns=trading_feature_columns,
         )
+        if_cache_trading = False
+
+    if if_cache_features:
+        feature_params_labels = [(feature_param, label) for feature_param, label in zip(feature_params, labels) if label not in fused_feature_labels]
+        if len(feature_params_labels) > 0:
+            algo.cache.cache_features(
+                date_str_from=date_str_from, date_str_to=date_str_to,
+                dataset_mode=dataset_mode, export_mode=export_mode,
+                aggregation_mode=market_data.ingest.bq.common.AGGREGATION_MODE.TAKE_LASTEST,
+                feature_params=[feature_param for feature_param, _ in feature_params_labels],
+                labels=[label for _, label in feature_params_labels],
+                get_dfst_feature_func=get_dfst_feature_func,
+                symbol_filter=symbol_filter,
+                value_column=value_column,
+                get_dfst_features_func=_get_dfst_features_func(feature_name),
+                n_workers=n_workers,
+                compact_labels=compact_labels,
+            )
+
+        # the narrowed features the trading reads, not among the features of feature_name.
+        narrowed_feature_params_labels = {}
+        for trading_param, feature_label in zip(trading_params_to_read, feature_labels_to_read):
+            if feature_label not in labels and feature_label not in fused_feature_labels:
+                narrowed_feature_params_labels.setdefault(feature_label, trading_param.feature_param)
+        if len(narrowed_feature_params_labels) > 0:
+            algo.cache.cache_features(
+                date_str_from=date_str_from, date_str_to=date_str_to,
+                dataset_mode=dataset_mode, export_mode=export_mode,
+                aggregation_mode=market_data.ingest.bq.common.AGGREGATION_MODE.TAKE_LASTEST,
+                feature_params=list(narrowed_feature_params_labels.values()),
+                labels=list(narrowed_feature_params_labels.keys()),
+                get_dfst_feature_func=algo.feature.engine.get_dfst_feature,
+                symbol_filter=symbol_filter,
+                value_column=value_column,
+                get_dfst_features_func=algo.feature.engine.get_dfst_features,
+                n_workers=n_workers,
+                compact_labels=compact_labels,
+            )
 
     if if_verify_features:
-        _, labels, _ = _get_feature_param_labels_get_dfst_feature_func(feature_name)
+        verify_labels = labels
+        if if_cache_features:
+            verify_labels = verify_labels + [label for label in feature_labels_to_read if label not in verify_labels]
         algo.cache.verify_cache(
             date_str_from=date_str_from, date_str_to=date_str_to,
             dataset_mode=dataset_mode, export_mode=export_mode,
             aggregation_mode=aggregation_mode,
-            labels=labels,
+            labels=verify_labels,
         )
 
     if if_cache_trading:
-        trading_params, feature_labels, trading_labels, get_dfst_trading_func = _get_trading_param_labels_get_dfst_trading_func(alpha_name)
         algo.cache.cache_trading(
             date_str_from=date_str_from, date_str_to=date_str_to,
             dataset_mode=dataset_mode, export_mode=export_mode,
             aggregation_mode=market_data.ingest.bq.common.AGGREGATION_MODE.TAKE_LASTEST,
-            trading_params = trading_params,
-            feature_labels = feature_labels,
+            trading_params = trading_params_to_read,
+            feature_labels = feature_labels_to_read,
             trading_labels = trading_labels,
             get_dfst_trading_func = get_dfst_trading_func,
+            compact_labels = compact_labels,
+            get_dfst_trading_sparse_func = get_dfst_trading_sparse_func,
+            trading_feature_columns = trading_feature_columns,
         )
 
     if if_verify_trading:
-        _, _, trading_labels, _ = _get_trading_param_labels_get_dfst_trading_func(alpha_name)
+        if get_dfst_trading_sparse_func is not None:
+            trading_labels = [algo.alpha.util.sparse.get_sparse_label(trading_label) for trading_label in trading_labels]
         algo.cache.verify_cache(
             date_str_from=date_str_from, date_str_to=date_str_to,
             dataset_mode=dataset_mode, export_mode=export_mode,
@@ -0,0 +1,49 @@
+'''
+checks that the linearized jitter features (algo.feature_linearized.jitter) are the same as the per-symbol algo.feature.jitter
+on the synthetic market data of several symbols with the gaps, i.e. the missing bars of a symbol at the timestamps of the others.
+exits with 1 on a mismatch.
+
+    python scripts/check_jitter_linearized_parity.py
+'''
+import os, sys
+import numpy as np, pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import algo.feature_linearized.jitter.research
+from algo.feature.jitter.calculate import JitterFeatureParam
+
+
+def get_df_gapped(symbols, n_minutes=600, seed=0):
+    '''
+    the synthetic market data of symbols, each missing the random bars and a block of the consecutive bars at its own timestamps.
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=n_minutes, freq='1min', tz='UTC')
+    dfs = []
+    for i, symbol in enumerate(symbols):
+        values = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_minutes)))
+        is_kept = rng.random(n_minutes) > 0.1 * (i + 1)
+        is_kept[200 + i * 50:260 + i * 50] = False
+        dfs.append(pd.DataFrame({'timestamp': timestamps, 'symbol': symbol, 'close': values})[is_kept])
+    return pd.concat(dfs).sort_values(['timestamp', 'symbol']).reset_index(drop=True)
+
+
+def main():
+    df = get_df_gapped(['BTC-USDT-SWAP', 'ETH-USDT-SWAP', 'XRP-USDT-SWAP'])
+    mismatched = False
+    for window in [10, 30]:
+        report = algo.feature_linearized.jitter.research.get_parity_report(df, JitterFeatureParam(window))
+        print(f'{window=}')
+        print(report)
+        if (report.max_abs_diff > 1e-12).any() or (report.nan_mismatch > 0).any():
+            mismatched = True
+    if mismatched:
+        print('the linearized jitter features do not match the per-symbol features')
+        return 1
+    print('the linearized jitter features match the per-symbol features')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
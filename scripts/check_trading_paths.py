@@ -0,0 +1,104 @@
+'''
+runs the fused and the sparse trading paths main_cache routes the alphas to, on the synthetic market data of a few symbols
+with the jumps and the drops, checking them against get_dfst_trading of the dfst_feature. exits with 1 on a mismatch or an error.
+
+    python scripts/check_trading_paths.py
+'''
+import os, sys, traceback
+import numpy as np, pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import algo.feature.jitter.research
+import algo.feature.simple_jitter.research
+import algo.feature.collective_jitter.research
+import algo.alpha.jitter_recovery.research
+import algo.alpha.jitter_simple_reversal.research
+import algo.alpha.collective_jitter_recovery.research
+import algo.alpha.util.sparse
+from algo.feature.jitter.calculate import JitterFeatureParam
+from algo.feature.simple_jitter.calculate import SimpleJitterFeatureParam
+from algo.feature.collective_jitter.calculate import CollectiveJitterFeatureParam
+from algo.alpha.jitter_recovery.calculate import JitterRecoveryTradingParam
+from algo.alpha.jitter_simple_reversal.calculate import JitterSimpleReversalTradingParam
+from algo.alpha.collective_jitter_recovery.calculate import CollectiveRecoveryTradingParam, CollectiveDropRecoveryTradingParam
+
+
+def get_df_jumps(symbols, n_minutes=1500, seed=0):
+    '''
+    the synthetic market data of symbols, all but the first having a jump then a drop back and a later drop.
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=n_minutes, freq='1min', tz='UTC')
+    dfs = []
+    for i, symbol in enumerate(symbols):
+        values = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n_minutes)))
+        if i > 0:
+            values[700:] *= 1.3
+            values[705:] /= 1.25
+            values[1100:] *= 0.75
+        dfs.append(pd.DataFrame({'timestamp': timestamps, 'symbol': symbol, 'close': values, 'volume': rng.random(n_minutes)}))
+    return pd.concat(dfs).sort_values(['timestamp', 'symbol']).reset_index(drop=True)
+
+
+# (alpha name, the research module, the trading param, get_dfst_feature of the feature of the trading param)
+_fused_cases = [
+    ('jitter_reversal', algo.alpha.jitter_recovery.research,
+     JitterRecoveryTradingParam(JitterFeatureParam(30), 0.20, -0.04, 0.02, is_long_term=False),
+     algo.feature.jitter.research.get_dfst_feature),
+    ('jitter_simple_reversal', algo.alpha.jitter_simple_reversal.research,
+     JitterSimpleReversalTradingParam(SimpleJitterFeatureParam(30), jump_threshold=0.18, drop_from_jump_threshold=-0.02),
+     algo.feature.simple_jitter.research.get_dfst_feature),
+]
+
+_sparse_cases = _fused_cases + [
+    ('collective_jitter_reversal', algo.alpha.collective_jitter_recovery.research,
+     CollectiveRecoveryTradingParam(
+         CollectiveJitterFeatureParam(window=40, collective_window=30),
+         collective_drop_recovery_trading_param=CollectiveDropRecoveryTradingParam(-0.03, -0.30, -0.03, +0.005, -0.01),
+         collective_jump_recovery_trading_param=None),
+     algo.feature.collective_jitter.research.get_dfst_feature),
+]
+
+
+def _is_same(df_expected, df):
+    return df_expected.index.equals(df.index) and list(df_expected.columns) == list(df.columns) and \
+        np.allclose(df_expected.to_numpy(dtype=np.float64), df.to_numpy(dtype=np.float64), equal_nan=True)
+
+
+def check_fused(df, alpha_name, research, trading_param, get_dfst_feature_func) -> bool:
+    dfst_trading_expected = research.get_dfst_trading(get_dfst_feature_func(df, trading_param.feature_param), trading_param)
+    _, dfst_trading = research.get_dfst_feature_trading(df, trading_param)
+    return _is_same(dfst_trading_expected, dfst_trading)
+
+
+def check_sparse(df, alpha_name, research, trading_param, get_dfst_feature_func) -> bool:
+    dfst_feature = get_dfst_feature_func(df, trading_param.feature_param)
+    dfst_trading_expected = research.get_dfst_trading(dfst_feature, trading_param)
+    dfst_trading_sparse = research.get_dfst_trading_sparse(dfst_feature, trading_param)
+    return _is_same(dfst_trading_expected, algo.alpha.util.sparse.get_dense_trading(dfst_feature, dfst_trading_sparse))
+
+
+def main():
+    df = get_df_jumps(['BTC-USDT-SWAP', 'ETH-USDT-SWAP', 'XRP-USDT-SWAP'])
+    results = {}
+    for alpha_name, research, trading_param, get_dfst_feature_func in _fused_cases:
+        try:
+            results[f'{alpha_name} (fused)'] = check_fused(df, alpha_name, research, trading_param, get_dfst_feature_func)
+        except Exception:
+            traceback.print_exc()
+            results[f'{alpha_name} (fused)'] = False
+    for alpha_name, research, trading_param, get_dfst_feature_func in _sparse_cases:
+        try:
+            results[f'{alpha_name} (sparse)'] = check_sparse(df, alpha_name, research, trading_param, get_dfst_feature_func)
+        except Exception:
+            traceback.print_exc()
+            results[f'{alpha_name} (sparse)'] = False
+
+    for name, is_same in results.items():
+        print(f'{name}: {"ok" if is_same else "mismatch"}')
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())